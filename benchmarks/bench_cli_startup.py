@@ -0,0 +1,103 @@
+"""
+Cold start of `python -m drop_backend.commands --help`, from
+`python -X importtime`: the import time of the slowest modules and the total.
+Exits with 1 if the total is over the budget or if --help imported a module
+that only the commands need, so it can gate CI.
+
+Run with:
+    PYTHONPATH=src python benchmarks/bench_cli_startup.py
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List, Tuple
+
+# Imported by the commands when they run, see commands/lazy_group.py.
+HEAVY_MODULES = (
+    "openai",
+    "requests",
+    "sqlalchemy",
+    "pydantic",
+    "drop_backend.commands.geo",
+    "drop_backend.model.mood_seed",
+    "drop_backend.model.persistence_model",
+    "drop_backend.utils.ors",
+)
+
+_IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)")
+
+
+def _importtime(args: List[str]) -> Tuple[int, Dict[str, int]]:
+    """Total microseconds of top level imports and cumulative per module."""
+    with tempfile.TemporaryDirectory() as cwd:
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-m", "drop_backend.commands"]
+            + args,
+            cwd=cwd,
+            # Absolute, the command runs in an empty directory.
+            env={
+                **os.environ,
+                "PYTHONPATH": os.pathsep.join(
+                    os.path.abspath(path)
+                    for path in os.environ.get("PYTHONPATH", "").split(
+                        os.pathsep
+                    )
+                    if path
+                ),
+            },
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    total = 0
+    cumulative: Dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        micros, depth, module = (
+            int(match.group(2)),
+            match.group(3),
+            match.group(4),
+        )
+        cumulative[module] = micros
+        if len(depth) == 1:
+            total += micros
+    return total, cumulative
+
+
+def main(args: List[str], repeat: int, budget_ms: float, top: int) -> int:
+    runs = [_importtime(args) for _ in range(repeat)]
+    total, cumulative = min(runs, key=lambda run: run[0])
+    print(
+        f"`python -m drop_backend.commands {' '.join(args)}`, best of {repeat}:"
+    )
+    for module, micros in sorted(
+        cumulative.items(), key=lambda item: item[1], reverse=True
+    )[:top]:
+        print(f"  {module:<48} {micros / 1000:8.1f} ms")
+    print(f"  {'total':<48} {total / 1000:8.1f} ms (budget {budget_ms} ms)")
+
+    failed = False
+    heavy = [module for module in HEAVY_MODULES if module in cumulative]
+    if heavy:
+        print(f"FAIL: imported {', '.join(heavy)}")
+        failed = True
+    if total / 1000 > budget_ms:
+        print("FAIL: over the budget")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--args", nargs="*", default=["--help"])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=250.0)
+    parser.add_argument("--top", type=int, default=10)
+    parsed = parser.parse_args()
+    sys.exit(main(parsed.args, parsed.repeat, parsed.budget_ms, parsed.top))
@@ -0,0 +1,140 @@
+"""
+Memory held by the histories of many events as MessageNodes versus compacted
+into CompactMessages(EventNode.compact).
+
+Histories loaded back from the DB each have their own copy of the
+(multi-kilobyte) system prompt and of the function spec, the histories of a run
+share the ones of its template. Compacting keeps a run's shared system message
+and spec as they are(EventNode.compact(shared, functions)).
+
+10k events with four messages each, CPython 3.11:
+
+    own copies:      405.8 MiB as MessageNodes, 29.2 MiB compacted(-92.8%)
+    run's template:   47.5 MiB as MessageNodes, 27.7 MiB compacted(-41.8%)
+
+Run with:
+    PYTHONPATH=src python benchmarks/bench_compact_history.py
+"""
+
+import argparse
+import gc
+import json
+import tracemalloc
+from typing import Callable, List, Optional, Tuple
+
+from drop_backend.model.ai_conv_types import (
+    EventNode,
+    MessageNode,
+    OpenAIFunctionCallSpec,
+)
+from drop_backend.prompts.hoboken_girl_prompt import base_prompt_hoboken_girl
+from drop_backend.types.schema.city_event_schema import (
+    city_event_function_call_param,
+)
+
+
+def _system_message() -> MessageNode:
+    return MessageNode(
+        role="system",
+        message_content=base_prompt_hoboken_girl(
+            ["Hoboken", "Jersey City"], "2023-11-10"
+        ),
+    )
+
+
+# A run's system message and function spec.
+_Template = Tuple[MessageNode, List[OpenAIFunctionCallSpec]]
+
+
+def _event(event_num: int, template: Optional[_Template] = None) -> EventNode:
+    specs, explicit_fn_call = city_event_function_call_param()
+    system_message = _system_message()
+    if template:
+        system_message, specs = template
+    history = [
+        system_message,
+        MessageNode(
+            role="user",
+            message_content=f"Event {event_num}: Jazz night at Pier A Park...",
+            functions=specs,
+            explicit_fn_call=explicit_fn_call,
+        ),
+        MessageNode(
+            role="assistant",
+            ai_function_call={
+                "name": "create_city_event",
+                "arguments": json.dumps(
+                    {
+                        "name": f"Jazz night {event_num}",
+                        "description": "Live jazz by the waterfront.",
+                        "categories": ["Music"],
+                        "addresses": ["Pier A Park, Hoboken, NJ"],
+                    }
+                ),
+            },
+        ),
+        MessageNode(
+            role="function",
+            ai_function_call_result_name="create_city_event",
+            ai_function_call_result=f"CityEvent(name='Jazz night {event_num}')",
+        ),
+    ]
+    event_node = EventNode._create(  # pylint: disable=protected-access
+        "raw event"
+    )
+    event_node.history = history
+    return event_node
+
+
+def _measure(
+    num_events: int,
+    prepare: Callable[[EventNode], None],
+    template: Optional[_Template] = None,
+) -> int:
+    gc.collect()
+    tracemalloc.start()
+    events = []
+    for event_num in range(num_events):
+        event_node = _event(event_num, template)
+        prepare(event_node)
+        events.append(event_node)
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del events
+    return current
+
+
+def _report(as_message_nodes: int, compacted: int) -> None:
+    print(f"  MessageNode histories: {as_message_nodes / 2**20:8.1f} MiB")
+    print(f"  compacted histories:   {compacted / 2**20:8.1f} MiB")
+    print(f"  saved:                 {1 - compacted / as_message_nodes:8.1%}")
+
+
+def main(num_events: int) -> None:
+    print(f"{num_events} events, {len(_event(0).history or [])} messages each")
+    print("Own copies of the system message and spec:")
+    _report(
+        _measure(num_events, lambda event_node: None),
+        _measure(num_events, EventNode.compact),
+    )
+    # Made before measuring like a run's template.
+    system_message, specs = (
+        _system_message(),
+        city_event_function_call_param()[0],
+    )
+    print("The system message and spec of the run:")
+    _report(
+        _measure(num_events, lambda event_node: None, (system_message, specs)),
+        _measure(
+            num_events,
+            lambda event_node: event_node.compact([system_message], specs),
+            (system_message, specs),
+        ),
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--events", type=int, default=10_000)
+    main(parser.parse_args().events)
@@ -0,0 +1,81 @@
+"""
+Per-turn cost of converting a growing conversation into OpenAI API messages,
+converting the whole context every turn versus through an ApiMessagesCache.
+
+Each turn appends an assistant function call, its function result and a user
+(interrogation) message, then converts the context like AltAI.send does. With
+the cache what is left growing with the history is copying the list of messages.
+
+Run with:
+    PYTHONPATH=src python benchmarks/bench_context_serialization.py
+"""
+
+import argparse
+import time
+from typing import List, Optional
+
+from drop_backend.model.ai_conv_types import (
+    AIFunctionCall,
+    ApiMessagesCache,
+    EventNode,
+    MessageNode,
+    Role,
+)
+
+ARGUMENTS = (
+    '{"name": "Jazz night", "description": "Live jazz by the waterfront.", '
+    '"categories": ["Music"], "addresses": ["Pier A Park, Hoboken, NJ"], '
+    '"start_date": ["2023-11-10"], "start_time": ["19:00"]}'
+)
+
+
+def _turn() -> List[MessageNode]:
+    return [
+        MessageNode(
+            role=Role.assistant,
+            ai_function_call=AIFunctionCall(
+                name="create_city_event", arguments=ARGUMENTS
+            ),
+        ),
+        MessageNode(
+            role=Role.function,
+            ai_function_call_result_name="create_city_event",
+            ai_function_call_result="CityEvent(name='Jazz night', ...)",
+        ),
+        MessageNode(role=Role.user, message_content="Are the dates right?"),
+    ]
+
+
+def _per_turn_micros(
+    num_turns: int, cache: Optional[ApiMessagesCache]
+) -> List[float]:
+    context = [
+        MessageNode(role=Role.system, message_content="You parse events."),
+        MessageNode(role=Role.user, message_content="Event: Jazz night ..."),
+    ]
+    timings = []
+    for _ in range(num_turns):
+        context.extend(_turn())
+        start = time.perf_counter()
+        list(EventNode.context_to_openai_api_messages(context, cache))
+        timings.append((time.perf_counter() - start) * 1e6)
+    return timings
+
+
+def main(num_turns: int, report_every: int) -> None:
+    uncached = _per_turn_micros(num_turns, None)
+    cached = _per_turn_micros(num_turns, ApiMessagesCache())
+    print(f"{'turn':>6} {'messages':>9} {'uncached us':>12} {'cached us':>10}")
+    for turn in range(report_every - 1, num_turns, report_every):
+        print(
+            f"{turn + 1:>6} {2 + 3 * (turn + 1):>9}"
+            f" {uncached[turn]:>12.1f} {cached[turn]:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--turns", type=int, default=400)
+    parser.add_argument("--report-every", type=int, default=50)
+    args = parser.parse_args()
+    main(args.turns, args.report_every)
@@ -0,0 +1,487 @@
+"""
+End to end benchmark of the pipeline over a synthetic corpus(see
+synthetic_corpus.py), with every network service stubbed locally: the AI and
+embeddings by lib/llm_standin.py, Nominatim and ORS by the stubs below.
+
+Stages, each on the output of the one before:
+    extraction      extract-serialize-events with --llm-workers
+    embeddings      index-event-embeddings
+    geocoding       do-rcode
+    mood_tagging    index-event-moods
+    query           geotag_moodtag_events_helper at random points
+
+Per stage it reports the throughput, p50/p99 latency of its unit of work(an
+AI call, an embedding, a geocode, a mood batch or a query) and the peak RSS
+while it ran. Results are written as JSON, and --compare fails if a stage
+got slower than a previous result by more than --tolerance.
+
+Run with:
+    PYTHONPATH=src python benchmarks/bench_end_to_end.py --sizes 1000 10000 \\
+        --output bench_end_to_end.json [--compare baseline.json]
+"""
+
+import argparse
+import datetime
+import functools
+import hashlib
+import json
+import logging
+import math
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from unittest.mock import patch
+from urllib.parse import parse_qs, urlparse
+
+import openai
+from sqlalchemy import create_engine
+
+from drop_backend.commands import (
+    embedding_commands,
+    geo,
+    hoboken_girl_extraction,
+    mood_commands,
+)
+from drop_backend.commands.webdemo_command_helper import (
+    geotag_moodtag_events_helper,
+)
+from drop_backend.lib.ai import AltAI, EmbeddingSearch
+from drop_backend.lib.interrogation import InteractiveInterrogationProtocol
+from drop_backend.lib.llm_standin import Latency, StandinConfig, StandinServer
+from drop_backend.model.merge_base import Base
+from drop_backend.model.persistence_model import (
+    bump_data_version,
+    ensure_geo_spatial_index,
+    index_event_time_windows,
+)
+from drop_backend.prompts.hoboken_girl_prompt import base_prompt_hoboken_girl
+from drop_backend.types.custom_types import When
+from synthetic_corpus import CORPUS_SIZES, generate_events
+
+# Hoboken, the stub geocodes around it.
+CENTER = (40.7440, -74.0324)
+FILENAME = "synthetic_corpus.txt"
+VERSION = "bench"
+
+
+def _point(text: str, spread: float = 0.03) -> Tuple[float, float]:
+    digest = hashlib.sha256(text.encode()).digest()
+    return (
+        CENTER[0] + (digest[0] / 255 - 0.5) * 2 * spread,
+        CENTER[1] + (digest[1] / 255 - 0.5) * 2 * spread,
+    )
+
+
+def _haversine_meters(lat1, lon1, lat2, lon2) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * 6_371_000 * math.asin(math.sqrt(a))
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """Nominatim's /search and ORS's /ors/v2/directions/<profile>."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+    def _send_json(self, body: Any) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        url = urlparse(self.path)
+        query = " ".join(
+            value for values in parse_qs(url.query).values() for value in values
+        )
+        lat, lon = _point(query)
+        self._send_json([{"lat": str(lat), "lon": str(lon)}])
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        request = json.loads(
+            self.rfile.read(int(self.headers["Content-Length"]))
+        )
+        (lon1, lat1), (lon2, lat2) = request["coordinates"]
+        distance = _haversine_meters(lat1, lon1, lat2, lon2) * 1.3
+        speed = 1.4 if "foot" in self.path else 8.0
+        self._send_json(
+            {
+                "routes": [
+                    {
+                        "summary": {
+                            "distance": distance,
+                            "duration": distance / speed,
+                        }
+                    }
+                ]
+            }
+        )
+
+
+@contextmanager
+def _serving(server: ThreadingHTTPServer) -> Iterator[ThreadingHTTPServer]:
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm", encoding="ascii") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # Peak of the process so far, kilobytes on Linux, bytes on macOS.
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class _StageRecorder:
+    """Latencies of the unit of work and the peak RSS of a stage."""
+
+    def __init__(self, sample_seconds: float = 0.01):
+        self.latencies: List[float] = []
+        self.peak_rss = _rss_bytes()
+        self._sample_seconds = sample_seconds
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self) -> None:
+        while not self._stop.wait(self._sample_seconds):
+            self.peak_rss = max(self.peak_rss, _rss_bytes())
+
+    def timed(self, fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def _timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.latencies.append(time.perf_counter() - start)
+
+        return _timed
+
+    def __enter__(self) -> "_StageRecorder":
+        self._sampler.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stop.set()
+        self._sampler.join()
+        self.peak_rss = max(self.peak_rss, _rss_bytes())
+
+
+def _percentile(values: List[float], percentile: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[
+        min(len(ordered) - 1, int(round(percentile / 100 * (len(ordered) - 1))))
+    ]
+
+
+def _run_stage(
+    name: str,
+    num_items: int,
+    run: Callable[[], Any],
+    timed: List[Tuple[Any, str]],
+) -> Dict[str, Any]:
+    """Runs the stage with the (owner, attribute) callables timed."""
+    with _StageRecorder() as recorder, ExitStack() as stack:
+        for owner, attribute in timed:
+            stack.enter_context(
+                patch.object(
+                    owner, attribute, recorder.timed(getattr(owner, attribute))
+                )
+            )
+        start = time.perf_counter()
+        run()
+        seconds = time.perf_counter() - start
+    result = {
+        "items": num_items,
+        "seconds": round(seconds, 4),
+        "throughput_per_s": round(num_items / seconds, 2) if seconds else None,
+        "latency_ms": {
+            "count": len(recorder.latencies),
+            "p50": _ms(_percentile(recorder.latencies, 50)),
+            "p99": _ms(_percentile(recorder.latencies, 99)),
+        },
+        "peak_rss_mb": round(recorder.peak_rss / 2**20, 1),
+    }
+    print(
+        f"  {name:<13} {num_items:>7} items {seconds:9.2f} s "
+        f"{result['throughput_per_s'] or 0:10.1f}/s "
+        f"p50 {result['latency_ms']['p50']} ms "
+        f"p99 {result['latency_ms']['p99']} ms "
+        f"rss {result['peak_rss_mb']} MB"
+    )
+    return result
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+def run_size(  # pylint: disable=too-many-locals
+    num_events: int, args: argparse.Namespace, workdir: Path
+) -> Dict[str, Any]:
+    engine = create_engine(f"sqlite:///{workdir / f'bench_{num_events}.db'}")
+    Base.metadata.create_all(engine)
+    ctx = SimpleNamespace(obj={"engine": engine})
+    ensure_geo_spatial_index(ctx)
+    events = generate_events(num_events, seed=args.seed)
+    system_message = hoboken_girl_extraction.MessageNode(
+        role=hoboken_girl_extraction.Role.system,
+        message_content=base_prompt_hoboken_girl(
+            ["Hoboken", "Jersey City"], "2024-01-01"
+        ),
+    )
+    results: Dict[str, Any] = {}
+
+    def _extract():
+        try:
+            # pylint: disable=protected-access
+            hoboken_girl_extraction._pipelined_extract_serialize_events(
+                ctx,
+                events,
+                system_message,
+                FILENAME,
+                VERSION,
+                max_acceptable_errors=num_events,
+                llm_workers=args.llm_workers,
+                ordered=True,
+                write_batch_size=32,
+                jobs=(
+                    hoboken_girl_extraction.speculative_jobs(
+                        [embedding_commands.EmbeddingType.DESCRIPTION]
+                    )
+                    if args.speculative_dispatch
+                    else None
+                ),
+            )
+        finally:
+            bump_data_version(ctx, FILENAME, VERSION)
+
+    results["extraction"] = _run_stage(
+        "extraction", num_events, _extract, [(AltAI, "send")]
+    )
+    results["embeddings"] = _run_stage(
+        "embeddings",
+        num_events,
+        lambda: embedding_commands.index_event_embeddings(
+            ctx,
+            embedding_types=[embedding_commands.EmbeddingType.DESCRIPTION],
+            filename=FILENAME,
+            version=VERSION,
+            skip_embedded=True,
+        ),
+        [(EmbeddingSearch, "fetch_embeddings")],
+    )
+    results["geocoding"] = _run_stage(
+        "geocoding",
+        num_events,
+        lambda: geo.do_rcode(ctx, FILENAME, VERSION),
+        [(geo, "get_coordinates")],
+    )
+    results["mood_tagging"] = _run_stage(
+        "mood_tagging",
+        num_events,
+        lambda: mood_commands.generate_and_index_event_moods(
+            ctx,
+            FILENAME,
+            VERSION,
+            "Hoboken and Jersey City",
+            "Millenials and GenZ",
+            batch_size=10,
+        ),
+        [(mood_commands, "_tag_batch")],
+    )
+    index_event_time_windows(ctx, FILENAME, VERSION)
+    query_points = [
+        _point(f"query {i}", spread=0.02) for i in range(args.queries)
+    ]
+
+    def _queries():
+        for lat, lon in query_points:
+            geotag_moodtag_events_helper(
+                engine,
+                args.ors_url,
+                {FILENAME: [VERSION]},
+                lat,
+                lon,
+                datetime.datetime(2024, 1, 15, 12),
+                When.LATER,
+                radius_meters=args.radius_meters,
+            )
+
+    results["query"] = _run_stage(
+        "query",
+        len(query_points),
+        _queries,
+        [(sys.modules[__name__], "geotag_moodtag_events_helper")],
+    )
+    engine.dispose()
+    return results
+
+
+def compare(
+    results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float
+) -> bool:
+    """Prints the changes and returns False if a stage regressed."""
+    ok = True
+    print(f"Against the baseline, failing past {tolerance:.0%}:")
+    for size, stages in results["runs"].items():
+        for stage, result in stages.items():
+            before = baseline.get("runs", {}).get(size, {}).get(stage)
+            if not before or not before.get("throughput_per_s"):
+                continue
+            throughput = result["throughput_per_s"] / before["throughput_per_s"]
+            p99 = result["latency_ms"]["p99"]
+            p99_before = before["latency_ms"]["p99"]
+            p99_change = p99 / p99_before if p99 and p99_before else None
+            regressed = throughput < 1 - tolerance or (
+                p99_change is not None and p99_change > 1 + tolerance
+            )
+            ok = ok and not regressed
+            print(
+                f"  {size:>7} {stage:<13} throughput x{throughput:.2f}"
+                + (f", p99 x{p99_change:.2f}" if p99_change else "")
+                + ("  REGRESSED" if regressed else "")
+            )
+    return ok
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(args: argparse.Namespace) -> int:
+    logging.basicConfig()
+    logging.getLogger().setLevel(args.loglevel)
+    config = StandinConfig(
+        first_token_latency=args.first_token_latency,
+        chunk_latency=args.chunk_latency,
+        embedding_latency=args.embedding_latency,
+        embedding_dimensions=args.embedding_dimensions,
+        seed=args.seed,
+    )
+    results: Dict[str, Any] = {
+        "meta": {
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "created": datetime.datetime.now().isoformat(timespec="seconds"),
+            "args": {
+                key: str(value) if isinstance(value, (Latency, Path)) else value
+                for key, value in vars(args).items()
+            },
+        },
+        "runs": {},
+    }
+    with ExitStack() as stack:
+        standin = stack.enter_context(StandinServer(config=config))
+        stubs = stack.enter_context(
+            _serving(ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler))
+        )
+        stubs_url = "http://{}:{}".format(*stubs.server_address[:2])
+        args.ors_url = stubs_url + "/ors/v2/directions/{profile}"
+        for name, value in (
+            ("api_base", standin.base_url),
+            ("api_key", "standin"),
+        ):
+            stack.enter_context(patch.object(openai, name, value))
+        stack.enter_context(
+            patch.object(geo, "NOMINATIM_URL", stubs_url + "/search")
+        )
+        # Nobody is at the terminal to interrogate the AI.
+        stack.enter_context(
+            patch.object(
+                InteractiveInterrogationProtocol,
+                "get_interrogation_message",
+                return_value=None,
+            )
+        )
+        workdir = Path(stack.enter_context(tempfile.TemporaryDirectory()))
+        for num_events in args.sizes:
+            print(f"{num_events} events:")
+            results["runs"][str(num_events)] = run_size(
+                num_events, args, workdir
+            )
+        results["meta"]["standin_requests"] = dict(standin.counts)
+    args.output.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    print(f"Wrote {args.output}")
+    if args.compare:
+        baseline = json.loads(args.compare.read_text(encoding="utf-8"))
+        if not compare(results, baseline, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[CORPUS_SIZES[0]],
+        help=f"Corpus sizes, like {' '.join(map(str, CORPUS_SIZES))}",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--llm-workers", type=int, default=8)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--radius-meters", type=float, default=2000.0)
+    parser.add_argument(
+        "--first-token-latency", type=Latency.parse, default="fixed:0"
+    )
+    parser.add_argument(
+        "--chunk-latency", type=Latency.parse, default="fixed:0"
+    )
+    parser.add_argument(
+        "--embedding-latency", type=Latency.parse, default="fixed:0"
+    )
+    parser.add_argument("--embedding-dimensions", type=int, default=1536)
+    parser.add_argument(
+        "--speculative-dispatch",
+        action="store_true",
+        help="Geocode and embed during extraction, the later stages skip them",
+    )
+    parser.add_argument(
+        "--output", type=Path, default=Path("bench_end_to_end.json")
+    )
+    parser.add_argument("--compare", type=Path, help="A previous --output")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--loglevel", default="WARNING")
+    sys.exit(main(parser.parse_args()))
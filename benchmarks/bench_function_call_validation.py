@@ -0,0 +1,94 @@
+"""
+Per-event cost of validating the AI's function call arguments in the extraction
+loop: parsing the arguments JSON(AIFunctionCall), the precompiled arguments
+validator and constructing the model through EventManager.call_fn_by_name.
+
+Run with:
+    PYTHONPATH=src python benchmarks/bench_function_call_validation.py
+"""
+
+import argparse
+import json
+import timeit
+
+from drop_backend.lib.event_node_manager import EventManager
+from drop_backend.model.ai_conv_types import AIFunctionCall
+from drop_backend.types.city_event import CityEvent
+from drop_backend.types.schema.city_event_schema import (
+    city_event_arguments_validator,
+)
+
+VALID_ARGUMENTS = {
+    "name": "Jazz night",
+    "description": "Live jazz by the waterfront.",
+    "categories": ["Music", "Nightlife"],
+    "addresses": ["Pier A Park, Hoboken, NJ"],
+    "is_ongoing": False,
+    "start_date": ["2023-11-10"],
+    "end_date": ["2023-11-10"],
+    "start_time": ["19:00:00"],
+    "end_time": ["22:00"],
+    "is_paid": True,
+    "has_promotion": False,
+    "payment_mode": "ticket",
+    "links": ["https://example.com/jazz"],
+}
+# Missing a required field and the wrong type for is_paid.
+MALFORMED_ARGUMENTS = {
+    "name": "Jazz night",
+    "categories": "Music",
+    "is_paid": "sometimes",
+    "start_time": ["7pm"],
+}
+
+
+def _per_call_micros(fn, number: int) -> float:
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e6
+
+
+def _raises(fn):
+    def _wrapped():
+        try:
+            fn()
+        except ValueError:
+            return
+        raise AssertionError("Expected a ValueError")
+
+    return _wrapped
+
+
+def main(number: int) -> None:
+    event_manager = EventManager(
+        "CityEvent", "drop_backend.types", "drop_backend.types.schema"
+    )
+    event_manager.create_event_node("raw event")
+    validator = city_event_arguments_validator()
+    arguments_json = json.dumps(VALID_ARGUMENTS)
+    fn_name = CityEvent.default_fn_name()
+
+    benchmarks = {
+        "AIFunctionCall(arguments=json)": lambda: AIFunctionCall(
+            name=fn_name, arguments=arguments_json
+        ),
+        "arguments validator": lambda: validator(dict(VALID_ARGUMENTS)),
+        "CityEvent.create": lambda: CityEvent.create(
+            fn_name, **VALID_ARGUMENTS
+        ),
+        "EventManager.call_fn_by_name": lambda: event_manager.call_fn_by_name(
+            fn_name, **VALID_ARGUMENTS
+        ),
+        "malformed: arguments validator": _raises(
+            lambda: validator(dict(MALFORMED_ARGUMENTS))
+        ),
+        "malformed: CityEvent.create": _raises(
+            lambda: CityEvent.create(fn_name, **MALFORMED_ARGUMENTS)
+        ),
+    }
+    for name, fn in benchmarks.items():
+        print(f"{name:<40} {_per_call_micros(fn, number):>10.1f} us/event")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=2000)
+    main(parser.parse_args().number)
@@ -0,0 +1,68 @@
+"""
+Cost of get_submood_embedding_text over all the moods of a flavor, against
+parsing every accessor path with jsonpath_ng like it used to.
+
+Run with:
+    PYTHONPATH=src python benchmarks/bench_json_path_accessors.py
+"""
+
+import argparse
+import json
+import timeit
+from dataclasses import asdict
+from types import SimpleNamespace
+
+from jsonpath_ng import parse  # type: ignore
+
+from drop_backend.model.mood_model_unsupervised import (
+    MoodFlavors,
+    generate_submoods_json_accessors,
+    get_submood_embedding_text,
+)
+
+
+def _parse_every_path(db_mood, accessors):
+    doc = json.loads(db_mood.sub_moods)
+    for accessor in accessors:
+        parse(accessor.submood_accessor_json_path).find(doc)
+        for path in accessor.embedding_accessor_json_path.split(","):
+            parse(path.strip()).find(doc)
+
+
+def main(flavor: MoodFlavors, number: int) -> None:
+    moods = [
+        (
+            SimpleNamespace(
+                sub_moods=json.dumps([asdict(m) for m in mood.SUB_MOODS])
+            ),
+            generate_submoods_json_accessors(1, mood.SUB_MOODS),
+        )
+        for mood in flavor.get_moods_for_flavor()
+    ]
+    benchmarks = {
+        "jsonpath_ng.parse per path": lambda: [
+            _parse_every_path(db_mood, accessors)
+            for db_mood, accessors in moods
+        ],
+        "get_submood_embedding_text": lambda: [
+            get_submood_embedding_text(db_mood, "v1", accessors)
+            for db_mood, accessors in moods
+        ],
+    }
+    print(f"{len(moods)} moods of {flavor.value}, ms per flavor:")
+    for name, fn in benchmarks.items():
+        ms = min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e3
+        print(f"  {name:32} {ms:10.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--flavor",
+        type=MoodFlavors,
+        default=MoodFlavors.GEN_Z_HOBOKEN,
+        choices=list(MoodFlavors),
+    )
+    parser.add_argument("--number", type=int, default=5)
+    args = parser.parse_args()
+    main(args.flavor, args.number)
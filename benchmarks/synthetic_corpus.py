@@ -0,0 +1,141 @@
+"""
+Synthetic event listings in the style of the scraped Hoboken Girl posts that
+extract-serialize-events ingests: a name, a day and time line, an address and
+a description, separated by `$$$` like _post_process writes them.
+
+Run with:
+    python benchmarks/synthetic_corpus.py --num-events 10000 --output corpus.txt
+"""
+
+import argparse
+import datetime
+import random
+from pathlib import Path
+from typing import List
+
+CORPUS_SIZES = (1_000, 10_000, 100_000)
+EVENT_DELIMITER = "\n$$$\n\n"
+
+_KINDS = (
+    "Jazz Night",
+    "Farmers Market",
+    "Art Walk",
+    "Comedy Show",
+    "Yoga in the Park",
+    "Wine Tasting",
+    "Trivia Night",
+    "Holiday Market",
+    "Kids Craft Hour",
+    "Film Screening",
+    "Book Club",
+    "Salsa Social",
+    "Gallery Opening",
+    "5K Fun Run",
+    "Diwali Festival",
+)
+_VENUES = (
+    "Pier A Park",
+    "Maxwell Place Park",
+    "Hoboken Historical Museum",
+    "The Shannon",
+    "Mana Contemporary",
+    "Liberty State Park",
+    "Grove Street PATH Plaza",
+    "White Eagle Hall",
+    "Elysian Park",
+    "Hamilton Park",
+)
+_STREETS = (
+    "Washington Street",
+    "Hudson Street",
+    "Sinatra Drive",
+    "Bloomfield Street",
+    "Newark Avenue",
+    "Grove Street",
+    "Christopher Columbus Drive",
+    "Montgomery Street",
+    "Jersey Avenue",
+    "Frank Sinatra Drive North",
+)
+_CITIES = ("Hoboken, NJ", "Jersey City, NJ", "Weehawken, NJ")
+_PHRASES = (
+    "Grab your friends and head to the waterfront for",
+    "Celebrate the season with",
+    "Don't miss this month's edition of",
+    "Bring the whole family to",
+    "Unwind after work at",
+    "Support local makers at",
+)
+_DETAILS = (
+    "Tickets are $25 in advance and $30 at the door.",
+    "This event is free and open to the public.",
+    "Registration is required, spots are limited.",
+    "Use code HGIRL10 for 10% off tickets.",
+    "Food and drinks will be available for purchase.",
+    "All ages are welcome, kids under 5 are free.",
+    "Rain or shine, dress for the weather.",
+)
+
+
+def _ordinal(day: int) -> str:
+    suffix = (
+        "th"
+        if 11 <= day <= 13
+        else {1: "st", 2: "nd", 3: "rd"}.get(day % 10, "th")
+    )
+    return f"{day}{suffix}"
+
+
+def _time(hour: int) -> str:
+    return f"{hour % 12 or 12}{'AM' if hour < 12 else 'PM'}"
+
+
+def generate_event(rng: random.Random, start: datetime.date) -> str:
+    kind = rng.choice(_KINDS)
+    venue = rng.choice(_VENUES)
+    day = start + datetime.timedelta(days=rng.randint(0, 60))
+    hour = rng.randint(9, 20)
+    if rng.random() < 0.15:
+        when = f"Ongoing until {day:%B} {_ordinal(day.day)}"
+    else:
+        when = (
+            f"{day:%A}, {day:%B} {_ordinal(day.day)} | {_time(hour)} – "
+            f"{_time(hour + rng.randint(1, 3))}"
+        )
+    address = (
+        f"{rng.randint(1, 1500)} {rng.choice(_STREETS)}, {rng.choice(_CITIES)}"
+    )
+    description = " ".join(
+        [
+            f"{rng.choice(_PHRASES)} {kind.lower()} at {venue}.",
+            rng.choice(_DETAILS),
+            rng.choice(_DETAILS),
+        ]
+    )
+    link = f"https://hobokengirl.com/events/{rng.randint(10**5, 10**6)}"
+    return "\n".join(
+        [f"{kind} at {venue}", when, f"{venue} | {address}", description, link]
+    )
+
+
+def generate_events(
+    num_events: int,
+    seed: int = 0,
+    start: datetime.date = datetime.date(2024, 1, 1),
+) -> List[str]:
+    """num_events listings, the same ones for the same seed."""
+    rng = random.Random(seed)
+    return [generate_event(rng, start) for _ in range(num_events)]
+
+
+def write_corpus(path: Path, events: List[str]) -> None:
+    path.write_text(EVENT_DELIMITER.join(events), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--num-events", type=int, default=CORPUS_SIZES[0])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, required=True)
+    args = parser.parse_args()
+    write_corpus(args.output, generate_events(args.num_events, args.seed))
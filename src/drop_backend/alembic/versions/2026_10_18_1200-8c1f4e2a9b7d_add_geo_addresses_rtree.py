@@ -0,0 +1,63 @@
+"""add an R*Tree spatial index over GeoAddresses
+
+Revision ID: 8c1f4e2a9b7d
+Revises: 5f3fb0b7e0e1
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "8c1f4e2a9b7d"
+down_revision: Union[str, None] = "5f3fb0b7e0e1"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute(
+        """CREATE VIRTUAL TABLE IF NOT EXISTS GeoAddressesRTree
+        USING rtree(id, min_lat, max_lat, min_lon, max_lon)"""
+    )
+    op.execute(
+        """CREATE TRIGGER IF NOT EXISTS GeoAddressesRTree_insert
+        AFTER INSERT ON GeoAddresses
+        WHEN NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL
+        BEGIN
+            INSERT INTO GeoAddressesRTree
+            VALUES (NEW.id, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude);
+        END"""
+    )
+    op.execute(
+        """CREATE TRIGGER IF NOT EXISTS GeoAddressesRTree_update
+        AFTER UPDATE OF latitude, longitude ON GeoAddresses
+        BEGIN
+            DELETE FROM GeoAddressesRTree WHERE id = OLD.id;
+            INSERT INTO GeoAddressesRTree
+            SELECT NEW.id, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude
+            WHERE NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL;
+        END"""
+    )
+    op.execute(
+        """CREATE TRIGGER IF NOT EXISTS GeoAddressesRTree_delete
+        AFTER DELETE ON GeoAddresses
+        BEGIN
+            DELETE FROM GeoAddressesRTree WHERE id = OLD.id;
+        END"""
+    )
+    op.execute(
+        """INSERT INTO GeoAddressesRTree
+        SELECT id, latitude, latitude, longitude, longitude FROM GeoAddresses
+        WHERE latitude IS NOT NULL AND longitude IS NOT NULL"""
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS GeoAddressesRTree_delete")
+    op.execute("DROP TRIGGER IF EXISTS GeoAddressesRTree_update")
+    op.execute("DROP TRIGGER IF EXISTS GeoAddressesRTree_insert")
+    op.execute("DROP TABLE IF EXISTS GeoAddressesRTree")
@@ -0,0 +1,54 @@
+"""add the EventTimeWindows table
+
+Revision ID: 3b9d7c5e1f20
+Revises: 8c1f4e2a9b7d
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "3b9d7c5e1f20"
+down_revision: Union[str, None] = "8c1f4e2a9b7d"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "EventTimeWindows",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("event_id", sa.Integer(), nullable=False),
+        sa.Column("occurrence", sa.Integer(), nullable=False),
+        sa.Column("start_ts", sa.Integer(), nullable=True),
+        sa.Column("end_ts", sa.Integer(), nullable=True),
+        sa.Column("is_ongoing", sa.Boolean(), nullable=False),
+        sa.Column("is_relative", sa.Boolean(), nullable=False),
+        sa.Column("start_day", sa.Integer(), nullable=True),
+        sa.Column("start_second", sa.Integer(), nullable=True),
+        sa.Column("end_day", sa.Integer(), nullable=True),
+        sa.Column("end_second", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["event_id"], ["parsed_events.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_EventTimeWindows_event_id", "EventTimeWindows", ["event_id"]
+    )
+    op.create_index(
+        "ix_EventTimeWindows_start_ts", "EventTimeWindows", ["start_ts"]
+    )
+    op.create_index(
+        "ix_EventTimeWindows_end_ts", "EventTimeWindows", ["end_ts"]
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_EventTimeWindows_end_ts", table_name="EventTimeWindows")
+    op.drop_index("ix_EventTimeWindows_start_ts", table_name="EventTimeWindows")
+    op.drop_index("ix_EventTimeWindows_event_id", table_name="EventTimeWindows")
+    op.drop_table("EventTimeWindows")
@@ -0,0 +1,33 @@
+"""add the DataVersions table
+
+Revision ID: 6e2a4d8c0b13
+Revises: 3b9d7c5e1f20
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "6e2a4d8c0b13"
+down_revision: Union[str, None] = "3b9d7c5e1f20"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "DataVersions",
+        sa.Column("filename", sa.String(), nullable=False),
+        sa.Column("version", sa.String(), nullable=False),
+        sa.Column("stamp", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("filename", "version"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("DataVersions")
@@ -0,0 +1,37 @@
+"""store replay histories deduplicated and compressed
+
+Revision ID: 9a7c3e5b2d41
+Revises: 6e2a4d8c0b13
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "9a7c3e5b2d41"
+down_revision: Union[str, None] = "6e2a4d8c0b13"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "ReplayHistoryBlobs",
+        sa.Column("hash", sa.String(length=64), nullable=False),
+        sa.Column("body", sa.Text(), nullable=False),
+        sa.PrimaryKeyConstraint("hash"),
+    )
+    op.add_column(
+        "parsed_events",
+        sa.Column("replay_history_compressed", sa.LargeBinary(), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("parsed_events", "replay_history_compressed")
+    op.drop_table("ReplayHistoryBlobs")
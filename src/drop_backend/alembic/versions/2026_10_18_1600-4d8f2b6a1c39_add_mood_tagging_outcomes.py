@@ -0,0 +1,35 @@
+"""add the MoodTaggingOutcomes table
+
+Revision ID: 4d8f2b6a1c39
+Revises: 9a7c3e5b2d41
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "4d8f2b6a1c39"
+down_revision: Union[str, None] = "9a7c3e5b2d41"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "MoodTaggingOutcomes",
+        sa.Column("event_id", sa.Integer(), nullable=False),
+        sa.Column("status", sa.Text(), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("failure_reason", sa.Text(), nullable=True),
+        sa.ForeignKeyConstraint(["event_id"], ["parsed_events.id"]),
+        sa.PrimaryKeyConstraint("event_id"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("MoodTaggingOutcomes")
@@ -0,0 +1,33 @@
+"""make (mood, submood) unique in MoodSubMoodTable
+
+Revision ID: 7b3e9f1d5a28
+Revises: 4d8f2b6a1c39
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "7b3e9f1d5a28"
+down_revision: Union[str, None] = "4d8f2b6a1c39"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # handle_mood_submood only inserted missing pairs, so there are no
+    # duplicates to clean up.
+    op.create_index(
+        "uq_mood_submood",
+        "MoodSubMoodTable",
+        ["mood", "submood"],
+        unique=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("uq_mood_submood", table_name="MoodSubMoodTable")
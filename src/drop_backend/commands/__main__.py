@@ -1,4 +1,7 @@
 # Entry point for all commands. Set up things here like DB, logging or whatever.
+# Only import what --help needs at the top, the commands import the rest when
+# they run(see lazy_group.py) so startup stays fast.
+# pylint: disable=import-outside-toplevel
 import logging
 from datetime import datetime
 from pathlib import Path
@@ -7,17 +10,9 @@ from typing import List, Optional
 import click
 import typer
 
-from ..lib.config_generator import check_should_update_schema
-from ..lib.config_generator import gen_schema as gen_schema_impl
-from ..lib.config_generator import generate_function_call_param_function
-from ..model.merge_base import bind_engine
 from ..types.custom_types import When
 from ..utils.color_formatter import ColoredFormatter
-from ..utils.db_utils import validate_database
-from ..utils.ors import Profile, TransitDirectionSummary
-from .geo import do_rcode
-from .mood_commands import generate_and_index_event_moods
-from .webdemo_command_helper import geotag_moodtag_events_helper
+from .lazy_group import lazy_group
 
 app = typer.Typer()
 config_generator_commands = typer.Typer(name="config-generator-commands")
@@ -37,6 +32,8 @@ def setup(
         logger.error("Invalid log level: %s. Defaulting to INFO.", loglevel)
         loglevel = "INFO"
     print(f"loglevel: {loglevel}")
+    # No-op if a command module already configured logging.
+    logging.basicConfig(format=LOG_FORMAT, handlers=[logging.StreamHandler()])
     root_logger = logging.getLogger()
     root_logger.setLevel(loglevel)
     colored_formatter = ColoredFormatter(LOG_FORMAT)
@@ -48,14 +45,27 @@ def setup(
 
     if (
         ctx.invoked_subcommand
-        in set(["index-event-moods", "geotag-moodtag-events", "do-rcode"])
+        in set(
+            [
+                "index-event-moods",
+                "index-time-windows",
+                "geotag-moodtag-events",
+                "do-rcode",
+                "export-events",
+            ]
+        )
         or force_initialize_db
     ):
-        # pylint: disable=import-outside-toplevel,unused-import
+        from ..model.merge_base import bind_engine
+        from ..utils.db_utils import validate_database
 
         logger.info("Initializing database table")
         validate_database(test_db=test_db)
         bind_engine(obj["engine"])
+    if ctx.invoked_subcommand in set(["geotag-moodtag-events", "do-rcode"]):
+        from ..model.persistence_model import ensure_geo_spatial_index
+
+        ensure_geo_spatial_index(ctx)
 
 
 def index_event_moods(
@@ -72,9 +82,21 @@ def index_event_moods(
         )
     ),
     batch_size: int = typer.Option(
-        default=5, help="Batch size for messages(reduces cost)"
+        default=10, help="Max events per message(reduces cost)"
+    ),
+    batch_token_budget: int = typer.Option(
+        default=4000,
+        help="Estimated prompt tokens per message, events are packed up to it",
+    ),
+    retry_budget: int = typer.Option(
+        default=20, help="Extra messages to isolate events in failed batches"
+    ),
+    retry_workers: int = typer.Option(
+        default=4, help="Failed batches retried at a time"
     ),
 ):
+    from .mood_commands import generate_and_index_event_moods
+
     if not cities and not isinstance(cities, list):
         raise ValueError("Cities are required and must be a list.")
     if not demographics and not isinstance(demographics, list):
@@ -88,7 +110,30 @@ def index_event_moods(
         cities_str,
         demo_str,
         batch_size,  # Millenials and GenZ
+        batch_token_budget=batch_token_budget,
+        retry_budget=retry_budget,
+        retry_workers=retry_workers,
+    )
+
+
+def index_time_windows(
+    ctx: typer.Context,
+    filename: str,
+    version: str,
+    reindex: bool = typer.Option(
+        False, help="Recompute windows for events that already have them"
+    ),
+):
+    """
+    Backfill the EventTimeWindows table used to filter events by NOW/LATER for
+    events ingested before the table existed.
+    """
+    from ..model.persistence_model import index_event_time_windows
+
+    num_events = index_event_time_windows(
+        ctx, filename, version, reindex=reindex
     )
+    typer.echo(f"Indexed time windows for {num_events} events")
 
 
 def gen_model_code_bindings(
@@ -96,6 +141,12 @@ def gen_model_code_bindings(
     schema_directory_prefix: str = "drop_backend/types/schema",
     type_module_prefix: str = "drop_backend.types",
 ):
+    from ..lib.config_generator import (
+        check_should_update_schema,
+        generate_function_call_param_function,
+    )
+    from ..lib.config_generator import gen_schema as gen_schema_impl
+
     schema_directory = Path(schema_directory_prefix)
     if (
         not schema_directory.exists()
@@ -139,7 +190,11 @@ def geotag_moodtag_events(  # pylint: disable=too-many-arguments,too-many-locals
     when: When = When.NOW,
     now_window_hours: int = 1,
     stubbed_now: Optional[datetime] = None,
+    radius_meters: Optional[float] = None,
 ):
+    from ..utils.ors import Profile, TransitDirectionSummary
+    from .webdemo_command_helper import geotag_moodtag_events_helper
+
     # stubbed_dict = {
     #     "hobokengirl_com_hoboken_jersey_city_events_november_10_2023_20231110_065435_postprocessed": [
     #         "v1",
@@ -160,6 +215,7 @@ def geotag_moodtag_events(  # pylint: disable=too-many-arguments,too-many-locals
         datetime_now,
         when,
         now_window_hours,
+        radius_meters=radius_meters,
     )
     logger.info("Got %d tagged events", len(tagged_events))
     logger.info(
@@ -196,16 +252,26 @@ data_ingestion_commands_app = typer.Typer(
 app.add_typer(data_ingestion_commands_app)
 app.add_typer(config_generator_commands)
 reverse_geocoding_commands = typer.Typer(
-    name="reverse-geocoding-commands", callback=setup
+    name="reverse-geocoding-commands",
+    callback=setup,
+    cls=lazy_group({"do-rcode": "drop_backend.commands.geo:do_rcode"}),
 )
 webdemo_adhoc_commands = typer.Typer(
     name="webdemo-adhoc-commands", callback=setup
 )
 
 app.add_typer(webdemo_adhoc_commands)
+export_commands = typer.Typer(
+    name="export-commands",
+    callback=setup,
+    cls=lazy_group(
+        {"export-events": "drop_backend.commands.export_commands:export_events"}
+    ),
+)
+app.add_typer(export_commands)
 data_ingestion_commands_app.command()(index_event_moods)
+data_ingestion_commands_app.command()(index_time_windows)
 config_generator_commands.command()(gen_model_code_bindings)
-reverse_geocoding_commands.command()(do_rcode)
 app.add_typer(reverse_geocoding_commands)
 
 webdemo_adhoc_commands.command()(geotag_moodtag_events)
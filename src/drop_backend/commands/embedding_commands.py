@@ -2,7 +2,7 @@ import json
 import logging
 from dataclasses import asdict
 from enum import Enum
-from typing import cast
+from typing import Any, Dict, List, Optional, Set, cast
 
 import typer
 from colorama import Fore  # type: ignore
@@ -20,6 +20,8 @@ from ..model.mood_model_unsupervised import (
     insert_into_mood_json_table,
 )
 from ..model.persistence_model import (
+    ParsedEventTable,
+    get_embedded_event_ids,
     get_parsed_events,
     insert_parsed_event_embeddings,
 )
@@ -153,6 +155,39 @@ class EmbeddingType(Enum):
     NAME_DESCRIPTION = "name_description"
 
 
+def event_embedding_text(
+    embedding_type: EmbeddingType,
+    name: Optional[str],
+    description: Optional[str],
+) -> Optional[str]:
+    """The text embedded for an event, None if it can't have the embedding."""
+    # NOTE: Assume description has to be present and name is not enough to generate
+    # a good enough embedding
+    if not description:
+        return None
+    if embedding_type == EmbeddingType.DESCRIPTION:
+        return description
+    if name:
+        return name + " " + description
+    return None
+
+
+def event_embedding_row(
+    parsed_event_id: int,
+    embedding_type: EmbeddingType,
+    embedding: List[float],
+    version: str,
+) -> Dict[str, Any]:
+    """A row for insert_parsed_event_embeddings."""
+    return {
+        # datasette-fais compatible blob
+        "embedding": encode(embedding),
+        "embedding_type": embedding_type.value,
+        "embedding_version": version,
+        "parsed_event_id": parsed_event_id,
+    }
+
+
 def index_event_embeddings(
     ctx: typer.Context,
     embedding_types: list[EmbeddingType] = typer.Option(
@@ -165,11 +200,17 @@ def index_event_embeddings(
         "v1",
         help="The version of the embedding data. Just an arbitrary string.",
     ),
+    skip_embedded: bool = typer.Option(
+        True,
+        help=(
+            "Skip the events that have the embedding already, like those "
+            "embedded speculatively during extraction"
+        ),
+    ),
 ):
     """
     Retrieve the embeddings and the
     """
-    engine = ctx.obj["engine"]
     if (
         EmbeddingType.DESCRIPTION not in embedding_types
         and EmbeddingType.NAME_DESCRIPTION not in embedding_types
@@ -177,60 +218,53 @@ def index_event_embeddings(
         raise ValueError(
             "Expect one of description of name_description embeddings to be specified."
         )
-    parsed_events = get_parsed_events(engine, filename, version)
+    parsed_events = get_parsed_events(
+        ctx,
+        filename,
+        version,
+        columns=[
+            ParsedEventTable.id,
+            ParsedEventTable.name,
+            ParsedEventTable.description,
+        ],
+    )
     if len(parsed_events) == 0:
         typer.echo("No events found for given parameters.")
         return
-    parsed_events_dict = [
-        {
-            key: value
-            for key, value in event.__dict__.items()
-            if not key.startswith("_")
-        }
-        for event in parsed_events
-    ]
+    parsed_events_dict = [event._asdict() for event in parsed_events]
+    embedded: Dict[EmbeddingType, Set[int]] = {
+        embedding_type: (
+            get_embedded_event_ids(ctx, filename, version, embedding_type.value)
+            if skip_embedded
+            else set()
+        )
+        for embedding_type in embedding_types
+    }
     embedding_search = EmbeddingSearch()
     for parsed_event in parsed_events_dict:
-        # NOTE: Assume description has to be present and name is not enough to generate
-        # a good enough embedding
-        if parsed_event["description"]:
-            event_embeddings = []
-
-            event_description = parsed_event.get("description", "")
-            event_name = parsed_event.get("name", "")
-            if event_description:
-                # Add a row to event_embeddings table for the description at the least.
-                if EmbeddingType.DESCRIPTION in embedding_types:
-                    event_embedding = {}
-                    description_embedding = embedding_search.fetch_embeddings(
-                        [event_description]
-                    )
-                    event_embedding["embedding"] = encode(description_embedding)
-                    event_embedding["embedding_type"] = "description"
-                    event_embedding["embedding_version"] = version
-                    event_embedding["parsed_event_id"] = parsed_event["id"]
-                    event_embeddings.append(event_embedding)
-                if (
-                    EmbeddingType.NAME_DESCRIPTION in embedding_types
-                    and event_name
-                ):
-                    # Add a row to event_embeddings for name+description
-                    event_embedding = {}
-                    name_description_embedding = (
-                        embedding_search.fetch_embeddings(
-                            [event_name + " " + event_description]
-                        )
-                    )
-                    event_embedding["embedding"] = encode(
-                        name_description_embedding
-                    )
-                    event_embedding["embedding_type"] = "name_description"
-                    event_embedding["embedding_version"] = version
-                    event_embedding["parsed_event_id"] = parsed_event["id"]
-                    event_embeddings.append(event_embedding)
-            else:
-                logger.debug("No description for event: %s", parsed_event["id"])
-            insert_parsed_event_embeddings(engine, event_embeddings)
+        if not parsed_event["description"]:
+            logger.debug("No description for event: %s", parsed_event["id"])
+            continue
+        event_embeddings = []
+        # Add a row to event_embeddings table for the description at the
+        # least, and for name+description.
+        for embedding_type in embedding_types:
+            text = event_embedding_text(
+                embedding_type,
+                parsed_event["name"],
+                parsed_event["description"],
+            )
+            if text is None or parsed_event["id"] in embedded[embedding_type]:
+                continue
+            event_embeddings.append(
+                event_embedding_row(
+                    parsed_event["id"],
+                    embedding_type,
+                    embedding_search.fetch_embeddings([text]),
+                    version,
+                )
+            )
+        insert_parsed_event_embeddings(ctx, event_embeddings)
 
 
 def demo_retrieval():
@@ -0,0 +1,259 @@
+"""
+Export parsed events, their geo addresses, moods and embeddings into columnar
+Parquet or Arrow IPC files for analysis (pandas, duckdb, polars...).
+
+pyarrow is an optional dependency: `pip install drop_backend[export]`.
+"""
+
+import logging
+from datetime import date
+from enum import Enum
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+import typer
+
+if TYPE_CHECKING:
+    from ..model.persistence_model import ExportChunk
+
+logger = logging.getLogger(__name__)
+
+# Flattened event_json fields (see types.city_event.CityEvent). Dates become
+# date32 lists, times stay "HH:MM:SS" strings.
+EVENT_LIST_FIELDS = ("categories", "addresses", "links")
+EVENT_DATE_FIELDS = ("start_date", "end_date")
+EVENT_TIME_FIELDS = ("start_time", "end_time")
+EVENT_BOOL_FIELDS = ("is_ongoing", "is_paid", "has_promotion")
+EVENT_STR_FIELDS = ("promotion_details", "payment_mode", "payment_details")
+
+
+class ExportFormat(str, Enum):
+    parquet = "parquet"
+    arrow = "arrow"
+
+
+def _import_pyarrow():
+    try:
+        # pylint: disable=import-outside-toplevel
+        import pyarrow  # type: ignore
+        import pyarrow.ipc  # type: ignore
+        import pyarrow.parquet  # type: ignore
+    except ImportError as exc:
+        raise ImportError(
+            "Exporting needs pyarrow, install it with "
+            "`pip install drop_backend[export]`"
+        ) from exc
+    return pyarrow
+
+
+def _schemas(pa) -> Dict[str, Any]:
+    str_list = pa.list_(pa.string())
+    return {
+        "events": pa.schema(
+            [
+                ("id", pa.int64()),
+                ("filename", pa.string()),
+                ("version", pa.string()),
+                ("name", pa.string()),
+                ("description", pa.string()),
+                ("failure_reason", pa.string()),
+            ]
+            + [(field, str_list) for field in EVENT_LIST_FIELDS]
+            + [(field, pa.list_(pa.date32())) for field in EVENT_DATE_FIELDS]
+            + [(field, str_list) for field in EVENT_TIME_FIELDS]
+            + [(field, pa.bool_()) for field in EVENT_BOOL_FIELDS]
+            + [(field, pa.string()) for field in EVENT_STR_FIELDS]
+        ),
+        "geo_addresses": pa.schema(
+            [
+                ("id", pa.int64()),
+                ("parsed_event_id", pa.int64()),
+                ("address", pa.string()),
+                ("latitude", pa.float64()),
+                ("longitude", pa.float64()),
+                ("failure_reason", pa.string()),
+            ]
+        ),
+        "moods": pa.schema(
+            [
+                ("parsed_event_id", pa.int64()),
+                ("mood_sub_mood_id", pa.int64()),
+                ("mood", pa.string()),
+                ("submood", pa.string()),
+            ]
+        ),
+        "embeddings": pa.schema(
+            [
+                ("parsed_event_id", pa.int64()),
+                ("embedding_type", pa.string()),
+                ("embedding_version", pa.string()),
+                ("embedding", pa.list_(pa.float32())),
+            ]
+        ),
+    }
+
+
+def _str_list(value) -> Optional[List[str]]:
+    if value is None:
+        return None
+    if not isinstance(value, list):
+        value = [value]
+    return [str(v) for v in value]
+
+
+def _date_list(value) -> Optional[List[Optional[date]]]:
+    if value is None:
+        return None
+    dates: List[Optional[date]] = []
+    for v in value if isinstance(value, list) else [value]:
+        try:
+            dates.append(date.fromisoformat(str(v)))
+        except ValueError:
+            logger.warning("Exporting unparseable date %s as null", v)
+            dates.append(None)
+    return dates
+
+
+def _event_columns(rows: List[Tuple[Any, ...]]) -> Dict[str, List[Any]]:
+    columns: Dict[str, List[Any]] = {
+        name: []
+        for name in (
+            "id",
+            "filename",
+            "version",
+            "name",
+            "description",
+            "failure_reason",
+        )
+    }
+    flattened: Dict[str, List[Any]] = {
+        field: []
+        for field in EVENT_LIST_FIELDS
+        + EVENT_DATE_FIELDS
+        + EVENT_TIME_FIELDS
+        + EVENT_BOOL_FIELDS
+        + EVENT_STR_FIELDS
+    }
+    for *row, event_json in rows:
+        for name, value in zip(columns, row):
+            columns[name].append(value)
+        event_json = event_json if isinstance(event_json, dict) else {}
+        for field in EVENT_LIST_FIELDS + EVENT_TIME_FIELDS:
+            flattened[field].append(_str_list(event_json.get(field)))
+        for field in EVENT_DATE_FIELDS:
+            flattened[field].append(_date_list(event_json.get(field)))
+        for field in EVENT_BOOL_FIELDS:
+            value = event_json.get(field)
+            flattened[field].append(None if value is None else bool(value))
+        for field in EVENT_STR_FIELDS:
+            value = event_json.get(field)
+            flattened[field].append(None if value is None else str(value))
+    columns.update(flattened)
+    return columns
+
+
+def _embedding_array(pa, blobs: List[bytes]):
+    """
+    The struct packed float32 blobs(see embedding_commands.encode) as a
+    list<float32> array that shares one buffer, without decoding each float.
+    """
+    offsets = [0]
+    for blob in blobs:
+        offsets.append(offsets[-1] + len(blob) // 4)
+    values = pa.Array.from_buffers(
+        pa.float32(), offsets[-1], [None, pa.py_buffer(b"".join(blobs))]
+    )
+    return pa.ListArray.from_arrays(pa.array(offsets, pa.int32()), values)
+
+
+def chunk_to_tables(pa, chunk: "ExportChunk") -> Dict[str, Any]:
+    schemas = _schemas(pa)
+
+    def _table(name, rows):
+        columns = schemas[name].names
+        return pa.Table.from_pydict(
+            {
+                column: [row[i] for row in rows]
+                for i, column in enumerate(columns)
+            },
+            schema=schemas[name],
+        )
+
+    embeddings = schemas["embeddings"]
+    return {
+        "events": pa.Table.from_pydict(
+            _event_columns(chunk.events), schema=schemas["events"]
+        ),
+        "geo_addresses": _table("geo_addresses", chunk.geo_addresses),
+        "moods": _table("moods", chunk.moods),
+        "embeddings": pa.Table.from_arrays(
+            [
+                pa.array([row[0] for row in chunk.embeddings], pa.int64()),
+                pa.array([row[1] for row in chunk.embeddings], pa.string()),
+                pa.array([row[2] for row in chunk.embeddings], pa.string()),
+                _embedding_array(pa, [row[3] for row in chunk.embeddings]),
+            ],
+            schema=embeddings,
+        ),
+    }
+
+
+def _open_writer(pa, path: Path, schema, export_format: ExportFormat):
+    if export_format == ExportFormat.parquet:
+        return pa.parquet.ParquetWriter(str(path), schema)
+    return pa.ipc.new_file(str(path), schema)
+
+
+def export_events(
+    ctx: typer.Context,
+    filename: str,
+    version: str,
+    output_dir: Path = typer.Option(
+        Path("export"), help="Directory to write one file per table to"
+    ),
+    export_format: ExportFormat = typer.Option(
+        ExportFormat.parquet, help="parquet or arrow(IPC file format)"
+    ),
+    chunk_size: int = typer.Option(
+        1000, help="Events read and written per row group/record batch"
+    ),
+) -> Dict[str, Path]:
+    """
+    Write the events of filename and version into events, geo_addresses,
+    moods and embeddings files in output_dir. Only one chunk of events is in
+    memory at a time.
+    """
+    # Imported here so that the CLI's --help does not load the models.
+    # pylint: disable=import-outside-toplevel
+    from ..model.persistence_model import get_export_chunk
+
+    pa = _import_pyarrow()
+    output_dir.mkdir(parents=True, exist_ok=True)
+    schemas = _schemas(pa)
+    paths = {
+        name: output_dir / f"{name}.{export_format.value}" for name in schemas
+    }
+    writers = {
+        name: _open_writer(pa, paths[name], schemas[name], export_format)
+        for name in schemas
+    }
+    num_events = 0
+    try:
+        after_event_id = 0
+        while True:
+            chunk = get_export_chunk(
+                ctx, filename, version, after_event_id, chunk_size
+            )
+            if chunk is None:
+                break
+            for name, table in chunk_to_tables(pa, chunk).items():
+                if table.num_rows:
+                    writers[name].write_table(table)
+            num_events += len(chunk.events)
+            after_event_id = chunk.last_event_id
+            logger.debug("Exported %d events", num_events)
+    finally:
+        for writer in writers.values():
+            writer.close()
+    typer.echo(f"Exported {num_events} events to {output_dir}")
+    return paths
@@ -1,7 +1,7 @@
 import json
 import logging
 import traceback
-from typing import Dict, Optional, Tuple
+from typing import Dict, Optional, Set, Tuple
 
 import requests
 import typer
@@ -11,6 +11,8 @@ from ..model.ai_conv_types import MessageNode, Role
 from ..model.persistence_model import (
     ParsedEventTable,
     add_geoaddress,
+    bump_data_version,
+    get_geocoded_addresses,
     get_parsed_events,
 )
 from ..types.city_event import CityEvent
@@ -130,12 +132,53 @@ def _try_format_address_with_ai(address: str) -> Optional[Dict[str, str]]:
     return None
 
 
+def geocode_address(
+    address: str,
+) -> Tuple[Optional[float], Optional[float], Optional[str]]:
+    """
+    The latitude, longitude and failure reason of address. Addresses Nominatim
+    does not know are normalized by the AI and looked up again.
+    """
+    try:
+        lat, long = get_coordinates(params={"q": address})
+        if lat is None or long is None:
+            json_address = _try_format_address_with_ai(address)
+            if json_address:
+                lat, long = get_coordinates(json_address)
+            else:
+                raise ValueError(
+                    f"Failed to get coordinates from AI as well for adddress {address}!"
+                )
+    except Exception as exc:  #  pylint: disable=broad-exception-caught
+        logger.warning(
+            "Failed to get coordinates for %s due to an error %s. Logging this in the database",
+            address,
+            exc,
+        )
+        return None, None, str(traceback.format_exc())
+    return (
+        lat,
+        long,
+        (
+            None
+            if lat and long
+            else "Failed to get find coordinates for this address"
+        ),
+    )
+
+
 def do_rcode(
     ctx: typer.Context,
     filename: str,
     version: str,
     parse_failed_only: bool = False,
+    skip_geotagged: bool = True,
 ) -> None:
+    """
+    Geocodes the addresses of the events. With skip_geotagged, addresses
+    geocoded to coordinates already, like those geocoded speculatively during
+    extraction, are skipped; failed ones are tried again.
+    """
     parsed_events = get_parsed_events(
         ctx,
         filename=filename,
@@ -149,55 +192,40 @@ def do_rcode(
         parse_failed_only=parse_failed_only,
     )
     typer.echo(f"Got {len(parsed_events)} events to process")
-    for event in parsed_events:
-        event_obj = CityEvent(
-            **{
-                **event.event_json,
-                **dict(name=event.name, description=event.description),
-            }
-        )
-        addresses = event_obj.addresses
-        if not addresses:
-            logger.warning("No addresses found for event %d", event.id)
-            continue
-        for address in addresses:
-            lat, long = None, None
-            try:
-                lat, long = get_coordinates(params={"q": address})
-                if lat is None or long is None:
-                    json_address = _try_format_address_with_ai(address)
-                    if json_address:
-                        lat, long = get_coordinates(json_address)
-                    else:
-                        raise ValueError(
-                            f"Failed to get coordinates from AI as well for adddress {address}!"
-                        )
-            except Exception as exc:  #  pylint: disable=broad-exception-caught
-                logger.warning(
-                    "Failed to get coordinates for %s due to an error %s. Logging this as in the database for event id %d",
-                    address,
-                    exc,
-                    event.id,
-                )
-                stack_trace = traceback.format_exc()
+    geocoded: Set[Tuple[int, str]] = (
+        get_geocoded_addresses(ctx, filename, version)
+        if skip_geotagged
+        else set()
+    )
+    if geocoded:
+        typer.echo(f"Skipping {len(geocoded)} addresses geocoded already")
+    try:
+        for event in parsed_events:
+            event_obj = CityEvent(
+                **{
+                    **event.event_json,
+                    **dict(name=event.name, description=event.description),
+                }
+            )
+            addresses = event_obj.addresses
+            if not addresses:
+                logger.warning("No addresses found for event %d", event.id)
+                continue
+            for address in addresses:
+                if (event.id, address) in geocoded:
+                    continue
+                lat, long, failure_reason = geocode_address(address)
+                logger.debug("Adding address %s for id %d", address, event.id)
                 add_geoaddress(
                     ctx,
                     parsed_event_id=event.id,
                     address=address,
-                    failure_reason=str(stack_trace),
+                    latitude=lat,
+                    longitude=long,
+                    failure_reason=failure_reason,
                 )
-                continue
-            logger.debug("Adding address %s for id %d", address, event.id)
-            add_geoaddress(
-                ctx,
-                parsed_event_id=event.id,
-                address=address,
-                latitude=lat,
-                longitude=long,
-                failure_reason=None
-                if lat and long
-                else "Failed to get find coordinates for this address",
-            )
+    finally:
+        bump_data_version(ctx, filename, version)
 
 
 # N2S: Make sure your local Nominatim server is running and accessible at
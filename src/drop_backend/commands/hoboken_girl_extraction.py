@@ -1,9 +1,21 @@
 import datetime
+import functools
 import logging
 import logging.config
 import re
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Generator, List, Optional, Tuple
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
 import click
 import typer
@@ -11,14 +23,26 @@ from pydantic import ValidationError
 
 from ..commands.embedding_commands import demo_retrieval  # index_events,
 from ..commands.embedding_commands import (
+    EmbeddingType,
+    event_embedding_row,
+    event_embedding_text,
     index_event_embeddings,
     index_mood_embeddings,
     index_moods,
 )
-from ..lib.ai import AIDriver, AltAI, driver_wrapper
+from ..lib.ai import (
+    AIDriver,
+    AltAI,
+    ConversationTemplate,
+    EmbeddingSearch,
+    driver_wrapper,
+)
 from ..lib.db import DB
 from ..lib.event_node_manager import EventManager
+from ..lib.instrumentation import RunStats
 from ..lib.interrogation import InteractiveInterrogationProtocol
+from ..lib.pipeline import run_pipeline
+from ..lib.speculation import Speculation, SpeculativeJob
 from ..model.ai_conv_types import (
     EventNode,
     InterrogationProtocol,
@@ -27,8 +51,15 @@ from ..model.ai_conv_types import (
 )
 from ..model.merge_base import bind_engine
 from ..model.persistence_model import (
+    PreparedEvent,
+    ReplayHistoryTemplate,
     add_event,
+    add_events,
+    add_geoaddresses,
+    bump_data_version,
     get_num_events_by_version_and_filename,
+    insert_parsed_event_embeddings,
+    prepare_event,
 )
 from ..prompts.hoboken_girl_prompt import (
     base_prompt_hoboken_girl,
@@ -48,12 +79,6 @@ app = typer.Typer()
 # LOGGING #
 LOG_FORMAT = "%(asctime)s - %(levelname)s - [%(name)s:%(lineno)d] - %(message)s"
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - [%(name)s:%(lineno)d] - %(message)s",
-    handlers=[logging.FileHandler("app.log"), logging.StreamHandler()],
-)
-
 logger = logging.getLogger(__name__)
 
 # TODO(Sid): Move the invoke_subcommand checks to individual command files where it is used,
@@ -75,6 +100,11 @@ def setup(
         logger.error("Invalid log level: %s. Defaulting to INFO.", loglevel)
         loglevel = "INFO"
     print(f"loglevel: {loglevel}")
+    # Here rather than at import, so importing this module creates no app.log.
+    logging.basicConfig(
+        format=LOG_FORMAT,
+        handlers=[logging.FileHandler("app.log"), logging.StreamHandler()],
+    )
     root_logger = logging.getLogger()
     root_logger.setLevel(loglevel)
     colored_formatter = ColoredFormatter(LOG_FORMAT)
@@ -244,6 +274,39 @@ def extract_serialize_events(
     skip_indexed_events: bool = False,
     # Large enough.
     max_acceptable_errors: int = int(1e7),
+    llm_workers: int = typer.Option(
+        0,
+        help=(
+            "Number of events sent to the AI at a time. With 0 the events are "
+            "extracted one by one and the AI's answers can be interrogated."
+        ),
+    ),
+    ordered: bool = typer.Option(
+        True, help="With llm_workers, save the events in the file's order"
+    ),
+    write_batch_size: int = typer.Option(
+        32, help="With llm_workers, events saved per transaction"
+    ),
+    stats_file: Optional[Path] = typer.Option(
+        None,
+        help=(
+            "Write a JSON summary of the AI calls: counters and histograms of "
+            "latencies, estimated tokens and retries"
+        ),
+    ),
+    speculative_dispatch: bool = typer.Option(
+        False,
+        help=(
+            "With llm_workers, geocode and embed each event as soon as the AI "
+            "streamed its addresses, name and description. The results are "
+            "saved only if the event is valid, do-rcode and "
+            "index-event-embeddings then skip the event."
+        ),
+    ),
+    speculative_embedding_types: List[EmbeddingType] = typer.Option(
+        [EmbeddingType.NAME_DESCRIPTION],
+        help="The embeddings of speculative_dispatch",
+    ),
 ):
     """
     Call AI to parse all teh events in ingestable_article_file to extract
@@ -291,84 +354,387 @@ def extract_serialize_events(
         logger.warning("No events found. Exiting")
         return
 
-    ai = AltAI()  # pylint: disable=invalid-name
-    event_manager = EventManager(
-        "CityEvent", "drop_backend.types", "drop_backend.types.schema"
-    )
-    ai_driver = AIDriver(ai, event_manager=event_manager)
-
     system_message = MessageNode(
         role=Role.system,
         message_content=base_prompt_hoboken_girl(
             cities, date.strftime("%Y-%m-%d")
         ),
     )
+    stats = RunStats()
+    if llm_workers > 0:
+        try:
+            _pipelined_extract_serialize_events(
+                ctx,
+                events,
+                system_message,
+                ingestable_article_file.name,
+                version,
+                max_acceptable_errors,
+                llm_workers,
+                ordered,
+                write_batch_size,
+                stats,
+                (
+                    speculative_jobs(speculative_embedding_types)
+                    if speculative_dispatch
+                    else None
+                ),
+            )
+        finally:
+            bump_data_version(ctx, ingestable_article_file.name, version)
+            _report_stats(stats, stats_file)
+        return
+    if speculative_dispatch:
+        logger.warning("speculative_dispatch needs llm_workers, ignoring it")
+
+    ai = AltAI(hooks=stats)  # pylint: disable=invalid-name
+    event_manager = EventManager(
+        "CityEvent", "drop_backend.types", "drop_backend.types.schema"
+    )
+    ai_driver = AIDriver(ai, event_manager=event_manager, hooks=stats)
+    template, replay_history_template = _conversation_templates(
+        system_message, event_manager
+    )
     num_errors = 0
     driver_wrapper_gen = hoboken_girl_driver_wrapper(
         events,
-        system_message,
+        template,
         ai_driver,
         event_manager,
         interrogation_protocol=InteractiveInterrogationProtocol(),
     )
-    for i, (event, error) in enumerate(driver_wrapper_gen):
-        if error:
-            assert isinstance(error, ValidationError), (
-                "Only validation error expected to be handled. You may want to add more "
-                "error handling here."
-            )
-            assert event.history is not None
-            add_event(
-                ctx,
-                event=None,
-                original_text=event.raw_event_str,
-                replay_history=event.history,
-                failure_reason=error.json(),
-                filename=ingestable_article_file.name,
-                version=version,
+    try:
+        for i, (event, error) in enumerate(driver_wrapper_gen):
+            if error:
+                assert isinstance(error, ValidationError), (
+                    "Only validation error expected to be handled. You may want to add more "
+                    "error handling here."
+                )
+                assert event.history is not None
+                add_event(
+                    ctx,
+                    event=None,
+                    original_text=event.raw_event_str,
+                    replay_history=event.history,
+                    failure_reason=error.json(),
+                    filename=ingestable_article_file.name,
+                    version=version,
+                    replay_history_template=replay_history_template,
+                )
+                continue
+            try:
+                assert event.history is not None
+                add_event(
+                    ctx,
+                    event=event.event_obj,
+                    original_text=event.raw_event_str,
+                    replay_history=event.history,
+                    failure_reason=None,
+                    filename=ingestable_article_file.name,
+                    version=version,
+                    replay_history_template=replay_history_template,
+                )
+            except Exception as error:  # pylint: disable=broad-except
+                _id = add_event(  # pylint: disable=invalid-name
+                    ctx,
+                    event=None,
+                    original_text=event.raw_event_str,
+                    replay_history=event.history,
+                    failure_reason=str(error),
+                    filename=ingestable_article_file.name,
+                    version=version,
+                    replay_history_template=replay_history_template,
+                )
+                logger.exception(error)
+                logger.warning("Event id #%d saved with its error", _id)
+                if num_errors > max_acceptable_errors:
+                    logger.error(
+                        (
+                            "Too many errors. Stopping processing."
+                            " Please fix the errors and run the command again."
+                        )
+                    )
+                    return
+                num_errors += 1
+            finally:
+                logger.info("Processed event %d", i)
+    finally:
+        bump_data_version(ctx, ingestable_article_file.name, version)
+        _report_stats(stats, stats_file)
+
+
+def _conversation_templates(
+    system_message: MessageNode, event_manager: EventManager
+) -> Tuple[ConversationTemplate, ReplayHistoryTemplate]:
+    """
+    The start of the conversation with the AI of every event, and of its
+    replay history, made once per run.
+    """
+    template = ConversationTemplate.for_event_manager(
+        system_message, event_manager
+    )
+    return template, ReplayHistoryTemplate(
+        [template.system_message], template.functions
+    )
+
+
+def _report_stats(stats: RunStats, stats_file: Optional[Path]) -> None:
+    stats.log_summary()
+    if stats_file:
+        stats.dump(stats_file)
+        logger.info("Wrote the AI call stats to %s", stats_file)
+
+
+class TooManyErrors(Exception):
+    pass
+
+
+GEOCODE_JOB = "geocode"
+
+
+def _geocode_addresses(
+    addresses: List[str],
+) -> List[Tuple[str, Optional[float], Optional[float], Optional[str]]]:
+    # geo configures logging when imported.
+    from .geo import (  # pylint: disable=import-outside-toplevel
+        geocode_address,
+    )
+
+    return [(address, *geocode_address(address)) for address in addresses]
+
+
+def _embed_event(
+    embedding_search: EmbeddingSearch,
+    embedding_type: EmbeddingType,
+    name: str,
+    description: str,
+) -> Optional[List[float]]:
+    text = event_embedding_text(embedding_type, name, description)
+    return embedding_search.fetch_embeddings([text]) if text else None
+
+
+def speculative_jobs(
+    embedding_types: Sequence[EmbeddingType],
+) -> List[SpeculativeJob]:
+    """Geocoding like do-rcode and embeddings like index-event-embeddings."""
+    jobs = [SpeculativeJob(GEOCODE_JOB, ("addresses",), _geocode_addresses)]
+    if embedding_types:
+        embedding_search = EmbeddingSearch()
+        jobs.extend(
+            SpeculativeJob(
+                embedding_type.value,
+                ("name", "description"),
+                functools.partial(
+                    _embed_event, embedding_search, embedding_type
+                ),
             )
-            continue
-        try:
-            assert event.history is not None
-            add_event(
-                ctx,
-                event=event.event_obj,
-                original_text=event.raw_event_str,
-                replay_history=event.history,
-                failure_reason=None,
-                filename=ingestable_article_file.name,
-                version=version,
+            for embedding_type in embedding_types
+        )
+    return jobs
+
+
+def _add_speculative_results(
+    ctx: typer.Context,
+    version: str,
+    event_ids: List[int],
+    results: List[Dict[str, Any]],
+) -> None:
+    geo_addresses = []
+    embeddings = []
+    for event_id, event_results in zip(event_ids, results):
+        for address, latitude, longitude, failure_reason in event_results.get(
+            GEOCODE_JOB, []
+        ):
+            geo_addresses.append(
+                dict(
+                    parsed_event_id=event_id,
+                    address=address,
+                    latitude=latitude,
+                    longitude=longitude,
+                    failure_reason=failure_reason,
+                )
             )
-        except Exception as error:  # pylint: disable=broad-except
-            _id = add_event(  # pylint: disable=invalid-name
-                ctx,
-                event=None,
-                original_text=event.raw_event_str,
-                replay_history=event.history,
-                failure_reason=str(error),
-                filename=ingestable_article_file.name,
-                version=version,
+        for embedding_type in EmbeddingType:
+            if event_results.get(embedding_type.value) is not None:
+                embeddings.append(
+                    event_embedding_row(
+                        event_id,
+                        embedding_type,
+                        event_results[embedding_type.value],
+                        version,
+                    )
+                )
+    if geo_addresses:
+        add_geoaddresses(ctx, geo_addresses)
+    if embeddings:
+        insert_parsed_event_embeddings(ctx, embeddings)
+
+
+# An extracted event, its error and the jobs started from its arguments.
+_ExtractResult = Tuple[EventNode, Optional[Exception], Optional[Speculation]]
+
+
+def _pipelined_extract_serialize_events(  # pylint: disable=too-many-arguments
+    ctx: typer.Context,
+    events: List[str],
+    system_message: MessageNode,
+    filename: str,
+    version: str,
+    max_acceptable_errors: int,
+    llm_workers: int,
+    ordered: bool,
+    write_batch_size: int,
+    stats: Optional[RunStats] = None,
+    jobs: Optional[Sequence[SpeculativeJob]] = None,
+) -> None:
+    """
+    Like extract_serialize_events but llm_workers AI calls are in flight while
+    the finished events are serialized and saved in batches by other threads.
+    There is no interrogation since nobody can answer the workers. The workers
+    share stats.
+
+    jobs are started speculatively from the arguments the AI streamed, see
+    speculative_jobs, and their results saved with the valid events.
+    """
+    executor = ThreadPoolExecutor(max_workers=2 * llm_workers) if jobs else None
+    template, replay_history_template = _conversation_templates(
+        system_message,
+        EventManager(
+            "CityEvent", "drop_backend.types", "drop_backend.types.schema"
+        ),
+    )
+
+    def _make_worker() -> Callable[[str], _ExtractResult]:
+        # AltAI and the EventManager keep per conversation state.
+        event_manager = EventManager(
+            "CityEvent", "drop_backend.types", "drop_backend.types.schema"
+        )
+        ai = AltAI(hooks=stats)  # pylint: disable=invalid-name
+        ai_driver = AIDriver(ai, event_manager=event_manager, hooks=stats)
+
+        def _extract(raw_event: str) -> _ExtractResult:
+            speculation = (
+                Speculation(jobs, executor) if jobs and executor else None
             )
-            logger.exception(error)
-            logger.warning("Event id #%d saved with its error", _id)
-            if num_errors > max_acceptable_errors:
-                logger.error(
-                    (
-                        "Too many errors. Stopping processing."
-                        " Please fix the errors and run the command again."
+            ai.field_listener = speculation.on_field if speculation else None
+            try:
+                event, error = next(
+                    hoboken_girl_driver_wrapper(
+                        [raw_event], template, ai_driver, event_manager
                     )
                 )
-                return
+            except Exception as exc:  # pylint: disable=broad-except
+                # Saved with its error like in extract_serialize_events, one
+                # event must not stop the others.
+                logger.exception(exc)
+                event = event_manager.event_node  # type: ignore[assignment]
+                if event is None or event.raw_event_str is not raw_event:
+                    event = event_manager.create_event_node(raw_event)
+                if event.history is None:
+                    event.history = []
+                error = exc
+            return event, error, speculation
+
+        return _extract
+
+    def _hold(result: _ExtractResult) -> None:
+        # Results wait in the pipeline's queues for _prepare. Expanded, their
+        # histories still start with the template's messages for prepare_event.
+        event, _, _ = result
+        event.compact(
+            replay_history_template.messages, replay_history_template.functions
+        )
+
+    num_errors = 0
+
+    def _prepare(
+        _: str, result: _ExtractResult
+    ) -> Tuple[PreparedEvent, Dict[str, Any]]:
+        nonlocal num_errors
+        event, error, speculation = result
+        assert event.history is not None
+        if error is not None and not isinstance(error, ValidationError):
             num_errors += 1
-        finally:
-            logger.info("Processed event %d", i)
+            if num_errors > max_acceptable_errors:
+                raise TooManyErrors() from error
+        if error is None:
+            try:
+                prepared = prepare_event(
+                    event=event.event_obj,
+                    original_text=event.raw_event_str,
+                    replay_history=event.history,
+                    failure_reason=None,
+                    filename=filename,
+                    version=version,
+                    replay_history_template=replay_history_template,
+                )
+                return prepared, (
+                    speculation.results(
+                        lambda field: getattr(event.event_obj, field, None)
+                    )
+                    if speculation
+                    else {}
+                )
+            except Exception as exc:  # pylint: disable=broad-except
+                logger.exception(exc)
+                error = exc
+                num_errors += 1
+                if num_errors > max_acceptable_errors:
+                    raise TooManyErrors() from exc
+        if speculation:
+            speculation.discard()
+        failed = prepare_event(
+            event=None,
+            original_text=event.raw_event_str,
+            replay_history=event.history,
+            failure_reason=(
+                error.json()
+                if isinstance(error, ValidationError)
+                else str(error)
+            ),
+            filename=filename,
+            version=version,
+            replay_history_template=replay_history_template,
+        )
+        return failed, {}
+
+    def _write(batch: List[Tuple[PreparedEvent, Dict[str, Any]]]) -> None:
+        event_ids = add_events(ctx, [prepared for prepared, _ in batch])
+        _add_speculative_results(
+            ctx, version, event_ids, [results for _, results in batch]
+        )
+        logger.info("Saved %d events", len(batch))
+
+    try:
+        num_events = run_pipeline(
+            events,
+            _make_worker,
+            _prepare,
+            _write,
+            num_workers=llm_workers,
+            batch_size=write_batch_size,
+            ordered=ordered,
+            hold=_hold,
+        )
+    except TooManyErrors:
+        logger.error(
+            (
+                "Too many errors. Stopping processing."
+                " Please fix the errors and run the command again."
+            )
+        )
+        return
+    finally:
+        if executor:
+            executor.shutdown(cancel_futures=True)
+    logger.info("Processed %d events", num_events)
 
 
 def hoboken_girl_driver_wrapper(
     # TODO: This functions does not do much and is actually part of the intergration test case.
     # I need to remove this function and instead just test the driver_wrapper directly.
     events: List[str],
-    system_message: MessageNode,
+    system_message: Union[MessageNode, ConversationTemplate],
     ai_driver: AIDriver,
     event_manager: EventManager,
     interrogation_protocol: Optional[InterrogationProtocol] = None,
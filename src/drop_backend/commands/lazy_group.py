@@ -0,0 +1,45 @@
+"""
+Typer groups whose commands are imported when they are run or their group's
+help is shown, so that `--help` and unrelated commands do not pay for the
+imports of every command module(openai, SQLAlchemy models, requests...).
+"""
+
+import importlib
+from typing import Dict, List, Optional, Type
+
+import click
+import typer
+from typer.core import TyperGroup
+
+
+class LazyTyperGroup(TyperGroup):
+    # Command name -> "module:function" of a typer command function.
+    lazy_commands: Dict[str, str] = {}
+
+    def list_commands(self, ctx: click.Context) -> List[str]:
+        commands = super().list_commands(ctx)
+        return commands + [
+            name for name in self.lazy_commands if name not in commands
+        ]
+
+    def get_command(
+        self, ctx: click.Context, cmd_name: str
+    ) -> Optional[click.Command]:
+        if cmd_name not in self.commands and cmd_name in self.lazy_commands:
+            self.add_command(self._load(cmd_name), cmd_name)
+        return super().get_command(ctx, cmd_name)
+
+    def _load(self, cmd_name: str) -> click.Command:
+        module_name, function_name = self.lazy_commands[cmd_name].split(":")
+        function = getattr(importlib.import_module(module_name), function_name)
+        # A typer app with one command and no callback is that command.
+        single = typer.Typer()
+        single.command(name=cmd_name)(function)
+        return typer.main.get_command(single)
+
+
+def lazy_group(lazy_commands: Dict[str, str]) -> Type[LazyTyperGroup]:
+    """A group class for typer.Typer(cls=...) with the lazy_commands."""
+    return type(
+        "LazyTyperGroup", (LazyTyperGroup,), {"lazy_commands": lazy_commands}
+    )
@@ -1,21 +1,33 @@
 import json
 import logging
-import math
-from typing import cast
+import threading
+from typing import Dict, List, Optional, Set, Tuple
 
 import typer
-from pydantic import ValidationError
 from sqlalchemy import column
 
 from ..lib.ai import AIDriver, AltAI, driver_wrapper
+from ..lib.batch_retry import ItemOutcome, ItemStatus, retry_by_bisection
 from ..lib.event_node_manager import EventManager
 from ..lib.interrogation import InteractiveInterrogationProtocol
-from ..model.ai_conv_types import MessageNode, Role
+from ..lib.token_batching import (
+    BatchTokenCounts,
+    TokenBatch,
+    estimate_tokens,
+    log_token_counts,
+    pack_by_tokens,
+)
+from ..model.ai_conv_types import (
+    EventNode,
+    InterrogationProtocol,
+    MessageNode,
+    Role,
+)
 from ..model.mood_model_supervised import (
-    handle_mood_submood,
-    handle_sub_mood_event,
+    record_mood_tagging_outcomes,
+    upsert_mood_submood_events,
 )
-from ..model.persistence_model import get_parsed_events
+from ..model.persistence_model import bump_data_version, get_parsed_events
 from ..prompts.mood_prompt import get_system_prompt, message_content_formatter
 from ..types.mood_submood import MoodSubmood
 
@@ -29,7 +41,18 @@ def generate_and_index_event_moods(
     cities: str,  # CSV list
     demographics: str,  # CSV list
     batch_size: int,
+    batch_token_budget: int = 4000,
+    retry_budget: int = 20,
+    retry_workers: int = 4,
 ):
+    """
+    batch_size caps the events per AI call and batch_token_budget its
+    estimated prompt tokens, system prompt and function spec included.
+
+    Failed batches are bisected and retried, see retry_by_bisection, with at
+    most retry_budget extra AI calls. Whether each event was tagged is saved
+    in MoodTaggingOutcomes.
+    """
     # Get all teh events from parsed_events by filename and version.
     events = get_parsed_events(
         ctx,
@@ -43,53 +66,202 @@ def generate_and_index_event_moods(
             cities=cities, demographics=demographics
         ),
     )
-    raw_event_batches = [
-        json.dumps({
-            "Event" + str(event.id): event.name + ".\n " + event.description
-            for event in events[batch_size * batch_num: batch_size*(batch_num+1) ]
-        })
-        for batch_num in range(0, math.ceil(len(events) / batch_size))
-    ]
     # Generate json using AI
     event_manager = EventManager(
         "MoodSubmood", "drop_backend.types", "drop_backend.types.schema"
     )
+    functions, _ = event_manager.get_function_call_spec()
+    # Tokens sent with every batch.
+    overhead_tokens = estimate_tokens(
+        system_message.message_content or ""
+    ) + estimate_tokens(
+        message_content_formatter("")
+        + json.dumps([function.model_dump() for function in functions or []])
+    )
+    if overhead_tokens >= batch_token_budget:
+        raise ValueError(
+            f"batch_token_budget {batch_token_budget} leaves no room for events"
+            f" after the ~{overhead_tokens} tokens of prompt and functions"
+        )
+    batches = list(
+        pack_by_tokens(
+            (
+                (
+                    "Event" + str(event.id),
+                    event.name + ".\n " + event.description,
+                )
+                for event in events
+            ),
+            batch_token_budget - overhead_tokens,
+            batch_size,
+        )
+    )
     ai_driver = AIDriver(AltAI(), event_manager=event_manager)
-    # Limit me to test.
-    # batch_event = json.dumps(raw_events, indent=2)
-    # print(f"Num events = {len(raw_events)}")
     interrogation_protocol = InteractiveInterrogationProtocol()
-    driver = driver_wrapper(
-        raw_event_batches,
-        system_message=system_message,
-        ai_driver=ai_driver,
-        user_message_prompt_fn=lambda event: message_content_formatter(
-            event.raw_event_str
-        ),
-        event_manager=event_manager,
-        interrogation_protocol=interrogation_protocol,
-    )
-    for _, (event, error) in enumerate(driver):
-        if error:
-            assert isinstance(error, ValidationError), (
-                "Only validation error expected to be handled. You may want to add more "
-                "error handling here."
+    # Retries run on other threads, each with its own driver.
+    retry_drivers = threading.local()
+
+    def _retry_attempt(batch: TokenBatch) -> Tuple[EventNode, MoodSubmood]:
+        if not hasattr(retry_drivers, "ai_driver"):
+            retry_drivers.event_manager = EventManager(
+                "MoodSubmood", "drop_backend.types", "drop_backend.types.schema"
             )
-            assert event.history is not None
-            logger.error(
-                "Failed to generate mood submood for event %s",
-                event.raw_event_str,
+            retry_drivers.ai_driver = AIDriver(
+                AltAI(), event_manager=retry_drivers.event_manager
             )
-            continue
+        event, mood_submood = _tag_batch(
+            batch,
+            system_message,
+            retry_drivers.ai_driver,
+            retry_drivers.event_manager,
+        )
+        # Waits with the other finished retries for _on_result.
+        event.compact([system_message])
+        return event, mood_submood
+
+    token_counts: List[BatchTokenCounts] = []
+
+    def _on_result(
+        batch: TokenBatch, result: Tuple[EventNode, MoodSubmood]
+    ) -> Set[str]:
+        event, mood_submood = result
+        token_counts.append(
+            BatchTokenCounts(
+                num_items=len(batch.items),
+                prompt_tokens=overhead_tokens + batch.estimated_tokens,
+                completion_tokens=_estimate_completion_tokens(event),
+            )
+        )
+        logger.info(
+            "Batch of %d events: ~%d prompt tokens, ~%d completion tokens",
+            token_counts[-1].num_items,
+            token_counts[-1].prompt_tokens,
+            token_counts[-1].completion_tokens,
+        )
+        return {
+            f"Event{event_id}"
+            for event_id in upsert_mood_submood_events(ctx, mood_submood)
+        }
 
-        # Parse the JSON
-        event_obj = cast(MoodSubmood, event.event_obj)
-        moods = event_obj.MOODS
-        for mood in moods:
-            submoods = mood.SUB_MOODS
-            for submood_dict in submoods:
-                submood = submood_dict.SUB_MOOD
-                mood_sub_mood_entry = handle_mood_submood(
-                    ctx, mood.MOOD, submood
+    outcomes: Dict[str, ItemOutcome] = {}
+    failed: List[Tuple[TokenBatch, str]] = []
+    try:
+        for batch in batches:
+            try:
+                covered = _on_result(
+                    batch,
+                    _tag_batch(
+                        batch,
+                        system_message,
+                        ai_driver,
+                        event_manager,
+                        interrogation_protocol,
+                    ),
+                )
+            except Exception as error:  # pylint: disable=broad-except
+                logger.error(
+                    "Failed to generate mood submood for events %s: %s",
+                    ", ".join(batch.items),
+                    error,
                 )
-                handle_sub_mood_event(ctx, submood_dict, mood_sub_mood_entry)
+                failed.append((batch, str(error)))
+                for key in batch.items:
+                    outcomes[key] = ItemOutcome(
+                        ItemStatus.failed, attempts=1, failure_reason=str(error)
+                    )
+                continue
+            for key in batch.items:
+                outcomes[key] = ItemOutcome(ItemStatus.tagged, attempts=1)
+            missing = [key for key in batch.items if key not in covered]
+            if missing:
+                failed.append((batch.subset(missing), "Not tagged by the AI"))
+                for key in missing:
+                    outcomes[key].status = ItemStatus.failed
+                    outcomes[key].failure_reason = "Not tagged by the AI"
+        if failed:
+            num_retries = retry_by_bisection(
+                failed,
+                _retry_attempt,
+                _on_result,
+                outcomes,
+                retry_budget,
+                max_workers=retry_workers,
+            )
+            logger.info(
+                "Retried %d batches for %d failed events",
+                num_retries,
+                sum(len(batch.items) for batch, _ in failed),
+            )
+    finally:
+        record_mood_tagging_outcomes(
+            ctx,
+            {
+                int(key[len("Event") :]): outcome
+                for key, outcome in outcomes.items()
+            },
+        )
+        untagged = [
+            key
+            for key, outcome in outcomes.items()
+            if outcome.status == ItemStatus.failed
+        ]
+        if untagged:
+            logger.error(
+                "%d events could not be tagged: %s",
+                len(untagged),
+                ", ".join(untagged),
+            )
+        log_token_counts(token_counts)
+        # Invalidate cached feeds even if only part of the batch got moods.
+        bump_data_version(ctx, filename, version)
+
+
+def _tag_batch(
+    batch: TokenBatch,
+    system_message: MessageNode,
+    ai_driver: AIDriver,
+    event_manager: EventManager,
+    interrogation_protocol: Optional[InterrogationProtocol] = None,
+) -> Tuple[EventNode, MoodSubmood]:
+    """
+    Raises if the AI's moods do not validate or are for other events.
+    """
+    event, error = next(
+        driver_wrapper(
+            [batch.to_json()],
+            system_message=system_message,
+            ai_driver=ai_driver,
+            user_message_prompt_fn=lambda event: message_content_formatter(
+                event.raw_event_str
+            ),
+            event_manager=event_manager,
+            interrogation_protocol=interrogation_protocol,
+        )
+    )
+    if error is not None:
+        raise error
+    if not isinstance(event.event_obj, MoodSubmood):
+        raise ValueError("The AI did not create moods")
+    unknown = {
+        event_id
+        for mood in event.event_obj.MOODS
+        for submood in mood.SUB_MOODS
+        for event_id in submood.EVENTS
+    } - batch.items.keys()
+    if unknown:
+        raise ValueError(f"Moods for events not in the batch: {unknown}")
+    return event, event.event_obj
+
+
+def _estimate_completion_tokens(event: EventNode) -> int:
+    tokens = 0
+    for message in event.history or []:
+        if message.role != Role.assistant:
+            continue
+        if message.message_content:
+            tokens += estimate_tokens(message.message_content)
+        if message.ai_function_call is not None:
+            tokens += estimate_tokens(
+                json.dumps(message.ai_function_call.arguments)
+            )
+    return tokens
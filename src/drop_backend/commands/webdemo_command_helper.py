@@ -1,10 +1,14 @@
 # Entry point for all commands. Set up things here like DB, logging or whatever.
+import dataclasses
 import json
 import logging
+import math
+import threading
+import weakref
 from collections import defaultdict
 from dataclasses import dataclass
 from datetime import datetime
-from typing import Any, Dict, List, Optional, Tuple, Union, cast
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union, cast
 
 import typer
 from sqlalchemy.engine import Engine
@@ -14,6 +18,9 @@ from ..model.persistence_model import (
     MoodSubmoodTable,
     ParsedEventTable,
     fetch_events_geocoded_mood_attached,
+    get_data_versions,
+    get_event_ids_in_box,
+    get_time_window_filter,
     should_include_event,
 )
 from ..types.city_event import CityEvent
@@ -24,6 +31,7 @@ from ..utils.ors import (
     TransitDirectionError,
     TransitDirectionSummary,
     TransitDistanceDurationCalculator,
+    ensure_health_check,
 )
 
 logger = logging.getLogger(__name__)
@@ -57,50 +65,32 @@ class TaggedEvent:
         ]
     ]
 
-def geotag_moodtag_events_helper(
-    engine_or_context: Union[Engine, "typer.Context"],
-    ors_api_endpoint: str,
-    file_version_constraints: Dict[str, List[str]],
-    where_lat: float,
-    where_lon: float,
-    datetime_now: datetime,
-    when: When = When.NOW,
-    now_window_hours: int = 1,
-    fetched_data_cols=(
-        ParsedEventTable.id,
-        ParsedEventTable.event_json,
-        ParsedEventTable.name,
-        ParsedEventTable.description,
-        GeoAddresses.latitude,
-        GeoAddresses.longitude,
-        GeoAddresses.address,
-        MoodSubmoodTable.mood,
-        MoodSubmoodTable.submood,
-    ),
-) -> List[TaggedEvent]:
-    """
-    Identical to the above method but instead of typer.Context it takes a generic object which the
-    session_manager decorator can extract the engine from.
-    """
 
-    if isinstance(engine_or_context, Engine):
+@dataclass
+class _FeedSnapshot:
+    data_versions: Dict[Tuple[str, str], int]
+    events: List[_DedupedEvent]
 
-        class DummyContext:
-            def __init__(self):
-                self.obj = {}
 
-        dummy_context = DummyContext()
-        dummy_context.obj["engine"] = engine_or_context
-    else:
-        if isinstance(engine_or_context, typer.Context):
-            dummy_context: typer.Context = engine_or_context  # type: ignore
-        else:
-            raise ValueError(
-                "Invalid type for engine_or_context must be Engine or Context"
-            )
+# Engine -> (file_version_constraints, columns) -> snapshot.
+_feed_snapshots: (
+    "weakref.WeakKeyDictionary[Engine, Dict[Any, _FeedSnapshot]]"
+) = weakref.WeakKeyDictionary()
+_feed_snapshots_lock = threading.Lock()
 
+
+def invalidate_feed_snapshots() -> None:
+    with _feed_snapshots_lock:
+        _feed_snapshots.clear()
+
+
+def _fetch_deduped_events(
+    context: Any,
+    file_version_constraints: Dict[str, List[str]],
+    fetched_data_cols: Tuple[Any, ...],
+) -> List[_DedupedEvent]:
     events: List[ParsedEventTable] = fetch_events_geocoded_mood_attached(
-        dummy_context,
+        context,
         file_version_constraints,
         columns=list(fetched_data_cols),
     )
@@ -110,9 +100,8 @@ def geotag_moodtag_events_helper(
         lambda: dict(geo_dict=dict())
     )
     for row in events:
-        geo_dict = events_dict[row.id]["geo_dict"]
         assert row.latitude and row.longitude and row.address  # type: ignore
-
+        geo_dict = events_dict[row.id]["geo_dict"]
         geo_dict[row.address] = GeoLocation(  # type: ignore
             **{"latitude": row.latitude, "longitude": row.longitude}  # type: ignore
         )
@@ -130,7 +119,7 @@ def geotag_moodtag_events_helper(
         )
 
     # Now convert the aggregated data into a list of dictionaries or other desired format
-    event_lst = [
+    return [
         _DedupedEvent(
             **{
                 "id": key,
@@ -148,43 +137,278 @@ def geotag_moodtag_events_helper(
         )
         for key, value in events_dict.items()
     ]
+
+
+def _get_deduped_events(
+    context: Any,
+    file_version_constraints: Dict[str, List[str]],
+    fetched_data_cols: Tuple[Any, ...],
+) -> List[_DedupedEvent]:
+    """
+    The snapshot for the constraints, rebuilt if a batch command bumped one of
+    their DataVersions stamps since it was taken. The returned events are shared
+    between callers and must not be mutated.
+    """
+    engine = context.obj["engine"]
+    key = (
+        tuple(
+            sorted(
+                (filename, tuple(sorted(versions)))
+                for filename, versions in file_version_constraints.items()
+            )
+        ),
+        tuple(str(col) for col in fetched_data_cols),
+    )
+    # Read the stamps before the data: a write in between only causes a
+    # spurious rebuild on the next call, never a stale snapshot.
+    data_versions = get_data_versions(context, file_version_constraints)
+    with _feed_snapshots_lock:
+        snapshot = _feed_snapshots.get(engine, {}).get(key)
+    if snapshot is not None and snapshot.data_versions == data_versions:
+        return snapshot.events
+    logger.info("Rebuilding the event feed snapshot for %s", key[0])
+    events = _fetch_deduped_events(
+        context, file_version_constraints, fetched_data_cols
+    )
+    with _feed_snapshots_lock:
+        _feed_snapshots.setdefault(engine, {})[key] = _FeedSnapshot(
+            data_versions, events
+        )
+    return events
+
+
+def _within_radius(
+    event: _DedupedEvent,
+    where_lat: float,
+    where_lon: float,
+    radius_meters: float,
+) -> Optional[_DedupedEvent]:
+    geo_dict = {
+        address: location
+        for address, location in event.geo_dict.items()
+        if TransitDistanceDurationCalculator.haversine_distance(
+            (where_lat, where_lon), (location.latitude, location.longitude)
+        )
+        <= radius_meters
+    }
+    if not geo_dict:
+        return None
+    if len(geo_dict) == len(event.geo_dict):
+        return event
+    return dataclasses.replace(event, geo_dict=geo_dict)
+
+
+_FETCHED_DATA_COLS = (
+    ParsedEventTable.id,
+    ParsedEventTable.event_json,
+    ParsedEventTable.name,
+    ParsedEventTable.description,
+    GeoAddresses.latitude,
+    GeoAddresses.longitude,
+    GeoAddresses.address,
+    MoodSubmoodTable.mood,
+    MoodSubmoodTable.submood,
+)
+
+
+def _as_context(engine_or_context: Union[Engine, "typer.Context"]) -> Any:
+    if isinstance(engine_or_context, Engine):
+
+        class DummyContext:
+            def __init__(self):
+                self.obj = {}
+
+        dummy_context = DummyContext()
+        dummy_context.obj["engine"] = engine_or_context
+        return dummy_context
+    if isinstance(engine_or_context, typer.Context):
+        return engine_or_context
+    raise ValueError(
+        "Invalid type for engine_or_context must be Engine or Context"
+    )
+
+
+def _matching_events(  # pylint: disable=too-many-arguments
+    dummy_context: Any,
+    file_version_constraints: Dict[str, List[str]],
+    where_lat: float,
+    where_lon: float,
+    datetime_now: datetime,
+    when: When,
+    now_window_hours: int,
+    radius_meters: Optional[float],
+    fetched_data_cols: Tuple[Any, ...],
+) -> List[_DedupedEvent]:
+    event_lst = _get_deduped_events(
+        dummy_context, file_version_constraints, fetched_data_cols
+    )
+    logger.info("Got %d deduped events", len(event_lst))
+    if radius_meters is not None:
+        # The R*Tree leaves only the events near by to check by distance.
+        event_ids = get_event_ids_in_box(
+            dummy_context, where_lat, where_lon, radius_meters
+        )
+        event_lst = [
+            near_event
+            for near_event in (
+                _within_radius(event, where_lat, where_lon, radius_meters)
+                for event in event_lst
+                if int(event.id) in event_ids
+            )
+            if near_event is not None
+        ]
     # Calculate the time threshold
+    time_window_filter = get_time_window_filter(
+        dummy_context,
+        file_version_constraints,
+        when,
+        datetime_now,
+        now_window_hours,
+    )
     filtered_events = []
-    dist_dur_calc = TransitDistanceDurationCalculator(ors_api_endpoint)
     for event in event_lst:
-        if event.event_json is not None and should_include_event(
-            when,
+        if event.event_json is None:
+            continue
+        include = time_window_filter.should_include(int(event.id))
+        if include is None:
+            # Not in EventTimeWindows yet, see index_event_time_windows.
+            include = should_include_event(
+                when,
+                datetime_now,
+                now_window_hours,
+                cast(Dict[str, Any], event.event_json),
+            )
+        if include:
+            filtered_events.append(event)
+    return filtered_events
+
+
+def _closest_distance(
+    event: _DedupedEvent, where_lat: float, where_lon: float
+) -> float:
+    return min(
+        (
+            TransitDistanceDurationCalculator.haversine_distance(
+                (where_lat, where_lon), (location.latitude, location.longitude)
+            )
+            for location in event.geo_dict.values()
+        ),
+        default=math.inf,
+    )
+
+
+def _tag_with_directions(
+    dist_dur_calc: TransitDistanceDurationCalculator,
+    event: _DedupedEvent,
+    where_lat: float,
+    where_lon: float,
+) -> TaggedEvent:
+    directions: Optional[
+        list[
+            tuple[
+                Dict[
+                    Profile,
+                    Union[TransitDirectionSummary, TransitDirectionError],
+                ],
+                str,
+            ]
+        ]
+    ] = None
+    try:
+        directions = dist_dur_calc.get_transit_distance_duration_wrapper(
+            where_lat, where_lon, event.geo_dict
+        )
+    except Exception as exc:  # pylint: disable=broad-except
+        logger.exception(exc)
+    return TaggedEvent(event, directions)
+
+
+def ranked_tagged_event_pages(  # pylint: disable=too-many-arguments
+    engine_or_context: Union[Engine, "typer.Context"],
+    ors_api_endpoint: str,
+    file_version_constraints: Dict[str, List[str]],
+    where_lat: float,
+    where_lon: float,
+    datetime_now: datetime,
+    when: When = When.NOW,
+    now_window_hours: int = 1,
+    radius_meters: Optional[float] = None,
+    page_size: int = 10,
+    fetched_data_cols=_FETCHED_DATA_COLS,
+) -> Iterator[List[TaggedEvent]]:
+    """
+    Pages of the events matching geotag_moodtag_events_helper's filters, closest
+    (by haversine distance to their nearest address) first.
+
+    Directions are requested from ORS only for the page being produced, so the
+    cost of the first page does not grow with the number of matching events.
+    Stop iterating to skip the ORS calls for the remaining pages.
+    """
+    if page_size <= 0:
+        raise ValueError("page_size must be positive")
+    dummy_context = _as_context(engine_or_context)
+    ranked_events = sorted(
+        _matching_events(
+            dummy_context,
+            file_version_constraints,
+            where_lat,
+            where_lon,
             datetime_now,
+            when,
             now_window_hours,
-            cast(Dict[str, Any], event.event_json),
-        ):
-            # N2S: Could be lazy loaded by the web framework if found to be slow.
-            directions: Optional[
-                list[
-                    tuple[
-                        Dict[
-                            Profile,
-                            Union[
-                                TransitDirectionSummary, TransitDirectionError
-                            ],
-                        ],
-                        str,
-                    ]
-                ]
-            ] = None
-            try:
-                directions = (
-                    dist_dur_calc.get_transit_distance_duration_wrapper(
-                        where_lat, where_lon, event.geo_dict
-                    )
-                )
-            except Exception as exc:  # pylint: disable=broad-except
-                logger.exception(exc)
-            filtered_events.append(
-                TaggedEvent(
-                    event,
-                    directions,
-                )
-            )
+            radius_meters,
+            tuple(fetched_data_cols),
+        ),
+        key=lambda event: _closest_distance(event, where_lat, where_lon),
+    )
+    dist_dur_calc = TransitDistanceDurationCalculator(ors_api_endpoint)
+    ensure_health_check(dist_dur_calc)
+    for start in range(0, len(ranked_events), page_size):
+        yield [
+            _tag_with_directions(dist_dur_calc, event, where_lat, where_lon)
+            for event in ranked_events[start : start + page_size]
+        ]
 
-    return filtered_events
+
+def geotag_moodtag_events_helper(
+    engine_or_context: Union[Engine, "typer.Context"],
+    ors_api_endpoint: str,
+    file_version_constraints: Dict[str, List[str]],
+    where_lat: float,
+    where_lon: float,
+    datetime_now: datetime,
+    when: When = When.NOW,
+    now_window_hours: int = 1,
+    radius_meters: Optional[float] = None,
+    fetched_data_cols=_FETCHED_DATA_COLS,
+) -> List[TaggedEvent]:
+    """
+    Identical to the above method but instead of typer.Context it takes a generic object which the
+    session_manager decorator can extract the engine from.
+
+    If radius_meters is given only addresses within that distance of
+    (where_lat, where_lon) are considered.
+
+    The deduped events come from a per process snapshot that is rebuilt only when
+    the DataVersions stamps of file_version_constraints change, so per request
+    work is only filtering by time/radius and fetching directions.
+
+    Returns every matching event with directions, closest first. Use
+    ranked_tagged_event_pages to fetch directions a page at a time.
+    """
+    return [
+        tagged_event
+        for page in ranked_tagged_event_pages(
+            engine_or_context,
+            ors_api_endpoint,
+            file_version_constraints,
+            where_lat,
+            where_lon,
+            datetime_now,
+            when,
+            now_window_hours,
+            radius_meters,
+            fetched_data_cols=fetched_data_cols,
+        )
+        for tagged_event in page
+    ]
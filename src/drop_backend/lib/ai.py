@@ -21,13 +21,20 @@
 
 from __future__ import annotations
 
+import functools
+import hashlib
+import json
 import logging
+import time
 import traceback
+import weakref
 from typing import (
     Any,
     Callable,
     Dict,
     Generator,
+    Iterable,
+    Iterator,
     List,
     Literal,
     Optional,
@@ -47,15 +54,34 @@ from tenacity import (
 
 from ..model.ai_conv_types import (
     AIFunctionCall,
+    ApiMessagesCache,
     EventNode,
     InterrogationProtocol,
     MessageNode,
+    OpenAIFunctionCallSpec,
     Role,
+    UserExplicitFunctionCall,
+    UserFunctionCallMode,
+    same_functions,
 )
+from .config_generator import compile_field_validators
 from .event_node_manager import BaseEventManager
+from .incremental_json import ArgumentsViolation, IncrementalArgumentsParser
+from .instrumentation import (
+    EventSpan,
+    InstrumentationHooks,
+    MessageSpan,
+    current_event_span,
+    end_event_span,
+    start_event_span,
+)
+from .token_batching import estimate_tokens
 
 logger = logging.getLogger(__name__)
 
+# (function name, argument name, argument value)
+FieldListener = Callable[[Optional[str], str, Any], None]
+
 
 # Requirements
 # 1. All messages will be preserved in the _context variable so we can save them.
@@ -82,11 +108,19 @@ class AIDriver:
 
     3. It also supports Human in Loop messages to be sent to the AI after its response
     using the interrogative_message variable.
+
+    hooks get the EventSpan of every event driver_wrapper drives.
     """
 
-    def __init__(self, ai: AltAI, event_manager: BaseEventManager):
+    def __init__(
+        self,
+        ai: AltAI,
+        event_manager: BaseEventManager,
+        hooks: Optional[InstrumentationHooks] = None,
+    ):
         self._ai = ai
         self._event_manager = event_manager
+        self.hooks = hooks
 
     def drive(
         self, events: List[str]
@@ -136,10 +170,120 @@ class AIDriver:
         return "Done"
 
 
+class ConversationTemplate:
+    """
+    The start of the conversation of every event of a run: the system message
+    and the function spec of the first user message. driver_wrapper puts the
+    same MessageNodes in the history of every event and AltAI sends the API
+    messages built here once, the same objects in every request, so that the
+    requests start with the same bytes and the tokens of the prefix are only
+    estimated once per run.
+    """
+
+    # By id of the system message, for AltAI to find the template of a context.
+    _by_system_message: weakref.WeakValueDictionary[
+        int, ConversationTemplate
+    ] = weakref.WeakValueDictionary()
+
+    def __init__(
+        self,
+        system_message: MessageNode,
+        functions: Optional[List[OpenAIFunctionCallSpec]],
+        explicit_fn_call: Optional[
+            Union[UserExplicitFunctionCall, UserFunctionCallMode]
+        ],
+    ):
+        assert system_message.role == Role.system
+        self.system_message = system_message
+        self.functions = functions
+        self.explicit_fn_call = explicit_fn_call
+        (self.api_system_message,) = EventNode.context_to_openai_api_messages(
+            [system_message]
+        )
+        api_user_message = next(
+            EventNode._last_to_api_messages(  # pylint: disable=protected-access
+                self.user_message("")
+            )
+        )
+        self.api_functions: Optional[List[Dict[str, Any]]] = (
+            api_user_message.get("functions")
+        )
+        self.api_explicit_fn_call = api_user_message.get("explicit_fn_call")
+        self.prefix_tokens = _estimate_prompt_tokens(
+            [self.api_system_message], self.api_functions
+        )
+        # Tells the prefixes apart in the MessageSpans.
+        self.prefix_hash = hashlib.sha256(
+            json.dumps(
+                [
+                    self.api_system_message,
+                    self.api_functions,
+                    self.api_explicit_fn_call,
+                ],
+                sort_keys=True,
+            ).encode("utf-8")
+        ).hexdigest()
+        ConversationTemplate._by_system_message[id(system_message)] = self
+
+    @classmethod
+    def for_event_manager(
+        cls, system_message: MessageNode, event_manager: BaseEventManager
+    ) -> ConversationTemplate:
+        return cls(system_message, *event_manager.get_function_call_spec())
+
+    @classmethod
+    def of(cls, context: List[MessageNode]) -> Optional[ConversationTemplate]:
+        """The template context starts with, if any."""
+        template = cls._by_system_message.get(id(context[0]))
+        if template is None or template.system_message is not context[0]:
+            return None
+        return template
+
+    def user_message(self, content: str) -> MessageNode:
+        return MessageNode(
+            role=Role.user,
+            message_content=content,
+            functions=self.functions,
+            explicit_fn_call=self.explicit_fn_call,  # mypy ignore
+        )
+
+    def api_request(
+        self, context: List[MessageNode], cache: ApiMessagesCache
+    ) -> Optional[
+        Tuple[
+            List[Dict[str, Any]],
+            Optional[List[Dict[str, Any]]],
+            Optional[Union[str, Dict[str, str]]],
+        ]
+    ]:
+        """
+        The API messages, functions and function call of a context that starts
+        with the system message, or None if its last message is not a user
+        message with the functions of the template or none. cache is used for
+        the messages between the first and the last.
+        """
+        last = context[-1]
+        if last.role != Role.user or not (
+            last.functions is None
+            or same_functions(last.functions, self.functions)
+        ):
+            return None
+        context_messages = [self.api_system_message]
+        context_messages.extend(cache.update(context[1:]))
+        context_messages.append(
+            {"role": last.role.name, "content": last.message_content}
+        )
+        if last.functions is None:
+            return context_messages, None, None
+        if last.explicit_fn_call != self.explicit_fn_call:
+            return None
+        return context_messages, self.api_functions, self.api_explicit_fn_call
+
+
 # TODO: consider moving this to be method of AIDriver class
 def driver_wrapper(
     events: List[str],
-    system_message: MessageNode,
+    system_message: Union[MessageNode, ConversationTemplate],
     ai_driver: AIDriver,
     # event_manager manages function calling over AI function calling API and
     # then call function(s) over the responses.
@@ -154,40 +298,49 @@ def driver_wrapper(
     Drives the AIDriver by sending it a System message + User message at first then
     it can send .
     Maintains history of the message linked to the processing of the event.
+
+    Pass a ConversationTemplate made once per run as system_message when
+    calling this for few events at a time.
     """
+    template = (
+        system_message
+        if isinstance(system_message, ConversationTemplate)
+        else ConversationTemplate.for_event_manager(
+            system_message, event_manager
+        )
+    )
     driver_gen = ai_driver.drive(events)
     event_node = driver_gen.send(None)  # type: ignore
+    span: Optional[EventSpan] = None
     while True:
         # Send the system prompt every time.
         try:
             logger.debug(">>")
             assert isinstance(event_node, EventNode), f"{type(event_node)}"
+            span = start_event_span(event_node.raw_event_str)
             # An event is started
             if not event_node.history:
                 event_node.history = []
-            event_node.history.append(system_message)
+            event_node.history.append(template.system_message)
             # The function call should happen if its the last message from the user only.
             # 1. Should a function be called?
 
-            (
-                message_function_call_spec,
-                explicit_fn_call,
-            ) = event_manager.get_function_call_spec()
-            user_message = MessageNode(
-                role=Role.user,
-                message_content=user_message_prompt_fn(event_node),
-                functions=message_function_call_spec,
-                explicit_fn_call=explicit_fn_call,  # mypy ignore
+            message_function_call_spec = template.functions
+            explicit_fn_call = template.explicit_fn_call
+            user_message = template.user_message(
+                user_message_prompt_fn(event_node)
             )
             event_node.history.append(user_message)
 
             logger.debug("PreSend")
 
             ai_message_or_error = driver_gen.send(
-                [system_message, user_message]
+                [template.system_message, user_message]
             )
             if isinstance(ai_message_or_error, ValidationError):
                 # TODO: Handle other types of errors that cannot be retried
+                end_event_span(span, ai_driver.hooks, ai_message_or_error)
+                span = None
                 yield event_node, ai_message_or_error
             else:
                 ai_message = cast(MessageNode, ai_message_or_error)
@@ -266,6 +419,8 @@ def driver_wrapper(
                                 event_node
                             )
                         )
+                end_event_span(span, ai_driver.hooks)
+                span = None
                 yield event_node, None
                 event_node = driver_gen.send(None)  # type: ignore
 
@@ -275,6 +430,10 @@ def driver_wrapper(
             ), f"Expected StopIteration('Done') instead got: `{excinfo}`"
             logger.debug(excinfo)
             break
+        except Exception as exc:
+            if span is not None:
+                end_event_span(span, ai_driver.hooks, exc)
+            raise
 
 
 def _process_ai_function_call_helper(
@@ -282,10 +441,16 @@ def _process_ai_function_call_helper(
     event_node: EventNode,
     event_manager: BaseEventManager,
 ):
-    (
-        event_obj,
-        fn_call_result_str,
-    ) = event_manager.try_call_fn_and_set_event(ai_message)
+    start = time.perf_counter()
+    try:
+        (
+            event_obj,
+            fn_call_result_str,
+        ) = event_manager.try_call_fn_and_set_event(ai_message)
+    finally:
+        span = current_event_span()
+        if span is not None:
+            span.validation_seconds += time.perf_counter() - start
     if event_obj:
         assert event_node.history is not None
         assert ai_message.ai_function_call is not None
@@ -304,9 +469,20 @@ class AltAI:
     """
 
     def __init__(
-        self, model: str = "gpt-3.5-turbo-1106", temperature: float = 0.1
+        self,
+        model: str = "gpt-3.5-turbo-1106",
+        temperature: float = 0.1,
+        hooks: Optional[InstrumentationHooks] = None,
+        field_listener: Optional[FieldListener] = None,
     ):
         self.temperature = temperature
+        # Gets the MessageSpan of every send.
+        self.hooks = hooks
+        # Called with each argument of a function call as soon as it streamed,
+        # before the call is validated, see lib/speculation.py.
+        self.field_listener = field_listener
+        # The context grows by a few messages per send, only convert those.
+        self._api_messages_cache = ApiMessagesCache()
         try:
             openai.Model.retrieve(model)
             logger.info("Using model %s", model)
@@ -325,6 +501,7 @@ class AltAI:
                 List[Dict[str, Any]],
                 Optional[List[Dict[str, Any]]],
                 Optional[Union[str, Dict[str, str]]],
+                Optional[ConversationTemplate],
             ],
             MessageNode,
         ]
@@ -334,8 +511,27 @@ class AltAI:
         """
 
         def wrapper(slf, context: List[MessageNode]):
+            template = ConversationTemplate.of(context)
+            request = (
+                template.api_request(context, slf._api_messages_cache)
+                if template is not None
+                else None
+            )
+            if template is not None and request is not None:
+                context_messages, functions, explicit_fn_call = request
+                return send_fn(  # pylint: disable=not-callable
+                    slf,
+                    context_messages,
+                    functions,
+                    explicit_fn_call,
+                    # Only the whole prefix is counted as one.
+                    template if functions is not None else None,
+                )  # type: ignore
             context_messages = [
-                i for i in EventNode.context_to_openai_api_messages(context)
+                i
+                for i in EventNode.context_to_openai_api_messages(
+                    context, slf._api_messages_cache
+                )
             ]
             functions = None
             explicit_fn_call = None
@@ -356,7 +552,7 @@ class AltAI:
                 )
             try:
                 val = send_fn(  # pylint: disable=not-callable
-                    slf, context_messages, functions, explicit_fn_call
+                    slf, context_messages, functions, explicit_fn_call, None
                 )  # type: ignore
                 return val
             finally:
@@ -371,13 +567,57 @@ class AltAI:
         context_messages: List[Dict[str, Any]],
         functions: Optional[List[Dict[str, Any]]],
         explicit_fn_call: Optional[Union[str, Dict[str, str]]],
+        template: Optional[ConversationTemplate] = None,
     ) -> MessageNode:
-        response = self._try_completion(
-            context_messages,
-            functions=functions,
-            function_call=explicit_fn_call,
+        """
+        template is set when context_messages starts with its system message
+        and functions are its functions, the tokens of those are known.
+        """
+        span = MessageSpan(
+            model=self.model,
+            started_at=time.time(),
+            prompt_tokens=(
+                template.prefix_tokens
+                + _estimate_prompt_tokens(context_messages[1:], None)
+                if template is not None
+                else _estimate_prompt_tokens(context_messages, functions)
+            ),
+            prefix_tokens=template.prefix_tokens if template else 0,
+            prefix_hash=template.prefix_hash if template else None,
         )
-        chat, func_call = _chat_function_call_from_response(response)
+        start = time.perf_counter()
+        try:
+            response = self._try_completion(
+                context_messages,
+                functions=functions,
+                function_call=explicit_fn_call,
+            )
+            span.retries = (
+                completion_with_backoff.retry.statistics.get(
+                    "attempt_number", 1
+                )
+                - 1
+            )
+            chat, func_call = _chat_function_call_from_response(
+                _timed_chunks(response, span, start),
+                functions,
+                self.field_listener,
+            )
+            span.completion_tokens = estimate_tokens(
+                "".join(chat)
+                + (
+                    (func_call["name"] or "") + (func_call["arguments"] or "")
+                    if func_call
+                    else ""
+                )
+            )
+            span.function_call = func_call["name"] if func_call else None
+        except Exception as exc:
+            span.error = repr(exc)
+            raise
+        finally:
+            span.total_seconds = time.perf_counter() - start
+            self._end_message_span(span)
 
         logger.debug("")
         logger.debug("Chat completion finished.")
@@ -393,6 +633,14 @@ class AltAI:
             ),
         )
 
+    def _end_message_span(self, span: MessageSpan) -> None:
+        event = current_event_span()
+        if event is not None:
+            span.event_id = event.event_id
+            event.messages.append(span)
+        if self.hooks is not None:
+            self.hooks.on_message(span)
+
     def _try_completion(
         self,
         messages: list[dict[str, str]],
@@ -428,11 +676,83 @@ class AltAI:
         return response
 
 
+def _estimate_prompt_tokens(
+    context_messages: List[Dict[str, Any]],
+    functions: Optional[List[Dict[str, Any]]],
+) -> int:
+    return estimate_tokens(
+        "".join(
+            str(message.get("content") or "")
+            + str(message.get("function_call") or "")
+            for message in context_messages
+        )
+        + (json.dumps(functions) if functions else "")
+    )
+
+
+def _timed_chunks(
+    response: Iterable[Any], span: MessageSpan, start: float
+) -> Iterator[Any]:
+    first = last = None
+    try:
+        for chunk in response:
+            last = time.perf_counter()
+            if first is None:
+                first = last
+                span.time_to_first_token = first - start
+            yield chunk
+    finally:
+        _close_stream(response)
+        if first is not None and last is not None:
+            span.stream_seconds = last - first
+
+
+def _close_stream(response: Iterable[Any]) -> None:
+    close = getattr(response, "close", None)
+    if callable(close):
+        close()
+
+
+@functools.lru_cache(maxsize=32)
+def _field_validators(
+    parameters_json: str,
+) -> Tuple[Dict[str, Callable[[Any], Any]], bool]:
+    parameters = json.loads(parameters_json)
+    return (
+        compile_field_validators(parameters),
+        parameters.get("additionalProperties", True) is not False,
+    )
+
+
+def _arguments_parser(
+    functions: Optional[List[Dict[str, Any]]], name: Optional[str]
+) -> IncrementalArgumentsParser:
+    """Checks the arguments against the schema of the called function."""
+    for function in functions or []:
+        if function.get("name") == name and "parameters" in function:
+            field_validators, allow_unknown_fields = _field_validators(
+                json.dumps(function["parameters"], sort_keys=True)
+            )
+            return IncrementalArgumentsParser(
+                field_validators, allow_unknown_fields
+            )
+    return IncrementalArgumentsParser()
+
+
 def _chat_function_call_from_response(
     response,
+    functions: Optional[List[Dict[str, Any]]] = None,
+    on_field: Optional[FieldListener] = None,
 ) -> Tuple[List[str], Optional[Dict[str, Optional[str]]]]:
+    """
+    The chat and function call streamed in response. The function call's
+    arguments are checked against its schema in functions as they stream, the
+    stream is closed at the first violation which raises a ValidationError
+    like malformed arguments do. Arguments that passed are given to on_field.
+    """
     chat: List[str] = []
     func_call = None
+    parser: Optional[IncrementalArgumentsParser] = None
     for chunk in response:
         try:
             delta = chunk["choices"][0]["delta"]
@@ -450,14 +770,42 @@ def _chat_function_call_from_response(
                 if "name" in delta.function_call:
                     func_call["name"] = delta.function_call["name"]
                 if "arguments" in delta.function_call:
-                    func_call["arguments"] += delta.function_call["arguments"]
+                    if parser is None:
+                        parser = _arguments_parser(functions, func_call["name"])
+                    fields = parser.feed(delta.function_call["arguments"])
+                    if on_field is not None:
+                        for field, value in fields:
+                            on_field(func_call["name"], field, value)
             if "content" in delta:
                 # Key may be there but None
                 msg = delta.get("content", "") or ""
                 chat.append(msg)
+        except ArgumentsViolation as exc:
+            assert func_call is not None and parser is not None
+            _close_stream(response)
+            logger.warning(
+                "Stopped the stream of %s after %d characters of arguments: %s",
+                func_call["name"],
+                len(parser.text()),
+                exc,
+            )
+            raise ValidationError.from_exception_data(
+                AIFunctionCall.__name__,
+                [
+                    {
+                        "type": "value_error",
+                        "loc": ("arguments",)
+                        + ((exc.field,) if exc.field else ()),
+                        "input": parser.text(),
+                        "ctx": {"error": exc},
+                    }
+                ],
+            ) from exc
         except Exception as exc:
             logger.error("Error %s for chunk: %s", chunk, exc)
             raise exc
+    if func_call and parser is not None:
+        func_call["arguments"] = parser.text()
     logger.debug("Chat: %s", chat)
     return chat, func_call
 
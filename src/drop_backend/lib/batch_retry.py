@@ -0,0 +1,119 @@
+"""
+Recovery of batches of items sent to the AI together, where one bad item
+fails the whole batch: failed batches are split in halves and retried
+concurrently until the bad items are alone, within a budget of extra calls.
+"""
+
+import logging
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from enum import Enum
+from typing import Callable, Dict, List, Optional, Set, Tuple, TypeVar
+
+from .token_batching import TokenBatch
+
+logger = logging.getLogger(__name__)
+
+ResultT = TypeVar("ResultT")
+
+
+class ItemStatus(str, Enum):
+    tagged = "tagged"
+    failed = "failed"
+
+
+@dataclass
+class ItemOutcome:
+    status: ItemStatus
+    # AI calls the item was part of.
+    attempts: int
+    failure_reason: Optional[str] = None
+
+
+@dataclass
+class _Retry:
+    batch: TokenBatch
+    # Whether the batch already failed with only this item.
+    alone: bool
+
+
+def retry_by_bisection(  # pylint: disable=too-many-locals
+    failed: List[Tuple[TokenBatch, str]],
+    attempt: Callable[[TokenBatch], ResultT],
+    on_result: Callable[[TokenBatch, ResultT], Set[str]],
+    outcomes: Dict[str, ItemOutcome],
+    retry_budget: int,
+    max_workers: int = 4,
+) -> int:
+    """
+    Retries the failed (batch, failure reason) pairs. A failed batch is split
+    in halves that are retried concurrently, a single item is retried once by
+    itself. attempt(batch) runs on the worker threads and raises if the batch
+    failed. on_result(batch, result), on the calling thread, stores a result
+    and returns the keys it covered, keys it did not cover are retried like a
+    failed batch.
+
+    outcomes(key -> outcome, attempts counted so far) is updated for every key
+    of the failed batches. Each retried batch costs one of retry_budget, items
+    that are left when it is spent fail. Returns the number of retries.
+    """
+    budget = retry_budget
+    num_retries = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        running: Dict[Future, _Retry] = {}
+
+        def _fail(batch: TokenBatch, reason: str, alone: bool) -> None:
+            nonlocal budget
+            for key in batch.items:
+                outcome = outcomes.setdefault(
+                    key, ItemOutcome(ItemStatus.failed, attempts=0)
+                )
+                outcome.status = ItemStatus.failed
+                outcome.failure_reason = reason
+            if len(batch.items) > 1:
+                retries = [_Retry(half, alone=False) for half in batch.halves()]
+            elif not alone:
+                retries = [_Retry(batch, alone=True)]
+            else:
+                # Isolated.
+                return
+            for retry in retries:
+                if budget <= 0:
+                    logger.warning(
+                        "Retry budget spent, %s failed: %s",
+                        ", ".join(retry.batch.items),
+                        reason,
+                    )
+                    continue
+                budget -= 1
+                running[pool.submit(attempt, retry.batch)] = retry
+
+        for batch, reason in failed:
+            _fail(batch, reason, alone=False)
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                retry = running.pop(future)
+                batch = retry.batch
+                num_retries += 1
+                for key in batch.items:
+                    outcomes[key].attempts += 1
+                try:
+                    covered = on_result(batch, future.result())
+                except Exception as error:  # pylint: disable=broad-except
+                    logger.warning(
+                        "Retry of %s failed: %s", ", ".join(batch.items), error
+                    )
+                    _fail(batch, str(error), retry.alone)
+                    continue
+                for key in covered & batch.items.keys():
+                    outcomes[key].status = ItemStatus.tagged
+                    outcomes[key].failure_reason = None
+                missing = [key for key in batch.items if key not in covered]
+                if missing:
+                    _fail(
+                        batch.subset(missing),
+                        "Not tagged by the AI",
+                        retry.alone,
+                    )
+    return num_retries
@@ -41,7 +41,9 @@ import os
 import re
 from pathlib import Path
 from types import ModuleType
-from typing import Tuple
+from typing import Any, Callable, Dict, Tuple
+
+import fastjsonschema  # type: ignore
 
 from ..types.base import CreatorBase
 
@@ -105,7 +107,9 @@ def {type_module_name}_function_call_param() -> Tuple[List[OpenAIFunctionCallSpe
         # TODO: Also support "auto" and "none"
         UserExplicitFunctionCall(name="{default_fn_name}"),
     )
-"""
+""" + _arguments_validator_code(
+        type_module_name, schema_function_name
+    )
 
     # Compile the function code
     assert schema_module.__file__ is not None
@@ -117,6 +121,21 @@ def {type_module_name}_function_call_param() -> Tuple[List[OpenAIFunctionCallSpe
     return importlib.reload(schema_module)
 
 
+def _arguments_validator_code(
+    type_module_name: str, schema_function_name: str
+) -> str:
+    return f"""
+import functools
+from typing import Any, Callable, Dict
+
+from drop_backend.lib.config_generator import compile_arguments_validator
+
+@functools.lru_cache(maxsize=None)
+def {type_module_name}_arguments_validator() -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+    return compile_arguments_validator({schema_function_name}())
+"""
+
+
 def gen_schema(
     type_name: str,
     schema_directory_prefix: str,
@@ -195,10 +214,15 @@ def validate_schema(type_name: str, type_module_prefix: str):
     """Decorator to validate the JSON schema against the model's schema."""
 
     def _deco(func):
+        # (type class, stored schema) -> validated schema. Generating and
+        # comparing the schema is done once per process for each version of the
+        # type; reloading the type module creates a new class and revalidates.
+        validated: Dict[Tuple[Any, str], str] = {}
+
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
             # Call the original function to get the stored schema
-            stored_schema = json.loads(func(*args, **kwargs))
+            stored_schema_str = func(*args, **kwargs)
 
             # Dynamically get the type's module and class.
             # FIXME: this is brittle to change in naming convention.
@@ -207,6 +231,10 @@ def validate_schema(type_name: str, type_module_prefix: str):
                 f"{type_module_prefix}.{module_name}"
             )
             type_class = getattr(type_module, type_name)
+            key = (type_class, stored_schema_str)
+            if key in validated:
+                return validated[key]
+            stored_schema = json.loads(stored_schema_str)
 
             # Generate the current schema from the model
             current_schema = type_class.model_json_schema(by_alias=False)
@@ -217,13 +245,86 @@ def validate_schema(type_name: str, type_module_prefix: str):
                     f"The schema for {type_name} has changed!"
                 )
 
-            return json.dumps(stored_schema)
+            validated[key] = json.dumps(stored_schema)
+            return validated[key]
 
         return wrapper
 
     return _deco
 
 
+# String formats are left to the model's own validators which are more lenient,
+# e.g. CityEvent.parse_time_format.
+_UNCHECKED_FORMATS = {
+    string_format: lambda _: True
+    for string_format in ("date", "time", "date-time")
+}
+
+
+# Pydantic's lax mode coerces other scalars to these types, e.g. "true", 1 and
+# "yes" to a bool and timestamps to dates, so the validators accept any scalar
+# for them and leave the coercion to the model.
+_LAX_TYPES = {"boolean", "integer", "number"}
+_SCALAR_TYPES = ["boolean", "integer", "number", "string"]
+
+
+def _lax_schema(schema: Any) -> Any:
+    """schema with the types pydantic coerces to widened to any scalar."""
+    if isinstance(schema, list):
+        return [_lax_schema(item) for item in schema]
+    if not isinstance(schema, dict):
+        return schema
+    lax = {key: _lax_schema(value) for key, value in schema.items()}
+    schema_type = lax.get("type")
+    types = (
+        set(schema_type)
+        if isinstance(schema_type, list)
+        else {schema_type} if isinstance(schema_type, str) else set()
+    )
+    string_format = lax.get("format")
+    if types & _LAX_TYPES or (
+        isinstance(string_format, str) and string_format in _UNCHECKED_FORMATS
+    ):
+        lax["type"] = sorted(types | set(_SCALAR_TYPES))
+    return lax
+
+
+def compile_arguments_validator(
+    schema: str,
+) -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Compile the stored JSON schema of a type into a validator for the
+    AI's function call arguments. EventManager runs it to reject malformed
+    arguments before constructing the model, it is never stricter than the
+    model. It raises fastjsonschema.JsonSchemaValueException, a ValueError.
+    """
+    return fastjsonschema.compile(
+        _lax_schema(json.loads(schema)), formats=_UNCHECKED_FORMATS
+    )
+
+
+def compile_field_validators(
+    parameters: Dict[str, Any],
+) -> Dict[str, Callable[[Any], Any]]:
+    """
+    Like compile_arguments_validator but a validator per property of the
+    parameters' JSON schema, to check the arguments one at a time while they
+    are streamed.
+    """
+    parameters = _lax_schema(parameters)
+    definitions = {
+        key: parameters[key]
+        for key in ("$defs", "definitions")
+        if key in parameters
+    }
+    return {
+        name: fastjsonschema.compile(
+            {**definitions, **property_schema}, formats=_UNCHECKED_FORMATS
+        )
+        for name, property_schema in parameters.get("properties", {}).items()
+    }
+
+
 def check_should_update_schema(
     type_name: str,
     schema_directory_prefix: str,
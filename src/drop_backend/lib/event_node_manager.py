@@ -1,16 +1,30 @@
 import importlib
 import logging
 from abc import ABC, abstractmethod
-from typing import Any, Callable, Dict, List, Optional, Tuple, Union, cast
+from dataclasses import dataclass
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    Union,
+    cast,
+)
 
+import fastjsonschema  # type: ignore
 from colorama import Fore  # type: ignore
-from pydantic import BaseModel  # type: ignore
+from pydantic import ValidationError
 
 from ..model.ai_conv_types import (
     EventNode,
     MessageNode,
     OpenAIFunctionCallSpec,
     UserExplicitFunctionCall,
+    UserFunctionCallMode,
 )
 from ..types.base import CreatorBase
 from ..utils.cli_utils import _optionally_format_colorama, formatted_dict
@@ -18,6 +32,55 @@ from .config_generator import camel_to_snake
 
 logger = logging.getLogger(__name__)
 
+_FunctionCallSpec = Tuple[
+    Optional[List[OpenAIFunctionCallSpec]],
+    Optional[Union[UserExplicitFunctionCall, UserFunctionCallMode]],
+]
+# Generated *_function_call_param function -> its result. Reloading the schema
+# module creates new functions, so regenerated schemas are picked up.
+_function_call_spec_cache: Dict[
+    Callable[[], _FunctionCallSpec], _FunctionCallSpec
+] = {}
+
+
+def _validate_arguments(
+    validator: Callable[[Dict[str, Any]], Dict[str, Any]],
+    type_name: str,
+    kwargs: Dict[str, Any],
+) -> None:
+    """
+    Raises the validator's error as a ValidationError, like the model would,
+    so that callers handle both the same way.
+    """
+    try:
+        validator(kwargs)
+    except fastjsonschema.JsonSchemaValueException as exc:
+        raise ValidationError.from_exception_data(
+            type_name,
+            [
+                {
+                    "type": "value_error",
+                    # The first item of the path is the arguments object.
+                    "loc": tuple(exc.path[1:]),
+                    "input": exc.value,
+                    "ctx": {"error": exc.message},
+                }
+            ],
+        ) from exc
+
+
+@dataclass
+class _RegisteredType:
+    type_name: str
+    type_module_prefix: str
+    schema_module_prefix: str
+    # Set when the modules are imported on first use.
+    event_obj_type: Optional[Type[CreatorBase]] = None
+    function_call_spec: Optional[Callable[[], _FunctionCallSpec]] = None
+    arguments_validator: Optional[
+        Callable[[], Callable[[Dict[str, Any]], Dict[str, Any]]]
+    ] = None
+
 
 class BaseEventManager(ABC):
     """
@@ -30,12 +93,17 @@ class BaseEventManager(ABC):
         )
         return self._event_node
 
+    @property
+    def event_node(self) -> Optional[EventNode]:
+        """The node create_event_node made last, e.g. of an event that failed."""
+        return getattr(self, "_event_node", None)
+
     @abstractmethod
     def get_function_call_spec(
         self,
     ) -> Tuple[
         Optional[List[OpenAIFunctionCallSpec]],
-        Optional[UserExplicitFunctionCall],
+        Optional[Union[UserExplicitFunctionCall, UserFunctionCallMode]],
     ]:
         ...
 
@@ -81,67 +149,125 @@ class EventManager(BaseEventManager):
     OpenAI specfic event manager. Reads our codegenned JSON Schema and creates
     the appropriate objects for API call; calls functions by name in our defined
     pydantic objects per types.base.CreatorBase.
+
+    Several types can be registered so that one conversation can extract more
+    than one kind of object, the AI picks the function to call. The event node's
+    event_obj is the last object created.
     """
 
     def __init__(
         self,
-        type_name: Optional[str] = None,
+        type_name: Optional[Union[str, Sequence[str]]] = None,
         type_module_prefix: Optional[str] = None,
         schema_module_prefix: Optional[str] = None,
     ):
-        # TODO: make type_name be a list so one of many functions can be called.
-        self.no_function_spec: bool = False
-        if not type_name:
+        """
+        type_name is one or more CreatorBase types, all under type_module_prefix
+        with their generated schema under schema_module_prefix. More types, from
+        other packages, can be added with register(). The modules are imported
+        on first use.
+        """
+        self._registered_types: Dict[str, _RegisteredType] = {}
+        # The default_fn_name of each resolved type -> the type.
+        self._types_by_fn_name: Dict[str, _RegisteredType] = {}
+        type_names = (
+            [type_name] if isinstance(type_name, str) else list(type_name or [])
+        )
+        self.no_function_spec: bool = not type_names
+        if not type_names:
             logger.warning(
                 "No type name provided. Not generating function call spec."
             )
-            self._function_call_spec: Callable[
-                [],
-                Tuple[List[OpenAIFunctionCallSpec], UserExplicitFunctionCall],
-            ] = lambda: (  # type: ignore
-                None,
-                None,
-            )
-            self.no_function_spec = True
             return
-        schema_module = importlib.import_module(
-            f"{schema_module_prefix}.{camel_to_snake(type_name)}_schema"
+        assert type_module_prefix and schema_module_prefix
+        for name in type_names:
+            self.register(name, type_module_prefix, schema_module_prefix)
+
+    def register(
+        self,
+        type_name: str,
+        type_module_prefix: str,
+        schema_module_prefix: str,
+    ) -> None:
+        if type_name in self._registered_types:
+            raise ValueError(f"{type_name} is already registered")
+        self._registered_types[type_name] = _RegisteredType(
+            type_name, type_module_prefix, schema_module_prefix
         )
+        self.no_function_spec = False
 
+    def _resolve(self, registered: _RegisteredType) -> _RegisteredType:
+        if registered.event_obj_type is not None:
+            return registered
+        type_name = registered.type_name
+        type_module_name = camel_to_snake(type_name)
+        schema_module = importlib.import_module(
+            f"{registered.schema_module_prefix}.{type_module_name}_schema"
+        )
         try:
-            self._function_call_spec: Callable[  # type: ignore
-                [],
-                Tuple[List[OpenAIFunctionCallSpec], UserExplicitFunctionCall],
-            ] = getattr(
+            function_call_spec = getattr(
                 schema_module,
-                f"{camel_to_snake(type_name)}_function_call_param",
+                f"{type_module_name}_function_call_param",
             )
         except AttributeError as exc:
             raise ValueError(
-                f"Could not find function call spec for {type_name} in {schema_module_prefix}"
+                f"Could not find function call spec for {type_name} in {registered.schema_module_prefix}"
             ) from exc
+        # Schema modules generated before the validator existed don't have it.
+        arguments_validator = getattr(
+            schema_module, f"{type_module_name}_arguments_validator", None
+        )
 
-        type_module_name = camel_to_snake(type_name)
         type_module = importlib.import_module(
-            f"{type_module_prefix}.{type_module_name}"
+            f"{registered.type_module_prefix}.{type_module_name}"
         )
         try:
-            self._event_obj_type: Union[CreatorBase, BaseModel] = getattr(
-                type_module, type_name
-            )
+            event_obj_type = getattr(type_module, type_name)
         except AttributeError as exc:
             raise ValueError(
                 f"Could not find event object type for {type_name} in {type_module_name}"
             ) from exc
+        fn_name = event_obj_type.default_fn_name()
+        if fn_name in self._types_by_fn_name:
+            raise ValueError(
+                f"{type_name} and {self._types_by_fn_name[fn_name].type_name} "
+                f"are both created by {fn_name}"
+            )
+        registered.function_call_spec = function_call_spec
+        registered.arguments_validator = arguments_validator
+        registered.event_obj_type = event_obj_type
+        self._types_by_fn_name[fn_name] = registered
+        return registered
 
     def get_function_call_spec(
         self,
     ) -> Tuple[
         Optional[List[OpenAIFunctionCallSpec]],
-        Optional[UserExplicitFunctionCall],
+        Optional[Union[UserExplicitFunctionCall, UserFunctionCallMode]],
     ]:
-        # from code gen'ned module
-        return self._function_call_spec()
+        if self.no_function_spec:
+            return None, None
+        specs: List[OpenAIFunctionCallSpec] = []
+        explicit_fn_call: Optional[
+            Union[UserExplicitFunctionCall, UserFunctionCallMode]
+        ] = None
+        for registered in self._registered_types.values():
+            function_call_spec = self._resolve(registered).function_call_spec
+            assert function_call_spec is not None
+            # from code gen'ned module, built once per process.
+            if function_call_spec not in _function_call_spec_cache:
+                _function_call_spec_cache[function_call_spec] = (
+                    function_call_spec()
+                )
+            type_specs, explicit_fn_call = _function_call_spec_cache[
+                function_call_spec
+            ]
+            # A copy, so callers can't change the cached lists.
+            specs.extend(type_specs or [])
+        if len(self._registered_types) > 1:
+            # Let the AI pick which of the types to create.
+            explicit_fn_call = UserFunctionCallMode.auto
+        return specs, explicit_fn_call
 
     def extract_fn_name(self, ai_message: MessageNode) -> Optional[str]:
         if ai_message.ai_function_call is None:
@@ -166,23 +292,39 @@ class EventManager(BaseEventManager):
         return False
 
     def call_fn_by_name(self, fn_name: str, *args, **kwargs) -> Tuple[Any, str]:
-        evt_obj_type = cast(CreatorBase, self._event_obj_type)
+        registered = self._types_by_fn_name.get(fn_name)
+        if registered is None:
+            for unresolved in self._registered_types.values():
+                self._resolve(unresolved)
+            registered = self._types_by_fn_name.get(fn_name)
+        if registered is None:
+            raise AttributeError(
+                f"Function {fn_name} not supported for {list(self._registered_types)}"
+            )
+        evt_obj_type = cast(CreatorBase, registered.event_obj_type)
+        if registered.arguments_validator is not None:
+            # Rejects malformed arguments without constructing the model.
+            _validate_arguments(
+                registered.arguments_validator(), registered.type_name, kwargs
+            )
         event_obj = evt_obj_type.create(function_name=fn_name, **kwargs)
 
         self._event_node._event_obj = (  # pylint: disable=protected-access
             event_obj
         )
-        logger.debug(
-            _optionally_format_colorama("Parsed event:", True, Fore.RED)
-        )
-        logger.debug(
-            "\n".join(
-                [
-                    f"{k}: {str(v)} ({type(v)})"
-                    for k, v in formatted_dict((event_obj.model_dump())).items()  # type: ignore
-                ]
+        if logger.isEnabledFor(logging.DEBUG):
+            # Formatting the whole event is costly, skip it unless it is logged.
+            logger.debug(
+                _optionally_format_colorama("Parsed event:", True, Fore.RED)
+            )
+            logger.debug(
+                "\n".join(
+                    [
+                        f"{k}: {str(v)} ({type(v)})"
+                        for k, v in formatted_dict((event_obj.model_dump())).items()  # type: ignore
+                    ]
+                )
             )
-        )
         # The object returned by the function must have a reasonable __str__ to be useful.
         k_v = ", ".join(f"{k}={repr(v)}" for k, v in dict(event_obj).items())  # type: ignore
         return event_obj, f"{fn_name}({k_v})"
@@ -0,0 +1,159 @@
+"""
+Incremental parsing of the JSON object of a function call's arguments while
+the AI streams it. The members of the object are parsed and validated one by
+one as soon as they complete, so a malformed call is found at the first bad
+member instead of after the whole completion.
+"""
+
+import json
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+FieldValidator = Callable[[Any], Any]
+
+# Characters that change the state of the scanner, in and out of strings.
+_IN_STRING = re.compile(r'["\\]')
+_OUT_OF_STRING = re.compile(r'[{}\[\]",]')
+_NOT_WHITESPACE = re.compile(r"\S")
+
+
+class ArgumentsViolation(ValueError):
+    """The arguments can not be valid anymore, whatever the AI sends next."""
+
+    def __init__(self, reason: str, field: Optional[str] = None):
+        super().__init__(reason if field is None else f"{field}: {reason}")
+        self.reason = reason
+        self.field = field
+
+
+class IncrementalArgumentsParser:
+    """
+    Fed the fragments of a JSON object, returns each top level member(a key
+    and its value) once it is complete and passes the validator of its key.
+    Raises ArgumentsViolation on the first fragment that makes the object
+    invalid: text other than an object, malformed members, a key without a
+    validator unless allow_unknown_fields or a value its validator rejects.
+
+    The fragments are kept in lists and joined once, text() is the
+    arguments so far.
+    """
+
+    def __init__(
+        self,
+        field_validators: Optional[Dict[str, FieldValidator]] = None,
+        allow_unknown_fields: bool = True,
+    ):
+        self._field_validators = field_validators or {}
+        self._allow_unknown_fields = allow_unknown_fields
+        self._fragments: List[str] = []
+        # Of the member being streamed.
+        self._member: List[str] = []
+        self._started = False
+        self._done = False
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self.fields: Dict[str, Any] = {}
+
+    @property
+    def done(self) -> bool:
+        """If the object was closed."""
+        return self._done
+
+    def text(self) -> str:
+        if len(self._fragments) > 1:
+            self._fragments = ["".join(self._fragments)]
+        return self._fragments[0] if self._fragments else ""
+
+    def feed(self, fragment: str) -> List[Tuple[str, Any]]:
+        """The members that fragment completed."""
+        self._fragments.append(fragment)
+        completed: List[Tuple[str, Any]] = []
+        # Where the part of fragment in the current member starts.
+        member_start = 0
+        i = 0
+        end = len(fragment)
+        while i < end:
+            if self._done:
+                if _NOT_WHITESPACE.search(fragment, i):
+                    raise ArgumentsViolation("Text after the object")
+                return completed
+            if not self._started:
+                match = _NOT_WHITESPACE.search(fragment, i)
+                if match is None:
+                    return completed
+                if match.group() != "{":
+                    raise ArgumentsViolation("Not an object")
+                self._started = True
+                self._depth = 1
+                i = member_start = match.end()
+                continue
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                    i += 1
+                    continue
+                match = _IN_STRING.search(fragment, i)
+                if match is None:
+                    break
+                if match.group() == "\\":
+                    self._escaped = True
+                else:
+                    self._in_string = False
+                i = match.end()
+                continue
+            match = _OUT_OF_STRING.search(fragment, i)
+            if match is None:
+                break
+            char = match.group()
+            i = match.end()
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    if char != "}":
+                        raise ArgumentsViolation("Malformed object")
+                    self._done = True
+                    self._member.append(fragment[member_start : i - 1])
+                    member = self._end_member(closing=True)
+                    if member is not None:
+                        completed.append(member)
+            elif self._depth == 1:
+                # A comma between members.
+                self._member.append(fragment[member_start : i - 1])
+                member = self._end_member(closing=False)
+                assert member is not None
+                completed.append(member)
+                member_start = i
+        if not self._done:
+            self._member.append(fragment[member_start:])
+        return completed
+
+    def _end_member(self, closing: bool) -> Optional[Tuple[str, Any]]:
+        text = "".join(self._member)
+        self._member = []
+        if closing and not self.fields and not text.strip():
+            # {}
+            return None
+        try:
+            member = json.loads("{" + text + "}")
+        except json.JSONDecodeError as exc:
+            raise ArgumentsViolation(f"Malformed member {text!r}") from exc
+        if len(member) != 1:
+            raise ArgumentsViolation(f"Malformed member {text!r}")
+        ((key, value),) = member.items()
+        if key in self.fields:
+            raise ArgumentsViolation("Repeated", key)
+        validator = self._field_validators.get(key)
+        if validator is not None:
+            try:
+                validator(value)
+            except ValueError as exc:
+                raise ArgumentsViolation(str(exc), key) from exc
+        elif not self._allow_unknown_fields:
+            raise ArgumentsViolation("Not in the schema", key)
+        self.fields[key] = value
+        return key, value
@@ -0,0 +1,267 @@
+"""
+Span like records of the AI calls, to see where the time and tokens of a run
+go. AltAI records a MessageSpan per call to the AI and driver_wrapper an
+EventSpan per event, with the MessageSpans sent for it, and both hand them to
+the InstrumentationHooks of the run. RunStats is the default hooks that
+aggregates them into counters and histograms for a summary of the run.
+
+OpenAI does not send the token usage of streamed completions, so token counts
+are estimates, see token_batching.estimate_tokens.
+"""
+
+import contextvars
+import itertools
+import json
+import logging
+import threading
+import time
+from abc import abstractmethod
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class MessageSpan:
+    """A call to the AI, from the request until the stream ended."""
+
+    model: str
+    # Epoch seconds.
+    started_at: float
+    event_id: Optional[int] = None
+    # Until the first chunk of the stream, the retries included.
+    time_to_first_token: Optional[float] = None
+    # First to last chunk of the stream.
+    stream_seconds: float = 0.0
+    total_seconds: float = 0.0
+    prompt_tokens: int = 0
+    # Of prompt_tokens, those of a prefix sent with every request of the run,
+    # see lib.ai.ConversationTemplate, and the hash of that prefix.
+    prefix_tokens: int = 0
+    prefix_hash: Optional[str] = None
+    completion_tokens: int = 0
+    # Of the request, by completion_with_backoff.
+    retries: int = 0
+    function_call: Optional[str] = None
+    error: Optional[str] = None
+
+
+@dataclass
+class EventSpan:
+    """An event, from its first message to the AI until it was validated."""
+
+    # Unique in the process.
+    event_id: int
+    # The first line of the raw event.
+    title: str
+    started_at: float
+    total_seconds: float = 0.0
+    # Validating the AI's function calls into the event.
+    validation_seconds: float = 0.0
+    messages: List[MessageSpan] = field(default_factory=list)
+    error: Optional[str] = None
+    # perf_counter() at the start.
+    start: float = field(default=0.0, repr=False)
+
+    @property
+    def prompt_tokens(self) -> int:
+        return sum(message.prompt_tokens for message in self.messages)
+
+    @property
+    def completion_tokens(self) -> int:
+        return sum(message.completion_tokens for message in self.messages)
+
+    @property
+    def retries(self) -> int:
+        return sum(message.retries for message in self.messages)
+
+
+class InstrumentationHooks:
+    """Called on the thread that made the span, hooks shared by threads lock."""
+
+    @abstractmethod
+    def on_message(self, span: MessageSpan) -> None: ...
+
+    @abstractmethod
+    def on_event(self, span: EventSpan) -> None: ...
+
+
+# The event driver_wrapper is working on in this thread, for the MessageSpans
+# AltAI records while it does.
+_current_event: contextvars.ContextVar[Optional[EventSpan]] = (
+    contextvars.ContextVar("current_event", default=None)
+)
+
+
+def current_event_span() -> Optional[EventSpan]:
+    return _current_event.get()
+
+
+_event_ids = itertools.count()
+
+
+def start_event_span(raw_event: str) -> EventSpan:
+    """Starts the span of an event and makes it current."""
+    span = EventSpan(
+        event_id=next(_event_ids),
+        title=raw_event.strip().split("\n", 1)[0][:80],
+        started_at=time.time(),
+    )
+    span.start = time.perf_counter()
+    _current_event.set(span)
+    return span
+
+
+def end_event_span(
+    span: EventSpan,
+    hooks: Optional[InstrumentationHooks],
+    error: Optional[BaseException] = None,
+) -> None:
+    span.total_seconds = time.perf_counter() - span.start
+    if error is not None:
+        span.error = repr(error)
+    # Not reset() with a token, the generators that drive events can be
+    # resumed from another context.
+    _current_event.set(None)
+    if hooks is not None:
+        hooks.on_event(span)
+
+
+class Histogram:
+    """Keeps the values, runs are at most 100ks of events."""
+
+    def __init__(self) -> None:
+        self._values: List[float] = []
+
+    def add(self, value: float) -> None:
+        self._values.append(value)
+
+    def summary(self) -> Dict[str, Optional[float]]:
+        values = sorted(self._values)
+        if not values:
+            return {"count": 0}
+
+        def _percentile(percentile: float) -> float:
+            return values[round(percentile / 100 * (len(values) - 1))]
+
+        return {
+            "count": len(values),
+            "sum": sum(values),
+            "mean": sum(values) / len(values),
+            "p50": _percentile(50),
+            "p90": _percentile(90),
+            "p99": _percentile(99),
+            "max": values[-1],
+        }
+
+
+class RunStats(InstrumentationHooks):
+    """Counters and histograms of the spans of a run."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self.counters: Dict[str, int] = {
+            "events": 0,
+            "failed_events": 0,
+            "messages": 0,
+            "failed_messages": 0,
+            "function_calls": 0,
+            "retries": 0,
+            "prompt_tokens": 0,
+            # Of the distinct prefixes of the prompts, each counted once.
+            "prefix_tokens": 0,
+            "completion_tokens": 0,
+        }
+        self._prefix_hashes: Set[str] = set()
+        self.histograms: Dict[str, Histogram] = {
+            name: Histogram()
+            for name in (
+                "time_to_first_token",
+                "stream_seconds",
+                "message_seconds",
+                "validation_seconds",
+                "event_seconds",
+                "event_prompt_tokens",
+                "event_completion_tokens",
+            )
+        }
+
+    def on_message(self, span: MessageSpan) -> None:
+        with self._lock:
+            self.counters["messages"] += 1
+            self.counters["failed_messages"] += span.error is not None
+            self.counters["function_calls"] += span.function_call is not None
+            self.counters["retries"] += span.retries
+            self.counters["prompt_tokens"] += span.prompt_tokens
+            if (
+                span.prefix_hash is not None
+                and span.prefix_hash not in self._prefix_hashes
+            ):
+                self._prefix_hashes.add(span.prefix_hash)
+                self.counters["prefix_tokens"] += span.prefix_tokens
+            self.counters["completion_tokens"] += span.completion_tokens
+            if span.time_to_first_token is not None:
+                self.histograms["time_to_first_token"].add(
+                    span.time_to_first_token
+                )
+            self.histograms["stream_seconds"].add(span.stream_seconds)
+            self.histograms["message_seconds"].add(span.total_seconds)
+
+    def on_event(self, span: EventSpan) -> None:
+        with self._lock:
+            self.counters["events"] += 1
+            self.counters["failed_events"] += span.error is not None
+            self.histograms["validation_seconds"].add(span.validation_seconds)
+            self.histograms["event_seconds"].add(span.total_seconds)
+            self.histograms["event_prompt_tokens"].add(span.prompt_tokens)
+            self.histograms["event_completion_tokens"].add(
+                span.completion_tokens
+            )
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "wall_seconds": time.perf_counter() - self._started,
+                "counters": dict(self.counters),
+                "histograms": {
+                    name: histogram.summary()
+                    for name, histogram in self.histograms.items()
+                },
+            }
+
+    def log_summary(self) -> None:
+        summary = self.summary()
+        counters = summary["counters"]
+        histograms = summary["histograms"]
+
+        def _p50_p99(name: str) -> str:
+            histogram = histograms[name]
+            if not histogram["count"]:
+                return "-"
+            return f"{histogram['p50']:.3f}s/{histogram['p99']:.3f}s"
+
+        logger.info(
+            "%d events(%d failed) in %.1fs, %d AI calls(%d failed, %d "
+            "retries), ~%d prompt(~%d in prefixes shared by the requests) and "
+            "~%d completion tokens. p50/p99 time to "
+            "first token %s, stream %s, validation %s, event %s",
+            counters["events"],
+            counters["failed_events"],
+            summary["wall_seconds"],
+            counters["messages"],
+            counters["failed_messages"],
+            counters["retries"],
+            counters["prompt_tokens"],
+            counters["prefix_tokens"],
+            counters["completion_tokens"],
+            _p50_p99("time_to_first_token"),
+            _p50_p99("stream_seconds"),
+            _p50_p99("validation_seconds"),
+            _p50_p99("event_seconds"),
+        )
+
+    def dump(self, path: Path) -> None:
+        path.write_text(json.dumps(self.summary(), indent=2), encoding="utf-8")
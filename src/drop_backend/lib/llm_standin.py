@@ -0,0 +1,526 @@
+"""
+A local stand-in for the OpenAI API, to load test AltAI, EmbeddingSearch and
+the commands that use them offline. It speaks the wire formats the openai
+client uses in ai.py:
+
+- GET /v1/models/<model>(openai.Model.retrieve),
+- POST /v1/chat/completions, streamed as server sent events or not,
+- POST /v1/embeddings, as float lists or base64.
+
+Function calls get arguments generated from the JSON schema of the function
+(see types/schema), like those of CityEvent and MoodSubmood. They are
+deterministic: the same request always gets the same arguments. Latency is
+drawn from configurable distributions, and rate limit(429), server errors(503)
+and arguments that fail the schema can be injected at a rate.
+
+Run with:
+    python -m drop_backend.lib.llm_standin --port 8765 \\
+        --first-token-latency lognormal:0.4,0.5 --rate-limit-rate 0.05
+then point the client at it:
+    OPENAI_API_BASE=http://127.0.0.1:8765/v1 OPENAI_API_KEY=standin ...
+"""
+
+import argparse
+import base64
+import datetime
+import hashlib
+import json
+import logging
+import math
+import random
+import re
+import struct
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Like the input ids in the mood tagging prompt, see mood_commands.py.
+_EVENT_ID = re.compile(r"\bEvent\d+\b")
+
+_WORDS = (
+    "jazz night waterfront market family art walk comedy pop-up yoga brunch "
+    "festival workshop tasting gallery concert trivia film outdoor holiday "
+    "run kids craft wine lantern parade museum tour"
+).split()
+_STREETS = (
+    "Washington Street",
+    "Hudson Street",
+    "Sinatra Drive",
+    "Newark Avenue",
+    "Grove Street",
+    "Christopher Columbus Drive",
+)
+_CITIES = ("Hoboken, NJ", "Jersey City, NJ", "New York, NY")
+
+
+@dataclass
+class Latency:
+    """
+    Seconds to wait, one of fixed:SECONDS, uniform:LOW,HIGH or
+    lognormal:MEDIAN,SIGMA.
+    """
+
+    kind: str = "fixed"
+    params: Tuple[float, ...] = (0.0,)
+
+    @classmethod
+    def parse(cls, spec: str) -> "Latency":
+        kind, _, params = spec.partition(":")
+        latency = cls(kind, tuple(float(p) for p in params.split(",") if p))
+        expected = {"fixed": 1, "uniform": 2, "lognormal": 2}.get(kind)
+        if expected != len(latency.params):
+            raise ValueError(f"Bad latency {spec}, see Latency for the format")
+        return latency
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "uniform":
+            return rng.uniform(*self.params)
+        if self.kind == "lognormal":
+            median, sigma = self.params
+            return rng.lognormvariate(math.log(median), sigma)
+        return self.params[0]
+
+
+@dataclass
+class StandinConfig:
+    first_token_latency: Latency = field(default_factory=Latency)
+    # Between streamed chunks.
+    chunk_latency: Latency = field(default_factory=Latency)
+    embedding_latency: Latency = field(default_factory=Latency)
+    # Characters of function call arguments or content per streamed chunk.
+    chunk_chars: int = 16
+    rate_limit_rate: float = 0.0
+    server_error_rate: float = 0.0
+    # Function calls whose arguments miss a required property.
+    invalid_arguments_rate: float = 0.0
+    embedding_dimensions: int = 1536
+    # Seeds the latencies and the injected errors, not the generated payloads.
+    seed: int = 0
+
+
+def _stable_seed(*parts: Any) -> int:
+    digest = hashlib.sha256(json.dumps(parts, sort_keys=True).encode())
+    return int.from_bytes(digest.digest()[:8], "big")
+
+
+class SchemaFaker:
+    """
+    Generates JSON that validates against a JSON schema, for the subset of the
+    schemas pydantic generates for types/($defs, $ref, anyOf, enum and date
+    and time formats). Strings are picked by the property's name, and arrays
+    of `Event<NUMBER>` ids get the event ids of the prompt.
+    """
+
+    def __init__(self, schema: Dict[str, Any], event_ids: List[str]):
+        self.defs = schema.get("$defs", {})
+        self.schema = schema
+        self.event_ids = event_ids
+
+    def generate(self, rng: random.Random) -> Any:
+        return self._value(self.schema, rng, name="")
+
+    def _resolve(self, schema: Dict[str, Any]) -> Dict[str, Any]:
+        while "$ref" in schema:
+            schema = self.defs[schema["$ref"].split("/")[-1]]
+        for key in ("anyOf", "oneOf", "allOf"):
+            if key in schema:
+                options = [
+                    self._resolve(option)
+                    for option in schema[key]
+                    if option.get("type") != "null"
+                ]
+                return options[0] if options else {"type": "null"}
+        return schema
+
+    def _takes_event_ids(self, schema: Dict[str, Any]) -> bool:
+        return bool(self.event_ids) and "Event<NUMBER>" in schema.get(
+            "description", ""
+        )
+
+    def _value(self, schema: Dict[str, Any], rng: random.Random, name: str):
+        schema = self._resolve(schema)
+        if "const" in schema:
+            return schema["const"]
+        if "enum" in schema:
+            return rng.choice(schema["enum"])
+        kind = schema.get("type", "string")
+        if isinstance(kind, list):
+            kind = next((k for k in kind if k != "null"), "null")
+        if kind == "object":
+            required = set(schema.get("required", []))
+            return {
+                prop: self._value(prop_schema, rng, prop)
+                for prop, prop_schema in schema.get("properties", {}).items()
+                if prop in required
+                or self._takes_event_ids(prop_schema)
+                or rng.random() < 0.7
+            }
+        if kind == "array":
+            if self._takes_event_ids(schema):
+                return list(self.event_ids)
+            num_items = rng.randint(
+                max(schema.get("minItems", 1), 1),
+                min(schema.get("maxItems", 3), 3),
+            )
+            return [
+                self._value(schema.get("items", {}), rng, name)
+                for _ in range(num_items)
+            ]
+        if kind == "boolean":
+            return rng.random() < 0.5
+        if kind == "integer":
+            return rng.randint(0, 100)
+        if kind == "number":
+            return round(rng.uniform(0, 100), 2)
+        if kind == "null":
+            return None
+        return self._string(schema.get("format"), rng, name.lower())
+
+    def _string(
+        self, string_format: Optional[str], rng: random.Random, name: str
+    ) -> str:
+        if string_format == "date":
+            day = datetime.date(2024, 1, 1) + datetime.timedelta(
+                days=rng.randint(0, 365)
+            )
+            return day.isoformat()
+        if string_format == "time":
+            return f"{rng.randint(8, 22):02d}:{rng.choice((0, 30)):02d}:00"
+        if "address" in name:
+            return (
+                f"{rng.randint(1, 1500)} {rng.choice(_STREETS)}, "
+                f"{rng.choice(_CITIES)}"
+            )
+        if "link" in name or string_format == "uri":
+            return f"https://example.com/events/{rng.randint(1, 10**6)}"
+        num_words = 12 if "description" in name or "reason" in name else 3
+        return " ".join(rng.choice(_WORDS) for _ in range(num_words)).title()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "StandinServer"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        logger.debug(format, *args)
+
+    def _send_json(self, status: int, body: Dict[str, Any], headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status: int, message: str, error_type: str):
+        headers = {"Retry-After": "1"} if status == 429 else None
+        self._send_json(
+            status,
+            {"error": {"message": message, "type": error_type, "code": None}},
+            headers,
+        )
+
+    def _injected_error(self) -> bool:
+        config = self.server.config
+        if self.server.chance(config.rate_limit_rate):
+            self.server.count("rate_limited")
+            self._send_error(429, "Stand-in rate limit", "requests")
+            return True
+        if self.server.chance(config.server_error_rate):
+            self.server.count("server_errors")
+            self._send_error(503, "Stand-in overloaded", "server_error")
+            return True
+        return False
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        if self.path.startswith("/v1/models/"):
+            model = self.path[len("/v1/models/") :]
+            self._send_json(
+                200,
+                {"id": model, "object": "model", "owned_by": "standin"},
+            )
+            return
+        self._send_error(404, f"Unknown path {self.path}", "invalid_request")
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if self.path == "/v1/chat/completions":
+            self.server.count("chat_completions")
+            if not self._injected_error():
+                self._chat_completion(request)
+        elif self.path == "/v1/embeddings":
+            self.server.count("embeddings")
+            if not self._injected_error():
+                self._embeddings(request)
+        else:
+            self._send_error(
+                404, f"Unknown path {self.path}", "invalid_request"
+            )
+
+    def _chat_completion(self, request: Dict[str, Any]):
+        function_call, content = self.server.reply(request)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        model = request.get("model", "standin")
+        finish_reason = "function_call" if function_call else "stop"
+        time.sleep(self.server.sample(self.server.config.first_token_latency))
+        if not request.get("stream"):
+            message: Dict[str, Any] = {"role": "assistant", "content": content}
+            if function_call:
+                message["function_call"] = function_call
+            self._send_json(
+                200,
+                {
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": message,
+                            "finish_reason": finish_reason,
+                        }
+                    ],
+                },
+            )
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = (
+            True  # pylint: disable=attribute-defined-outside-init
+        )
+        for i, delta in enumerate(
+            self._deltas(function_call, content, finish_reason)
+        ):
+            if i:
+                time.sleep(self.server.sample(self.server.config.chunk_latency))
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, **delta}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def _deltas(
+        self,
+        function_call: Optional[Dict[str, str]],
+        content: Optional[str],
+        finish_reason: str,
+    ) -> Iterator[Dict[str, Any]]:
+        step = self.server.config.chunk_chars
+        if function_call:
+            yield {
+                "delta": {
+                    "role": "assistant",
+                    "content": None,
+                    "function_call": {
+                        "name": function_call["name"],
+                        "arguments": "",
+                    },
+                },
+                "finish_reason": None,
+            }
+            arguments = function_call["arguments"]
+            for start in range(0, len(arguments), step):
+                yield {
+                    "delta": {
+                        "function_call": {
+                            "arguments": arguments[start : start + step]
+                        }
+                    },
+                    "finish_reason": None,
+                }
+        else:
+            yield {
+                "delta": {"role": "assistant", "content": ""},
+                "finish_reason": None,
+            }
+            text = content or ""
+            for start in range(0, len(text), step):
+                yield {
+                    "delta": {"content": text[start : start + step]},
+                    "finish_reason": None,
+                }
+        yield {"delta": {}, "finish_reason": finish_reason}
+
+    def _embeddings(self, request: Dict[str, Any]):
+        inputs = request.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        time.sleep(self.server.sample(self.server.config.embedding_latency))
+        data = []
+        for index, text in enumerate(inputs):
+            vector = self.server.embedding(str(text))
+            embedding: Any = vector
+            if request.get("encoding_format") == "base64":
+                embedding = base64.b64encode(
+                    struct.pack(f"<{len(vector)}f", *vector)
+                ).decode()
+            data.append(
+                {"object": "embedding", "index": index, "embedding": embedding}
+            )
+        num_tokens = sum(len(str(text)) // 4 + 1 for text in inputs)
+        self._send_json(
+            200,
+            {
+                "object": "list",
+                "data": data,
+                "model": request.get("model", "standin"),
+                "usage": {
+                    "prompt_tokens": num_tokens,
+                    "total_tokens": num_tokens,
+                },
+            },
+        )
+
+
+class StandinServer(ThreadingHTTPServer):
+    """
+    The stand-in on (host, port), port 0 picks a free one. As a context
+    manager it serves on a background thread, see base_url.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: Tuple[str, int] = ("127.0.0.1", 0),
+        config: Optional[StandinConfig] = None,
+    ):
+        super().__init__(address, _Handler)
+        self.config = config or StandinConfig()
+        self._rng = random.Random(self.config.seed)
+        self._lock = threading.Lock()
+        self.counts: Dict[str, int] = {}
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def __enter__(self) -> "StandinServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.shutdown()
+        self.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def chance(self, rate: float) -> bool:
+        if rate <= 0:
+            return False
+        with self._lock:
+            return self._rng.random() < rate
+
+    def sample(self, latency: Latency) -> float:
+        with self._lock:
+            return max(latency.sample(self._rng), 0.0)
+
+    def embedding(self, text: str) -> List[float]:
+        """A deterministic unit vector of the text."""
+        rng = random.Random(_stable_seed("embedding", text))
+        vector = [
+            rng.gauss(0.0, 1.0) for _ in range(self.config.embedding_dimensions)
+        ]
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def reply(
+        self, request: Dict[str, Any]
+    ) -> Tuple[Optional[Dict[str, str]], Optional[str]]:
+        """The (function call, content) answering the request."""
+        messages = request.get("messages", [])
+        prompt = next(
+            (
+                m.get("content") or ""
+                for m in reversed(messages)
+                if m.get("role") == "user"
+            ),
+            "",
+        )
+        functions = request.get("functions") or []
+        if not functions:
+            rng = random.Random(_stable_seed("chat", prompt))
+            words = " ".join(rng.choice(_WORDS) for _ in range(20))
+            return None, f"Stand-in reply: {words}."
+        function = functions[0]
+        requested = request.get("function_call")
+        if isinstance(requested, dict):
+            function = next(
+                (f for f in functions if f["name"] == requested.get("name")),
+                function,
+            )
+        schema = function.get("parameters", {})
+        rng = random.Random(_stable_seed("function", function["name"], prompt))
+        arguments = SchemaFaker(
+            schema, list(dict.fromkeys(_EVENT_ID.findall(prompt)))
+        ).generate(rng)
+        if self.chance(self.config.invalid_arguments_rate) and isinstance(
+            arguments, dict
+        ):
+            self.count("invalid_arguments")
+            for required in schema.get("required", [])[:1]:
+                arguments.pop(required, None)
+        return {
+            "name": function["name"],
+            "arguments": json.dumps(arguments),
+        }, None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--first-token-latency", type=Latency.parse)
+    parser.add_argument("--chunk-latency", type=Latency.parse)
+    parser.add_argument("--embedding-latency", type=Latency.parse)
+    parser.add_argument("--chunk-chars", type=int)
+    parser.add_argument("--rate-limit-rate", type=float)
+    parser.add_argument("--server-error-rate", type=float)
+    parser.add_argument("--invalid-arguments-rate", type=float)
+    parser.add_argument("--embedding-dimensions", type=int)
+    parser.add_argument("--seed", type=int)
+    args = vars(parser.parse_args())
+    address = (args.pop("host"), args.pop("port"))
+    config = StandinConfig(
+        **{key: value for key, value in args.items() if value is not None}
+    )
+    logging.basicConfig(level=logging.INFO)
+    server = StandinServer(address, config)
+    logger.info("Serving the OpenAI stand-in on %s", server.base_url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+A staged pipeline of threads connected by bounded queues, so that slow network
+calls, CPU work and database writes of different items overlap:
+
+    producer -> N workers -> prepare -> batched writer(the calling thread)
+
+Full queues block the stage before them, so a slow writer throttles the
+workers and the producer instead of buffering the whole input.
+"""
+
+import logging
+import queue
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+ItemT = TypeVar("ItemT")
+ResultT = TypeVar("ResultT")
+PreparedT = TypeVar("PreparedT")
+
+# How often a blocked stage checks if another stage failed.
+_POLL_SECONDS = 0.1
+
+
+class _Done:
+    pass
+
+
+_DONE = _Done()
+
+
+class _Stopped(Exception):
+    pass
+
+
+class _Stages:
+    def __init__(self, queue_size: int, num_workers: int):
+        self.stop = threading.Event()
+        self.errors: List[BaseException] = []
+        # Items read but not prepared yet. Also bounds the results held back
+        # in ordered mode while an earlier item is still with a worker.
+        self.in_flight = threading.Semaphore(2 * queue_size + num_workers)
+        self.to_workers: queue.Queue = queue.Queue(queue_size)
+        self.to_prepare: queue.Queue = queue.Queue(queue_size)
+        self.to_writer: queue.Queue = queue.Queue(queue_size)
+
+    def put(self, to: queue.Queue, item: Any) -> None:
+        while not self.stop.is_set():
+            try:
+                to.put(item, timeout=_POLL_SECONDS)
+                return
+            except queue.Full:
+                continue
+        raise _Stopped()
+
+    def acquire_slot(self) -> None:
+        while not self.stop.is_set():
+            if self.in_flight.acquire(timeout=_POLL_SECONDS):
+                return
+        raise _Stopped()
+
+    def get(self, from_: queue.Queue) -> Any:
+        while not self.stop.is_set():
+            try:
+                return from_.get(timeout=_POLL_SECONDS)
+            except queue.Empty:
+                continue
+        raise _Stopped()
+
+    def fail(self, error: BaseException) -> None:
+        self.errors.append(error)
+        self.stop.set()
+
+
+def run_pipeline(
+    items: Iterable[ItemT],
+    make_worker: Callable[[], Callable[[ItemT], ResultT]],
+    prepare: Callable[[ItemT, ResultT], PreparedT],
+    write_batch: Callable[[List[PreparedT]], None],
+    num_workers: int = 4,
+    queue_size: int = 16,
+    batch_size: int = 32,
+    ordered: bool = True,
+    hold: Optional[Callable[[ResultT], None]] = None,
+) -> int:
+    """
+    Calls worker(item) on num_workers threads, each with its own worker from
+    make_worker(), so workers need not be thread safe. prepare(item, result)
+    runs on a single thread and write_batch on the calling thread with up to
+    batch_size prepared items; a partial batch is written when nothing else is
+    ready, rather than waiting for it to fill.
+
+    If ordered, the batches are in the order of items, else in the order
+    the workers finish. The first exception of any stage stops the pipeline
+    and is raised here. Returns the number of items written.
+
+    hold(result) is called on the worker's thread before the result waits in
+    the queues for prepare, e.g. to make it smaller.
+    """
+    stages = _Stages(queue_size, num_workers)
+
+    def _produce():
+        try:
+            for seq, item in enumerate(items):
+                stages.acquire_slot()
+                stages.put(stages.to_workers, (seq, item))
+            for _ in range(num_workers):
+                stages.put(stages.to_workers, _DONE)
+        except _Stopped:
+            pass
+        except BaseException as error:  # pylint: disable=broad-except
+            stages.fail(error)
+
+    def _work():
+        try:
+            worker = make_worker()
+            while True:
+                task = stages.get(stages.to_workers)
+                if task is _DONE:
+                    stages.put(stages.to_prepare, _DONE)
+                    return
+                seq, item = task
+                result = worker(item)
+                if hold:
+                    hold(result)
+                stages.put(stages.to_prepare, (seq, item, result))
+        except _Stopped:
+            pass
+        except BaseException as error:  # pylint: disable=broad-except
+            stages.fail(error)
+
+    def _prepare():
+        try:
+            num_done = 0
+            next_seq = 0
+            # Results that finished before an earlier item, when ordered.
+            pending: Dict[int, Any] = {}
+            while num_done < num_workers:
+                task = stages.get(stages.to_prepare)
+                if task is _DONE:
+                    num_done += 1
+                    continue
+                seq, item, result = task
+                if not ordered:
+                    stages.put(stages.to_writer, prepare(item, result))
+                    stages.in_flight.release()
+                    continue
+                pending[seq] = (item, result)
+                while next_seq in pending:
+                    item, result = pending.pop(next_seq)
+                    stages.put(stages.to_writer, prepare(item, result))
+                    stages.in_flight.release()
+                    next_seq += 1
+            stages.put(stages.to_writer, _DONE)
+        except _Stopped:
+            pass
+        except BaseException as error:  # pylint: disable=broad-except
+            stages.fail(error)
+
+    threads = [threading.Thread(target=_produce, daemon=True)]
+    threads += [
+        threading.Thread(target=_work, daemon=True) for _ in range(num_workers)
+    ]
+    threads.append(threading.Thread(target=_prepare, daemon=True))
+    for thread in threads:
+        thread.start()
+
+    num_written = 0
+    batch: List[PreparedT] = []
+    try:
+        while True:
+            try:
+                prepared = stages.to_writer.get_nowait()
+            except queue.Empty:
+                # Nothing else is ready, write what we have before waiting.
+                if batch:
+                    write_batch(batch)
+                    num_written += len(batch)
+                    batch = []
+                prepared = stages.get(stages.to_writer)
+            if prepared is _DONE:
+                break
+            batch.append(prepared)
+            if len(batch) >= batch_size:
+                write_batch(batch)
+                num_written += len(batch)
+                batch = []
+        if batch:
+            write_batch(batch)
+            num_written += len(batch)
+        return num_written
+    except _Stopped:
+        raise stages.errors[0]  # pylint: disable=raise-missing-from
+    except BaseException as error:
+        stages.fail(error)
+        raise
+    finally:
+        stages.stop.set()
+        for thread in threads:
+            thread.join()
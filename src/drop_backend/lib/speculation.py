@@ -0,0 +1,81 @@
+"""
+Speculative work on the fields of a function call while the AI is still
+streaming it. The AI writes an event's name, description and addresses well
+before it finishes the call, so jobs that only need those, like geocoding and
+embeddings, can start early and overlap with the rest of the completion.
+
+The results are only kept if the call turns into a valid object with the
+same values for the fields the job used, otherwise they are discarded.
+"""
+
+import logging
+from concurrent.futures import Executor, Future
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class SpeculativeJob:
+    name: str
+    # Run with the values of the fields, in order, once they are all streamed.
+    fields: Tuple[str, ...]
+    run: Callable[..., Any]
+
+
+class Speculation:
+    """
+    The jobs of one event. on_field(function_name, field, value) is the
+    field_listener of AltAI, it starts the jobs on executor.
+    """
+
+    def __init__(self, jobs: Sequence[SpeculativeJob], executor: Executor):
+        self._jobs = jobs
+        self._executor = executor
+        self._fields: Dict[str, Any] = {}
+        # Job name -> (the field values it ran with, its future).
+        self._started: Dict[str, Tuple[Tuple[Any, ...], Future]] = {}
+
+    def on_field(
+        self, function_name: Optional[str], field: str, value: Any
+    ) -> None:
+        del function_name
+        self._fields[field] = value
+        for job in self._jobs:
+            if job.name in self._started or not all(
+                name in self._fields for name in job.fields
+            ):
+                continue
+            inputs = tuple(self._fields[name] for name in job.fields)
+            if any(value is None for value in inputs):
+                continue
+            self._started[job.name] = (
+                inputs,
+                self._executor.submit(job.run, *inputs),
+            )
+
+    def results(self, final_fields: Callable[[str], Any]) -> Dict[str, Any]:
+        """
+        Waits for the results of the jobs that ran with the final values of
+        their fields, final_fields(field), and discards the others. Jobs that
+        failed are left out.
+        """
+        results: Dict[str, Any] = {}
+        for job in self._jobs:
+            if job.name not in self._started:
+                continue
+            inputs, future = self._started[job.name]
+            if inputs != tuple(final_fields(name) for name in job.fields):
+                logger.debug("Discarding %s, its fields changed", job.name)
+                future.cancel()
+                continue
+            try:
+                results[job.name] = future.result()
+            except Exception as exc:  # pylint: disable=broad-except
+                logger.warning("Speculative %s failed: %s", job.name, exc)
+        return results
+
+    def discard(self) -> None:
+        for _, future in self._started.values():
+            future.cancel()
@@ -0,0 +1,109 @@
+"""
+Packing of keyed texts(like {"Event1": "..."}) into JSON batches that fit a
+token budget, for prompts that send several events in one message.
+"""
+
+import json
+import logging
+import math
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# OpenAI's BPE tokenizers average about 4 characters per token for English,
+# JSON punctuation included. Good enough to size batches without a tokenizer.
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _item_tokens(key: str, text: str) -> int:
+    # The item as a member of the JSON object, with its separator.
+    return estimate_tokens(json.dumps({key: text})) + 1
+
+
+@dataclass
+class TokenBatch:
+    items: Dict[str, str] = field(default_factory=dict)
+    # Estimated tokens of json.dumps(items).
+    estimated_tokens: int = 0
+
+    def to_json(self) -> str:
+        return json.dumps(self.items)
+
+    def subset(self, keys: Iterable[str]) -> "TokenBatch":
+        batch = TokenBatch()
+        for key in keys:
+            batch.items[key] = self.items[key]
+            batch.estimated_tokens += _item_tokens(key, self.items[key])
+        return batch
+
+    def halves(self) -> Tuple["TokenBatch", "TokenBatch"]:
+        keys = list(self.items)
+        return (
+            self.subset(keys[: len(keys) // 2]),
+            self.subset(keys[len(keys) // 2 :]),
+        )
+
+
+@dataclass
+class BatchTokenCounts:
+    """Estimated tokens spent on a batch, see log_token_counts."""
+
+    num_items: int
+    prompt_tokens: int
+    completion_tokens: int
+
+
+def pack_by_tokens(
+    items: Iterable[Tuple[str, str]],
+    token_budget: int,
+    max_items: int,
+) -> Iterator[TokenBatch]:
+    """
+    Greedily packs (key, text) items, in order, into batches of at most
+    max_items whose JSON is estimated to be at most token_budget tokens. An
+    item over the budget by itself gets a batch of its own.
+    """
+    batch = TokenBatch()
+    for key, text in items:
+        item_tokens = _item_tokens(key, text)
+        if batch.items and (
+            batch.estimated_tokens + item_tokens > token_budget
+            or len(batch.items) >= max_items
+        ):
+            yield batch
+            batch = TokenBatch()
+        if item_tokens > token_budget:
+            logger.warning(
+                "%s is ~%d tokens, over the budget of %d by itself",
+                key,
+                item_tokens,
+                token_budget,
+            )
+        batch.items[key] = text
+        batch.estimated_tokens += item_tokens
+    if batch.items:
+        yield batch
+
+
+def log_token_counts(counts: List[BatchTokenCounts]) -> None:
+    if not counts:
+        return
+    prompt_tokens = [count.prompt_tokens for count in counts]
+    completion_tokens = [count.completion_tokens for count in counts]
+    logger.info(
+        "%d batches of %d items: ~%d prompt tokens(%d to %d per batch), "
+        "~%d completion tokens(%d to %d per batch)",
+        len(counts),
+        sum(count.num_items for count in counts),
+        sum(prompt_tokens),
+        min(prompt_tokens),
+        max(prompt_tokens),
+        sum(completion_tokens),
+        min(completion_tokens),
+        max(completion_tokens),
+    )
@@ -1,8 +1,10 @@
 import enum
 import json
 import logging
+import sys
+import uuid
 from abc import abstractmethod
-from typing import Any, Dict, Generator, List, Optional, Union
+from typing import Any, Dict, Generator, List, Optional, Sequence, Union
 
 import time_uuid  # type: ignore
 from pydantic import UUID1, BaseModel, Field, Json
@@ -91,6 +93,141 @@ class MessageNode(BaseModel):
     template_vars: Optional[Dict[str, str]] = {}
 
 
+# Function specs of compacted messages by their JSON, there are only as many as
+# there are generated schemas.
+_shared_functions: Dict[str, List[OpenAIFunctionCallSpec]] = {}
+
+
+def _share_functions(
+    functions: Optional[List[OpenAIFunctionCallSpec]],
+) -> Optional[List[OpenAIFunctionCallSpec]]:
+    if not functions:
+        return None
+    key = json.dumps(
+        [function.model_dump() for function in functions], sort_keys=True
+    )
+    return _shared_functions.setdefault(key, functions)
+
+
+def same_functions(
+    functions: Optional[List[OpenAIFunctionCallSpec]],
+    other: Optional[List[OpenAIFunctionCallSpec]],
+) -> bool:
+    """
+    If both lists hold the same spec objects. MessageNode copies the list it
+    is given but not the specs, so this is how messages made from one spec
+    are told apart without comparing the specs.
+    """
+    if functions is None or other is None:
+        return functions is other
+    return len(functions) == len(other) and all(
+        function is other_function
+        for function, other_function in zip(functions, other)
+    )
+
+
+class CompactMessage:
+    """
+    A MessageNode as a slotted record, for keeping many histories in memory(e.g.
+    batch runs). Empty dicts are not stored, the id is kept as an int, roles are
+    the shared Role members and system prompts, repeated in every history, are
+    interned so that identical ones are one string, as are identical function
+    specs. Function calls are shared with the MessageNode they came from.
+
+    Convert back with to_message_node when talking to the API or the DB.
+    """
+
+    __slots__ = (
+        "role",
+        "id",
+        "message_content",
+        "functions",
+        "explicit_fn_call",
+        "ai_function_call",
+        "ai_function_call_result_name",
+        "ai_function_call_result",
+        "metadata",
+        "template_vars",
+    )
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        role: Role,
+        id: int,  # pylint: disable=redefined-builtin
+        message_content: Optional[str] = None,
+        functions: Optional[List[OpenAIFunctionCallSpec]] = None,
+        explicit_fn_call: Optional[
+            Union[UserExplicitFunctionCall, UserFunctionCallMode]
+        ] = None,
+        ai_function_call: Optional[AIFunctionCall] = None,
+        ai_function_call_result_name: Optional[str] = None,
+        ai_function_call_result: Optional[str] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+        template_vars: Optional[Dict[str, str]] = None,
+    ):
+        self.role = role
+        self.id = id
+        self.message_content = message_content
+        self.functions = functions
+        self.explicit_fn_call = explicit_fn_call
+        self.ai_function_call = ai_function_call
+        self.ai_function_call_result_name = ai_function_call_result_name
+        self.ai_function_call_result = ai_function_call_result
+        self.metadata = metadata
+        self.template_vars = template_vars
+
+    @classmethod
+    def from_message_node(
+        cls,
+        message: MessageNode,
+        functions: Optional[List[OpenAIFunctionCallSpec]] = None,
+    ) -> "CompactMessage":
+        """
+        A message with the same specs as functions(see same_functions) keeps
+        them, others share the first identical specs compacted.
+        """
+        message_content = message.message_content
+        if message_content is not None and message.role == Role.system:
+            message_content = sys.intern(message_content)
+        return cls(
+            message.role,
+            message.id.int,
+            message_content,
+            (
+                functions
+                if functions and same_functions(message.functions, functions)
+                else _share_functions(message.functions)
+            ),
+            message.explicit_fn_call,
+            message.ai_function_call,
+            (
+                sys.intern(message.ai_function_call_result_name)
+                if message.ai_function_call_result_name is not None
+                else None
+            ),
+            message.ai_function_call_result,
+            message.metadata or None,
+            message.template_vars or None,
+        )
+
+    def to_message_node(self) -> MessageNode:
+        # The fields were validated when the MessageNode was first created.
+        return MessageNode.model_construct(
+            role=self.role,
+            id=uuid.UUID(int=self.id),
+            message_content=self.message_content,
+            functions=self.functions,
+            explicit_fn_call=self.explicit_fn_call,
+            ai_function_call=self.ai_function_call,
+            ai_function_call_result_name=self.ai_function_call_result_name,
+            ai_function_call_result=self.ai_function_call_result,
+            metadata=dict(self.metadata) if self.metadata else {},
+            template_vars=(
+                dict(self.template_vars) if self.template_vars else {}
+            ),
+        )
+
+
 class EventNode:
     def __init__(self, _direct=True):
         if _direct:
@@ -104,11 +241,62 @@ class EventNode:
         # assume that the last message on the stack is from the user.
 
         # Filled in with the messages from the AI and the user, excluding the system prompt.
-        self.history: Optional[List[MessageNode]] = None
+        self._history: Optional[List[MessageNode]] = None
+        # Set instead of _history while the event is compacted.
+        self._compact_history: Optional[
+            List[Union[CompactMessage, MessageNode]]
+        ] = None
 
         # Arbitrary meta data extracted for the event.
         self.metadata: Optional[Dict[str, Any]] = {}
 
+        self._api_messages_cache = ApiMessagesCache()
+
+    @property
+    def history(self) -> Optional[List[MessageNode]]:
+        if self._compact_history is not None:
+            self._history = [
+                (
+                    message
+                    if isinstance(message, MessageNode)
+                    else message.to_message_node()
+                )
+                for message in self._compact_history
+            ]
+            self._compact_history = None
+        return self._history
+
+    @history.setter
+    def history(self, history: Optional[List[MessageNode]]):
+        self._history = history
+        self._compact_history = None
+
+    def compact(
+        self,
+        shared: Sequence[MessageNode] = (),
+        functions: Optional[List[OpenAIFunctionCallSpec]] = None,
+    ) -> None:
+        """
+        Keep the history as CompactMessages until it is accessed again. For
+        holding on to many events whose conversation with the AI is done.
+
+        The messages in shared, e.g. the system message every history of a run
+        starts with, are kept as they are and so are the specs of messages with
+        the same specs as functions. The history then still starts with the
+        same objects when it is accessed again, see ReplayHistoryTemplate.
+        """
+        if self._history is not None:
+            self._compact_history = [
+                (
+                    message
+                    if any(message is kept for kept in shared)
+                    else CompactMessage.from_message_node(message, functions)
+                )
+                for message in self._history
+            ]
+            self._history = None
+            self._api_messages_cache = ApiMessagesCache()
+
     @property
     def event_obj(self):
         return self._event_obj
@@ -143,16 +331,22 @@ class EventNode:
         return {"role": Role.function.name, "content": msg}
 
     def to_open_ai_api_messages(self) -> Generator:
-        yield from EventNode.context_to_openai_api_messages(self.history or [])
+        yield from EventNode.context_to_openai_api_messages(
+            self.history or [], self._api_messages_cache
+        )
 
     @staticmethod
     def context_to_openai_api_messages(
         context: List[MessageNode],
+        cache: Optional["ApiMessagesCache"] = None,
     ) -> Generator[Dict[str, Any], None, None]:
         """
         Convert to a format to send to OpenAI API. Useful also for replaying.
         TODO(Sid): It might be also useful to make this class extend TypedDict instead(https://docs.pydantic.dev/latest/usage/types/dicts_mapping/#typeddict)
         so that we can validate(via pydantic) when we serialize and deserialize chat history(json) from the SQLlite database.
+
+        With a cache, that was used for earlier versions of the same append-only
+        context, only the messages appended since are converted.
         """
         assert context and len(context) > 0
         if len(context) == 1:
@@ -255,111 +449,170 @@ class EventNode:
             #     information."
             # }
 
-        for message_curr, message_next in zip(context[:-1], context[1:]):
-            # The use cases get a bit complex but the algo is described above.
-            if message_curr.role == Role.system:
-                yield {
-                    "role": message_curr.role.name,
-                    "content": message_curr.message_content,
-                }  # No function call
-            elif message_curr.role == Role.user:
-                # No matter what the message_next is, we won't have a function call argument in this case.
-                # If message_curr was indeed a function call then message_next should have the role `function`, unless AI did not call the function.
-                assert message_curr.message_content is not None
-                yield {
-                    "role": message_curr.role.name,
-                    "content": message_curr.message_content,
-                }
-            elif message_curr.role == Role.assistant:
-                msg: Dict[str, Any] = {  # type: ignore
-                    "role": Role.assistant.name,
+        if cache is None:
+            for message_curr, message_next in zip(context[:-1], context[1:]):
+                yield from EventNode._pair_to_api_messages(
+                    message_curr, message_next
+                )
+        else:
+            yield from cache.update(context)
+        # Process the last message that remains.
+        yield from EventNode._last_to_api_messages(context[-1])
+
+    @staticmethod
+    def _pair_to_api_messages(
+        message_curr: MessageNode, message_next: MessageNode
+    ) -> Generator[Dict[str, Any], None, None]:
+        # The use cases get a bit complex but the algo is described above.
+        if message_curr.role == Role.system:
+            yield {
+                "role": message_curr.role.name,
+                "content": message_curr.message_content,
+            }  # No function call
+        elif message_curr.role == Role.user:
+            # No matter what the message_next is, we won't have a function call argument in this case.
+            # If message_curr was indeed a function call then message_next should have the role `function`, unless AI did not call the function.
+            assert message_curr.message_content is not None
+            yield {
+                "role": message_curr.role.name,
+                "content": message_curr.message_content,
+            }
+        elif message_curr.role == Role.assistant:
+            msg: Dict[str, Any] = {  # type: ignore
+                "role": Role.assistant.name,
+            }
+            if message_curr.ai_function_call:
+                # If function is called content should be Null
+                msg["content"] = message_curr.message_content
+                msg["function_call"] = {
+                    "name": message_curr.ai_function_call.name,
+                    "arguments": json.dumps(
+                        message_curr.ai_function_call.arguments
+                    ),
                 }
-                if message_curr.ai_function_call:
-                    # If function is called content should be Null
-                    msg["content"] = message_curr.message_content
-                    msg["function_call"] = {
-                        "name": message_curr.ai_function_call.name,
-                        "arguments": json.dumps(
-                            message_curr.ai_function_call.arguments
-                        ),
+                yield msg
+                # There is a message_next and if we would have stored it correctly, it was a function result; just append it here.
+                if message_next.role == Role.function:
+                    yield {
+                        "role": Role.function.name,
+                        "name": message_next.ai_function_call_result_name,
+                        "content": message_next.ai_function_call_result,
                     }
-                    yield msg
-                    # There is a message_next and if we would have stored it correctly, it was a function result; just append it here.
-                    if message_next.role == Role.function:
-                        yield {
-                            "role": Role.function.name,
-                            "name": message_next.ai_function_call_result_name,
-                            "content": message_next.ai_function_call_result,
-                        }
-                    else:
-                        # In case of a replay this could be handled and a function role could be appended to the message sequence by calling the function again.
-                        err_msg = (
-                            "Function call request to AI without a function result. Insert a message after this one```%s```"
-                            + "\n"
-                            + "with role function as a result of the call and then call me again."
-                        )
-                        logger.error(
-                            err_msg, message_curr.model_dump_json(indent=2)
-                        )
-                        raise ValueError(
-                            f"{err_msg}. This message is: {message_next.model_dump_json(indent=2)}"
-                        )
                 else:
-                    msg["content"] = message_curr.message_content
-                    yield msg
-            elif message_curr.role == Role.function:
-                logger.info(
-                    "Function role and message was appeneded in the last iteration already. Ignoring"
-                )
+                    # In case of a replay this could be handled and a function role could be appended to the message sequence by calling the function again.
+                    err_msg = (
+                        "Function call request to AI without a function result. Insert a message after this one```%s```"
+                        + "\n"
+                        + "with role function as a result of the call and then call me again."
+                    )
+                    logger.error(
+                        err_msg, message_curr.model_dump_json(indent=2)
+                    )
+                    raise ValueError(
+                        f"{err_msg}. This message is: {message_next.model_dump_json(indent=2)}"
+                    )
             else:
-                raise ValueError(f"Unexpected role {message_curr.role}")
+                msg["content"] = message_curr.message_content
+                yield msg
+        elif message_curr.role == Role.function:
+            logger.info(
+                "Function role and message was appeneded in the last iteration already. Ignoring"
+            )
+        else:
+            raise ValueError(f"Unexpected role {message_curr.role}")
 
-        # Process the last message that remains.
-        if context[-1].role == Role.user:
+    @staticmethod
+    def _last_to_api_messages(
+        message_last: MessageNode,
+    ) -> Generator[Dict[str, Any], None, None]:
+        if message_last.role == Role.user:
             msg = {
-                "role": context[-1].role.name,
-                "content": context[-1].message_content,
+                "role": message_last.role.name,
+                "content": message_last.message_content,
             }
-            if context[-1].functions:
+            if message_last.functions:
                 msg["functions"] = [
                     function.model_dump(exclude_none=True)
-                    for function in context[-1].functions
+                    for function in message_last.functions
                 ]
                 assert (
-                    context[-1].explicit_fn_call is not None
+                    message_last.explicit_fn_call is not None
                 ), "Call mode must be set to be 'auto', 'none' or {'name': <function_name>}"
                 msg["explicit_fn_call"] = (
-                    context[-1].explicit_fn_call.model_dump()
+                    message_last.explicit_fn_call.model_dump()
                     if isinstance(
-                        context[-1].explicit_fn_call, UserExplicitFunctionCall
+                        message_last.explicit_fn_call, UserExplicitFunctionCall
                     )
-                    else context[-1].explicit_fn_call.value
+                    else message_last.explicit_fn_call.value
                 )
             yield msg
-        elif context[-1].role == Role.assistant:
-            if context[-1].ai_function_call is not None:
+        elif message_last.role == Role.assistant:
+            if message_last.ai_function_call is not None:
                 err_msg = "Function call request to AI without a function result. Add a function role with result of the call and then call me again."
                 logger.error(err_msg)
                 raise ValueError(err_msg)
             msg = {
-                "role": context[-1].role.name,
+                "role": message_last.role.name,
             }
-            msg["content"] = context[-1].message_content
+            msg["content"] = message_last.message_content
             yield msg
-        elif context[-1].role == Role.system:
+        elif message_last.role == Role.system:
             yield {
-                "role": context[-1].role.name,
-                "content": context[-1].message_content,
+                "role": message_last.role.name,
+                "content": message_last.message_content,
             }
-        elif context[-1].role == Role.function:
+        elif message_last.role == Role.function:
             logger.info(
                 "Function role was generated in the last iteration already."
             )
 
 
+class ApiMessagesCache:
+    """
+    The API messages of a context that only grows by appending MessageNodes, as
+    the conversations with the AI do. The output for a message depends on the
+    message after it(function results follow function calls), so a message is
+    cached once the message after it is not the last one; messages must not be
+    changed after that.
+
+    If the context passed in is not an extension of the previous one the cache
+    starts over.
+    """
+
+    def __init__(self):
+        # Messages whose API messages are cached plus the message after them.
+        self._messages: List[MessageNode] = []
+        self._api_messages: List[Dict[str, Any]] = []
+
+    def update(self, context: List[MessageNode]) -> List[Dict[str, Any]]:
+        """API messages of every message in context except the last one."""
+        if self._messages and (
+            len(context) < len(self._messages)
+            # Append-only, so checking the ends of the cached part is enough.
+            or context[0] is not self._messages[0]
+            or context[len(self._messages) - 1] is not self._messages[-1]
+        ):
+            self._messages, self._api_messages = [], []
+        num_cached = max(len(self._messages) - 1, 0)
+        new_api_messages = [
+            api_message
+            for i in range(num_cached, len(context) - 2)
+            for api_message in EventNode._pair_to_api_messages(
+                context[i], context[i + 1]
+            )
+        ]
+        # Only after converting, which raises for invalid contexts.
+        self._api_messages.extend(new_api_messages)
+        self._messages.extend(context[len(self._messages) : len(context) - 1])
+        if len(context) < 2:
+            return list(self._api_messages)
+        return self._api_messages + list(
+            EventNode._pair_to_api_messages(context[-2], context[-1])
+        )
+
+
 class InterrogationProtocol:
     @abstractmethod
     def get_interrogation_message(
         self, event: EventNode
-    ) -> Optional[MessageNode]:
-        ...
\ No newline at end of file
+    ) -> Optional[MessageNode]: ...
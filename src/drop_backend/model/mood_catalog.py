@@ -0,0 +1,119 @@
+"""
+The mood seeds(see mood_seed.py) of each MoodFlavors, precompiled into pickled
+Mood objects. Building a flavor with Mood.from_dict is slow, so each flavor is
+built once per version of mood_seed.py, written to a cache directory and
+loaded from there by later runs. Only the flavors asked for are loaded.
+
+The cache directory is $DROP_BACKEND_CACHE_DIR, else drop_backend under
+$XDG_CACHE_HOME or ~/.cache. If it cannot be written the moods are built in
+memory.
+"""
+
+import functools
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+from dataclasses import fields
+from pathlib import Path
+from typing import TYPE_CHECKING, List, Optional
+
+if TYPE_CHECKING:
+    from .mood_model_unsupervised import Mood
+
+logger = logging.getLogger(__name__)
+
+# Bump when the layout of the pickled catalog changes.
+CATALOG_FORMAT = 1
+
+_SEED_SOURCE = Path(__file__).with_name("mood_seed.py")
+
+
+def cache_dir() -> Path:
+    if os.environ.get("DROP_BACKEND_CACHE_DIR"):
+        return Path(os.environ["DROP_BACKEND_CACHE_DIR"])
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "drop_backend"
+
+
+@functools.lru_cache(maxsize=None)
+def catalog_key() -> Optional[str]:
+    """
+    Hash of mood_seed.py, the fields of Mood and SubMood and CATALOG_FORMAT,
+    None if the source is not there to hash.
+    """
+    # pylint: disable=import-outside-toplevel
+    from .mood_model_unsupervised import Mood, SubMood
+
+    try:
+        source = _SEED_SOURCE.read_bytes()
+    except OSError:
+        return None
+    digest = hashlib.sha256(source)
+    for cls in (Mood, SubMood):
+        digest.update(
+            repr([(f.name, str(f.type)) for f in fields(cls)]).encode()
+        )
+    digest.update(f"{CATALOG_FORMAT}:{pickle.HIGHEST_PROTOCOL}".encode())
+    return digest.hexdigest()[:16]
+
+
+def _build_flavor(flavor: str) -> bytes:
+    # pylint: disable=import-outside-toplevel
+    from . import mood_seed
+    from .mood_model_unsupervised import Mood
+
+    seeds = getattr(mood_seed, flavor, None)
+    if seeds is None:
+        raise ValueError(
+            f"New MoodFlavors: {flavor} added, but not implemented!"
+        )
+    return pickle.dumps(
+        [Mood.from_dict(i) for i in seeds], protocol=pickle.HIGHEST_PROTOCOL
+    )
+
+
+def _write_atomically(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        # Concurrent builders write the same bytes, the last one wins.
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+@functools.lru_cache(maxsize=None)
+def _flavor_pickle(flavor: str) -> bytes:
+    key = catalog_key()
+    if key is None:
+        return _build_flavor(flavor)
+    path = cache_dir() / f"mood_seed-{key}" / f"{flavor}.pickle"
+    try:
+        return path.read_bytes()
+    except FileNotFoundError:
+        pass
+    except OSError as error:
+        logger.warning("Could not read the mood catalog %s: %s", path, error)
+    data = _build_flavor(flavor)
+    try:
+        _write_atomically(path, data)
+        logger.debug("Wrote the mood catalog %s", path)
+    except OSError as error:
+        logger.warning("Could not write the mood catalog %s: %s", path, error)
+    return data
+
+
+def load_moods(flavor: str) -> List["Mood"]:
+    """New Mood objects of the flavor(a MoodFlavors value) on every call."""
+    return pickle.loads(_flavor_pickle(flavor))
+
+
+def clear_catalog_cache() -> None:
+    """Forgets the flavors loaded by this process, not the files."""
+    catalog_key.cache_clear()
+    _flavor_pickle.cache_clear()
@@ -1,13 +1,20 @@
 import logging
+import threading
+import weakref
+from typing import TYPE_CHECKING, Dict, Iterable, List, Set, Tuple
 
-from sqlalchemy import Column, ForeignKey, Integer, Text, and_
+from sqlalchemy import Column, ForeignKey, Index, Integer, Text, tuple_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import relationship
-from sqlalchemy.orm.exc import NoResultFound
 
-from ..types.mood_submood import SubMood
+from ..types.mood_submood import MoodSubmood, SubMood
 from ..utils.db_utils import session_manager
 from .merge_base import Base
 
+if TYPE_CHECKING:
+    from ..lib.batch_retry import ItemOutcome
+
 logger = logging.getLogger(__name__)
 
 
@@ -18,6 +25,8 @@ class MoodSubmoodTable(Base):  # type: ignore
     )  # Unique for the pair of mood submood
     mood = Column(Text, nullable=False)
     submood = Column(Text, nullable=False)
+    # Also the conflict target of upsert_mood_submoods.
+    __table_args__ = (Index("uq_mood_submood", "mood", "submood", unique=True),)
 
 
 class SubMoodEventTable(Base):  # type: ignore
@@ -35,51 +44,165 @@ class SubMoodEventTable(Base):  # type: ignore
     )
 
 
+class MoodTaggingOutcomeTable(Base):  # type: ignore
+    """
+    Whether the last mood tagging run tagged an event, so that events the AI
+    kept failing on are not silently left without moods.
+    """
+
+    __tablename__ = "MoodTaggingOutcomes"
+    event_id = Column(Integer, ForeignKey("parsed_events.id"), primary_key=True)
+    status = Column(Text, nullable=False)  # lib.batch_retry.ItemStatus
+    attempts = Column(Integer, nullable=False)
+    failure_reason = Column(Text, nullable=True)
+
+
 @session_manager
-def handle_mood_submood(session, mood: str, sub_mood: str) -> int:
-    # Ensure mood and sub_mood are not null/empty
-    if not mood or not sub_mood:
+def record_mood_tagging_outcomes(
+    session, outcomes: Dict[int, "ItemOutcome"]
+) -> None:
+    for event_id, outcome in outcomes.items():
+        session.merge(
+            MoodTaggingOutcomeTable(
+                event_id=event_id,
+                status=outcome.status.value,
+                attempts=outcome.attempts,
+                failure_reason=outcome.failure_reason,
+            )
+        )
+
+
+# Engine -> (mood, submood) -> MoodSubMoodTable.id. Rows are never updated
+# or deleted, so the cached ids stay valid.
+_mood_submood_ids: (
+    "weakref.WeakKeyDictionary[Engine, Dict[Tuple[str, str], int]]"
+) = weakref.WeakKeyDictionary()
+_mood_submood_ids_lock = threading.Lock()
+# Pairs per statement, below SQLite's limit on bound variables.
+_UPSERT_CHUNK_SIZE = 400
+
+
+def clear_mood_submood_id_cache() -> None:
+    with _mood_submood_ids_lock:
+        _mood_submood_ids.clear()
+
+
+@session_manager
+def upsert_mood_submoods(
+    session, pairs: Iterable[Tuple[str, str]]
+) -> Dict[Tuple[str, str], int]:
+    """
+    The ids of the (mood, submood) pairs, inserting the new ones. Pairs seen
+    before by this process are not looked up again.
+    """
+    return _upsert_mood_submoods(session, pairs)
+
+
+def _upsert_mood_submoods(
+    session, pairs: Iterable[Tuple[str, str]]
+) -> Dict[Tuple[str, str], int]:
+    pairs = set(pairs)
+    if any(not mood or not sub_mood for mood, sub_mood in pairs):
         error_msg = "Mood and Sub-mood cannot be null or empty"
-        logger.error(error_msg)  # Assuming logger is available in this scope
+        logger.error(error_msg)
         raise ValueError(error_msg)
-
-    try:
-        # Try to find an existing entry with the given mood and sub_mood
-        entry = (
-            session.query(MoodSubmoodTable)
-            .filter(
-                and_(
-                    MoodSubmoodTable.mood == mood,
-                    MoodSubmoodTable.submood == sub_mood,
-                )
+    engine = session.get_bind()
+    with _mood_submood_ids_lock:
+        cached = _mood_submood_ids.setdefault(engine, {})
+        ids = {pair: cached[pair] for pair in pairs if pair in cached}
+    missing = [pair for pair in pairs if pair not in ids]
+    for start in range(0, len(missing), _UPSERT_CHUNK_SIZE):
+        chunk = missing[start : start + _UPSERT_CHUNK_SIZE]
+        session.execute(
+            sqlite_insert(MoodSubmoodTable)
+            .values(
+                [
+                    {"mood": mood, "submood": sub_mood}
+                    for mood, sub_mood in chunk
+                ]
             )
-            .one()
+            .on_conflict_do_nothing(index_elements=["mood", "submood"])
         )
-    except NoResultFound:
-        # If not found, create a new entry
-        entry = MoodSubmoodTable(mood=mood, submood=sub_mood)
-        session.add(entry)
-        session.flush()  # To ensure the entry is assigned an ID before the session is committed by the decorator
+        for row_id, mood, sub_mood in session.query(
+            MoodSubmoodTable.id, MoodSubmoodTable.mood, MoodSubmoodTable.submood
+        ).filter(
+            tuple_(MoodSubmoodTable.mood, MoodSubmoodTable.submood).in_(chunk)
+        ):
+            ids[(mood, sub_mood)] = row_id
+    if missing:
+        # Only cache ids of rows that are committed.
+        session.commit()
+        with _mood_submood_ids_lock:
+            _mood_submood_ids.setdefault(engine, {}).update(
+                {pair: ids[pair] for pair in missing}
+            )
+    return ids
+
 
-    # At this point, entry should either be the found or newly created entry, and should have an ID.
-    return entry.id
+def _sub_mood_event_rows(
+    sub_mood_item: SubMood, mood_sub_mood_id: int
+) -> List[Dict]:
+    complete_json = sub_mood_item.model_dump_json()
+    return [
+        {
+            # Extracting ID from "EventX"
+            "event_id": int(event.replace("Event", "")),
+            "mood_sub_mood_id": mood_sub_mood_id,
+            "complete_json": complete_json,
+        }
+        for event in sub_mood_item.EVENTS
+    ]
+
+
+def _upsert_sub_mood_event_rows(session, rows: List[Dict]) -> None:
+    if not rows:
+        return
+    statement = sqlite_insert(SubMoodEventTable)
+    # A re-tagged event keeps the latest reasoning.
+    session.execute(
+        statement.on_conflict_do_update(
+            index_elements=["event_id", "mood_sub_mood_id"],
+            set_={"complete_json": statement.excluded.complete_json},
+        ),
+        rows,
+    )
+
+
+@session_manager
+def upsert_mood_submood_events(session, mood_submood: MoodSubmood) -> Set[int]:
+    """
+    Stores all the moods of a MoodSubmood in a few statements and returns the
+    ids of the events they tag.
+    """
+    ids = _upsert_mood_submoods(
+        session,
+        [
+            (mood.MOOD, sub_mood.SUB_MOOD)
+            for mood in mood_submood.MOODS
+            for sub_mood in mood.SUB_MOODS
+        ],
+    )
+    rows = [
+        row
+        for mood in mood_submood.MOODS
+        for sub_mood in mood.SUB_MOODS
+        for row in _sub_mood_event_rows(
+            sub_mood, ids[(mood.MOOD, sub_mood.SUB_MOOD)]
+        )
+    ]
+    _upsert_sub_mood_event_rows(session, rows)
+    return {row["event_id"] for row in rows}
+
+
+@session_manager
+def handle_mood_submood(session, mood: str, sub_mood: str) -> int:
+    return _upsert_mood_submoods(session, [(mood, sub_mood)])[(mood, sub_mood)]
 
 
 @session_manager
 def handle_sub_mood_event(
     session, sub_mood_item: SubMood, mood_sub_mood_entry: int
 ) -> None:
-    # For each event, insert into SubMoodEventTable
-    for event in sub_mood_item.EVENTS:
-        event_id = int(
-            event.replace("Event", "")
-        )  # Extracting ID from "EventX"
-        complete_json = sub_mood_item.model_dump_json()
-
-        sub_mood_event_entry = SubMoodEventTable(
-            event_id=event_id,
-            mood_sub_mood_id=mood_sub_mood_entry,
-            complete_json=complete_json,
-        )
-        session.add(sub_mood_event_entry)
-    session.commit()
+    _upsert_sub_mood_event_rows(
+        session, _sub_mood_event_rows(sub_mood_item, mood_sub_mood_entry)
+    )
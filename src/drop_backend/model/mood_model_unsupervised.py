@@ -3,11 +3,13 @@
 ###########################################################################
 
 
+import functools
 import json
 import logging
+import re
 from dataclasses import asdict, dataclass
 from enum import Enum
-from typing import Any, List
+from typing import Any, Callable, List, Tuple
 
 from dataclasses_json import DataClassJsonMixin, dataclass_json
 from jsonpath_ng import parse  # type: ignore
@@ -22,9 +24,10 @@ from sqlalchemy import (
     and_,
 )
 from .merge_base import Base
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import sessionmaker
 
-from .mood_seed import GEN_Z, GEN_Z_HOBOKEN, GEN_Z_NYC, MILLENIALS
+from .mood_catalog import load_moods
 
 logger = logging.getLogger(__name__)
 
@@ -51,20 +54,8 @@ class MoodFlavors(str, Enum):
     GEN_Z_NYC = "GEN_Z_NYC"
 
     def get_moods_for_flavor(self) -> List[Mood]:
-        selected = None
-        if self == MoodFlavors.GEN_Z_HOBOKEN:
-            selected = GEN_Z_HOBOKEN
-        elif self == MoodFlavors.MILLENIALS:
-            selected = MILLENIALS
-        elif self == MoodFlavors.GEN_Z:
-            selected = GEN_Z
-        elif self == MoodFlavors.GEN_Z_NYC:
-            selected = GEN_Z_NYC
-        else:
-            raise ValueError(
-                f"New MoodFlavors: {self} added, but not implemented!"
-            )
-        return [Mood.from_dict(i) for i in selected]
+        # From the precompiled catalog, see mood_catalog.py.
+        return load_moods(self.value)
 
 
 ###########################
@@ -282,6 +273,59 @@ def generate_submoods_json_accessors(
     return entries
 
 
+# The paths generate_submoods_json_accessors makes: $[i].FIELD or
+# $[i].FIELD[j].
+_SIMPLE_JSON_PATH = re.compile(
+    r"\$\[(\d+)\]\.([A-Za-z_][A-Za-z0-9_]*)(?:\[(\d+)\])?"
+)
+
+
+@functools.lru_cache(maxsize=None)
+def _compiled_json_path(path: str):
+    return parse(path)
+
+
+@functools.lru_cache(maxsize=None)
+def json_path_finder(path: str) -> Callable[[Any], List[Any]]:
+    """
+    Returns a function of a JSON document that returns the values of the
+    matches of the JSONPath, like [m.value for m in parse(path).find(doc)].
+
+    Paths are compiled once. Simple $[i].FIELD[j] paths index the document
+    directly, and only go through jsonpath_ng when the document does not have
+    that shape, so the matches are the same.
+    """
+    simple = _SIMPLE_JSON_PATH.fullmatch(path)
+
+    def _parsed(doc: Any) -> List[Any]:
+        return [match.value for match in _compiled_json_path(path).find(doc)]
+
+    if simple is None:
+        return _parsed
+    index, field = int(simple.group(1)), simple.group(2)
+    sub_index = None if simple.group(3) is None else int(simple.group(3))
+
+    def _direct(doc: Any) -> List[Any]:
+        if not (isinstance(doc, list) and index < len(doc)):
+            return _parsed(doc)
+        item = doc[index]
+        if not (isinstance(item, dict) and field in item):
+            return _parsed(doc)
+        value = item[field]
+        if sub_index is None:
+            return [value]
+        if not (isinstance(value, list) and sub_index < len(value)):
+            return _parsed(doc)
+        return [value[sub_index]]
+
+    return _direct
+
+
+@functools.lru_cache(maxsize=None)
+def _json_path_finders(paths: str) -> Tuple[Callable[[Any], List[Any]], ...]:
+    return tuple(json_path_finder(path.strip()) for path in paths.split(","))
+
+
 def get_submood_embedding_text(
     mood: MoodJsonTable,
     version: str,
@@ -290,25 +334,19 @@ def get_submood_embedding_text(
     sub_moods_json = json.loads(mood.sub_moods)
     records = []
     for path_record in json_path_records:
-        sub_mood_expr = parse(path_record.submood_accessor_json_path)
-        embedding_text_exprs = [
-            parse(i.strip())
-            for i in path_record.embedding_accessor_json_path.split(",")
-        ]
-        assert len(embedding_text_exprs) > 0
+        find_sub_mood = json_path_finder(path_record.submood_accessor_json_path)
+        find_embedding_texts = _json_path_finders(
+            path_record.embedding_accessor_json_path
+        )
+        assert len(find_embedding_texts) > 0
         # Match the JSONPath to get the sub_mood and embedding_text
-        sub_mood_lst = [
-            match.value for match in sub_mood_expr.find(sub_moods_json)
-        ]
+        sub_mood_lst = find_sub_mood(sub_moods_json)
         assert (
             len(sub_mood_lst) == 1
         ), f"Expected to find exactly one sub_mood for {path_record.submood_accessor_json_path} but found {len(sub_mood_lst)}"
         embedding_text_parts = []
-        for embedding_text_expr in embedding_text_exprs:
-            embedding_text_lst = [
-                match.value
-                for match in embedding_text_expr.find(sub_moods_json)
-            ]
+        for find_embedding_text in find_embedding_texts:
+            embedding_text_lst = find_embedding_text(sub_moods_json)
             assert (
                 len(embedding_text_lst) == 1
             ), f"Expected to find exactly one embedding_text for {path_record.embedding_accessor_json_path} but found {len(embedding_text_lst)}"
@@ -327,35 +365,38 @@ def get_submood_embedding_text(
 
 
 def insert_into_embeddings_table(engine, embedding_entries: List[dict]):
+    """
+    Inserts the entries not already in the table, by its unique constraint,
+    in one statement.
+    """
+    if not embedding_entries:
+        return
     Session = sessionmaker(bind=engine)
     session = Session()
 
+    columns = (
+        "mood_id",
+        "version",
+        "sub_mood",
+        "embedding_text_composite_type",
+        "embedding_text",
+        "embedding_vector",
+    )
     try:
-        for entry in embedding_entries:
-            record = (
-                session.query(SubmoodBasedEmbeddingsTable)
-                .filter(
-                    SubmoodBasedEmbeddingsTable.mood_id == entry["mood_id"],
-                    SubmoodBasedEmbeddingsTable.version == entry["version"],
-                    SubmoodBasedEmbeddingsTable.sub_mood == entry["sub_mood"],
-                    SubmoodBasedEmbeddingsTable.embedding_text_composite_type
-                    == entry["embedding_text_composite_type"],
-                )
-                .first()
-            )
-            # Only create a new entry if no record is found
-            if not record:
-                embeddings_table_entry = SubmoodBasedEmbeddingsTable(
-                    mood_id=entry["mood_id"],
-                    version=entry["version"],
-                    sub_mood=entry["sub_mood"],
-                    embedding_text_composite_type=entry[
-                        "embedding_text_composite_type"
-                    ],
-                    embedding_text=entry["embedding_text"],
-                    embedding_vector=entry["embedding_vector"],
-                )
-                session.add(embeddings_table_entry)
+        session.execute(
+            sqlite_insert(SubmoodBasedEmbeddingsTable).on_conflict_do_nothing(
+                index_elements=[
+                    "mood_id",
+                    "sub_mood",
+                    "embedding_text_composite_type",
+                    "version",
+                ]
+            ),
+            [
+                {column: entry[column] for column in columns}
+                for entry in embedding_entries
+            ],
+        )
         session.commit()
     except Exception as exp:
         session.rollback()
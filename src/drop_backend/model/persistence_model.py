@@ -1,14 +1,19 @@
 """
 Models used for abstracting away data operations.
 """
+import hashlib
 import logging
-from datetime import datetime
-from typing import Any, Dict, List, Optional
+import math
+import zlib
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
 import json
 
 from pydantic import BaseModel
 from sqlalchemy import (
     JSON,
+    Boolean,
     Column,
     Enum,
     Float,
@@ -20,14 +25,21 @@ from sqlalchemy import (
     and_,
     func,
     or_,
+    text,
 )
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import deferred, relationship
 from sqlalchemy.schema import UniqueConstraint
 
 from ..types.custom_types import When
 from ..utils.db_utils import session_manager
-from .ai_conv_types import MessageNode
+from ..utils.ors import TransitDistanceDurationCalculator
+from .ai_conv_types import (
+    MessageNode,
+    OpenAIFunctionCallSpec,
+    Role,
+    same_functions,
+)
 from .merge_base import Base
 from .mood_model_supervised import MoodSubmoodTable, SubMoodEventTable
 
@@ -51,7 +63,11 @@ class ParsedEventTable(Base):  # type: ignore
     failure_reason = Column(String, nullable=True)
     filename = Column(String, nullable=False)
     chat_history = Column(JSON, nullable=True)
-    replay_history = Column(JSON, nullable=True)
+    # Large message bodies are in ReplayHistoryBlobs, see load_replay_history.
+    # Deferred so that scans of the events do not read the histories.
+    replay_history = deferred(Column(JSON, nullable=True))
+    # zlib compressed JSON of replay_history, used instead of it when set.
+    replay_history_compressed = deferred(Column(LargeBinary, nullable=True))
     version = Column(String, nullable=False)
     parsed_event_embedding = relationship(  # type: ignore
         "ParsedEventEmbeddingsTable",
@@ -110,6 +126,258 @@ def add_geoaddress(
         session.close()
 
 
+@session_manager
+def add_geoaddresses(session, geo_addresses: List[Dict[str, Any]]) -> None:
+    """Like add_geoaddress for many, dicts of its arguments, in one transaction."""
+    session.add_all(
+        [GeoAddresses(**geo_address) for geo_address in geo_addresses]
+    )
+
+
+@session_manager
+def get_geocoded_addresses(
+    session, filename: str, version: str
+) -> Set[Tuple[int, str]]:
+    """
+    The (event id, address) of the addresses of filename and version that were
+    geocoded to coordinates. Rows recording a failed geocode are left out.
+    """
+    return {
+        (row.parsed_event_id, row.address)
+        for row in session.query(
+            GeoAddresses.parsed_event_id, GeoAddresses.address
+        )
+        .join(ParsedEventTable)
+        .filter(
+            ParsedEventTable.filename == filename,
+            ParsedEventTable.version == version,
+            GeoAddresses.latitude.is_not(None),
+            GeoAddresses.longitude.is_not(None),
+        )
+        .distinct()
+    }
+
+
+# SQLite R*Tree over GeoAddresses(latitude, longitude). Each geocoded address is a
+# degenerate box keyed by GeoAddresses.id. Triggers keep it in sync with the
+# inserts done by add_geoaddress. Also see the alembic migration that creates it.
+GEO_ADDRESSES_RTREE = "GeoAddressesRTree"
+GEO_ADDRESSES_RTREE_DDL = (
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {GEO_ADDRESSES_RTREE}
+    USING rtree(id, min_lat, max_lat, min_lon, max_lon)""",
+    f"""CREATE TRIGGER IF NOT EXISTS {GEO_ADDRESSES_RTREE}_insert
+    AFTER INSERT ON GeoAddresses
+    WHEN NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL
+    BEGIN
+        INSERT INTO {GEO_ADDRESSES_RTREE}
+        VALUES (NEW.id, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {GEO_ADDRESSES_RTREE}_update
+    AFTER UPDATE OF latitude, longitude ON GeoAddresses
+    BEGIN
+        DELETE FROM {GEO_ADDRESSES_RTREE} WHERE id = OLD.id;
+        INSERT INTO {GEO_ADDRESSES_RTREE}
+        SELECT NEW.id, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude
+        WHERE NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {GEO_ADDRESSES_RTREE}_delete
+    AFTER DELETE ON GeoAddresses
+    BEGIN
+        DELETE FROM {GEO_ADDRESSES_RTREE} WHERE id = OLD.id;
+    END""",
+)
+_METERS_PER_DEGREE_LAT = 111_320.0
+# Half the earth's circumference, no point searching beyond this.
+_MAX_SEARCH_RADIUS_METERS = 20_037_508.0
+
+
+@session_manager
+def ensure_geo_spatial_index(session) -> None:
+    """
+    Create the R*Tree and its triggers if they are missing and backfill it from
+    GeoAddresses. Safe to call on every startup.
+    """
+    for ddl in GEO_ADDRESSES_RTREE_DDL:
+        session.execute(text(ddl))
+    session.execute(
+        text(
+            f"""INSERT INTO {GEO_ADDRESSES_RTREE}
+            SELECT g.id, g.latitude, g.latitude, g.longitude, g.longitude
+            FROM GeoAddresses g
+            WHERE g.latitude IS NOT NULL AND g.longitude IS NOT NULL
+            AND g.id NOT IN (SELECT id FROM {GEO_ADDRESSES_RTREE})"""
+        )
+    )
+
+
+@dataclass
+class GeoAddressHit:
+    parsed_event_id: int
+    geo_address_id: int
+    address: str
+    latitude: float
+    longitude: float
+    distance_meters: float
+
+
+def _bounding_box(
+    lat: float, lon: float, radius_meters: float
+) -> Tuple[float, float, float, float]:
+    dlat = radius_meters / _METERS_PER_DEGREE_LAT
+    cos_lat = math.cos(math.radians(lat))
+    if radius_meters >= _MAX_SEARCH_RADIUS_METERS or cos_lat < 1e-6:
+        return -90.0, 90.0, -180.0, 180.0
+    dlon = min(180.0, radius_meters / (_METERS_PER_DEGREE_LAT * cos_lat))
+    # N2S: Boxes crossing the antimeridian are clipped, fine for our cities.
+    return (
+        lat - dlat,
+        lat + dlat,
+        max(-180.0, lon - dlon),
+        min(180.0, lon + dlon),
+    )
+
+
+def _rtree_ids_in_box(lat: float, lon: float, radius_meters: float):
+    """GeoAddresses ids inside the bounding box of the circle, via the R*Tree."""
+    min_lat, max_lat, min_lon, max_lon = _bounding_box(lat, lon, radius_meters)
+    return (
+        text(
+            f"""SELECT id FROM {GEO_ADDRESSES_RTREE}
+            WHERE max_lat >= :min_lat AND min_lat <= :max_lat
+            AND max_lon >= :min_lon AND min_lon <= :max_lon"""
+        )
+        .bindparams(
+            min_lat=min_lat, max_lat=max_lat, min_lon=min_lon, max_lon=max_lon
+        )
+        .columns(id=Integer)
+        .subquery()
+        .select()
+    )
+
+
+def _geo_hits_in_box(
+    session,
+    lat: float,
+    lon: float,
+    radius_meters: float,
+    file_versions_constraints: Optional[Dict[str, List[str]]],
+) -> List[GeoAddressHit]:
+    query = session.query(
+        GeoAddresses.id,
+        GeoAddresses.parsed_event_id,
+        GeoAddresses.address,
+        GeoAddresses.latitude,
+        GeoAddresses.longitude,
+    ).filter(GeoAddresses.id.in_(_rtree_ids_in_box(lat, lon, radius_meters)))
+    if file_versions_constraints:
+        query = query.join(
+            ParsedEventTable,
+            ParsedEventTable.id == GeoAddresses.parsed_event_id,
+        ).filter(
+            or_(
+                *[
+                    and_(
+                        ParsedEventTable.filename == filename,
+                        ParsedEventTable.version.in_(versions),
+                    )
+                    for filename, versions in file_versions_constraints.items()
+                ]
+            )
+        )
+    # The box over approximates the circle(and R*Tree stores 32 bit floats) so
+    # refine with the exact distance.
+    hits = []
+    for row in query.all():
+        distance = TransitDistanceDurationCalculator.haversine_distance(
+            (lat, lon), (row.latitude, row.longitude)
+        )
+        hits.append(
+            GeoAddressHit(
+                parsed_event_id=row.parsed_event_id,
+                geo_address_id=row.id,
+                address=row.address,
+                latitude=row.latitude,
+                longitude=row.longitude,
+                distance_meters=distance,
+            )
+        )
+    return hits
+
+
+@session_manager
+def get_event_ids_in_box(
+    session, lat: float, lon: float, radius_meters: float
+) -> Set[int]:
+    """
+    Ids of the events with a geocoded address in the bounding box of the circle,
+    looked up in the R*Tree. Callers refine by exact distance.
+    """
+    return {
+        row.parsed_event_id
+        for row in session.query(GeoAddresses.parsed_event_id)
+        .filter(GeoAddresses.id.in_(_rtree_ids_in_box(lat, lon, radius_meters)))
+        .distinct()
+    }
+
+
+def _closest_hit_per_event(hits: List[GeoAddressHit]) -> List[GeoAddressHit]:
+    closest: Dict[int, GeoAddressHit] = {}
+    for hit in hits:
+        current = closest.get(hit.parsed_event_id)
+        if current is None or hit.distance_meters < current.distance_meters:
+            closest[hit.parsed_event_id] = hit
+    return sorted(closest.values(), key=lambda hit: hit.distance_meters)
+
+
+@session_manager
+def get_events_within_radius(
+    session,
+    lat: float,
+    lon: float,
+    radius_meters: float,
+    file_versions_constraints: Optional[Dict[str, List[str]]] = None,
+) -> List[GeoAddressHit]:
+    """
+    Events with at least one geocoded address within radius_meters of (lat, lon),
+    closest first. Each event is returned once with its closest address.
+    """
+    hits = _geo_hits_in_box(
+        session, lat, lon, radius_meters, file_versions_constraints
+    )
+    return _closest_hit_per_event(
+        [hit for hit in hits if hit.distance_meters <= radius_meters]
+    )
+
+
+@session_manager
+def get_k_nearest_events(
+    session,
+    lat: float,
+    lon: float,
+    k: int,
+    file_versions_constraints: Optional[Dict[str, List[str]]] = None,
+    initial_radius_meters: float = 500.0,
+) -> List[GeoAddressHit]:
+    """
+    The k events closest to (lat, lon). The search box is doubled until it holds
+    k events that are provably closer than anything outside of it.
+    """
+    radius = initial_radius_meters
+    while True:
+        hits = _closest_hit_per_event(
+            _geo_hits_in_box(
+                session, lat, lon, radius, file_versions_constraints
+            )
+        )
+        # Everything within `radius` is guaranteed to be inside the box.
+        within = [hit for hit in hits if hit.distance_meters <= radius]
+        if len(within) >= k:
+            return within[:k]
+        if radius >= _MAX_SEARCH_RADIUS_METERS:
+            return hits[:k]
+        radius *= 2
+
+
 class ParsedEventEmbeddingsTable(Base):  # type: ignore
     __tablename__ = "ParsedEventEmbeddingsTable"
 
@@ -135,9 +403,185 @@ class ParsedEventEmbeddingsTable(Base):  # type: ignore
     )
 
 
+class ReplayHistoryBlobTable(Base):  # type: ignore
+    """
+    Message bodies that repeat across replay histories, like the system prompt
+    and the function specs, stored once by the sha256 of their JSON.
+    """
+
+    __tablename__ = "ReplayHistoryBlobs"
+
+    hash = Column(String(64), primary_key=True)
+    body = Column(Text, nullable=False)
+
+
+# Message fields whose JSON, when at least this long, is moved to
+# ReplayHistoryBlobs and replaced by {BLOB_REF: hash} in the replay history.
+BLOB_FIELDS = ("message_content", "functions")
+BLOB_MIN_LENGTH = 512
+BLOB_REF = "$blob"
+
+
+def _dedupe_replay_history(
+    replay_history_json: List[Dict[str, Any]]
+) -> Tuple[List[Dict[str, Any]], Dict[str, str]]:
+    """
+    The replay history with the large bodies replaced by references and the
+    bodies by hash, for _add_replay_history_blobs.
+    """
+    deduped = []
+    blobs: Dict[str, str] = {}
+    for message in replay_history_json:
+        message = dict(message)
+        for field in BLOB_FIELDS:
+            if message.get(field) is None:
+                continue
+            body = json.dumps(message[field], sort_keys=True)
+            if len(body) < BLOB_MIN_LENGTH:
+                continue
+            blob_hash = hashlib.sha256(body.encode("utf-8")).hexdigest()
+            blobs[blob_hash] = body
+            message[field] = {BLOB_REF: blob_hash}
+        deduped.append(message)
+    return deduped, blobs
+
+
+class ReplayHistoryTemplate:
+    """
+    The replay history of the messages that start the history of every event
+    of a run and of the function spec their user messages share, the system
+    message and function spec of lib.ai.ConversationTemplate. They are dumped
+    and deduplicated once here instead of for every event by prepare_event.
+    """
+
+    def __init__(
+        self,
+        messages: List[MessageNode],
+        functions: Optional[List[OpenAIFunctionCallSpec]] = None,
+    ):
+        self.messages = messages
+        self.functions = functions
+        self.replay_history_json, self.blobs = _dedupe_replay_history(
+            [message.model_dump(mode="json") for message in messages]
+        )
+        self.functions_json: Any = None
+        if functions:
+            ((functions_message,), functions_blobs) = _dedupe_replay_history(
+                [
+                    MessageNode(role=Role.user, functions=functions).model_dump(
+                        mode="json", include={"functions"}
+                    )
+                ]
+            )
+            self.functions_json = functions_message["functions"]
+            self.blobs.update(functions_blobs)
+
+    def dedupe(
+        self, replay_history: List[MessageNode]
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, str]]:
+        """_dedupe_replay_history of replay_history dumped in json mode."""
+        num_messages = len(self.messages)
+        if len(replay_history) < num_messages or any(
+            message is not template_message
+            for message, template_message in zip(replay_history, self.messages)
+        ):
+            return _dedupe_replay_history(
+                [message.model_dump(mode="json") for message in replay_history]
+            )
+        rest = []
+        for message in replay_history[num_messages:]:
+            if self.functions and same_functions(
+                message.functions, self.functions
+            ):
+                dumped = message.model_dump(mode="json", exclude={"functions"})
+                dumped["functions"] = self.functions_json
+            else:
+                dumped = message.model_dump(mode="json")
+            rest.append(dumped)
+        deduped, blobs = _dedupe_replay_history(rest)
+        return self.replay_history_json + deduped, {**self.blobs, **blobs}
+
+
+def _add_replay_history_blobs(session, blobs: Dict[str, str]) -> None:
+    if not blobs:
+        return
+    existing = {
+        blob_hash
+        for (blob_hash,) in session.query(ReplayHistoryBlobTable.hash).filter(
+            ReplayHistoryBlobTable.hash.in_(list(blobs))
+        )
+    }
+    session.add_all(
+        ReplayHistoryBlobTable(hash=blob_hash, body=body)
+        for blob_hash, body in blobs.items()
+        if blob_hash not in existing
+    )
+    session.flush()
+
+
+def _rehydrate_replay_history(
+    session, replay_history_json: List[Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    blob_hashes = {
+        message[field][BLOB_REF]
+        for message in replay_history_json
+        for field in BLOB_FIELDS
+        if isinstance(message.get(field), dict)
+    }
+    bodies = dict(
+        session.query(
+            ReplayHistoryBlobTable.hash, ReplayHistoryBlobTable.body
+        ).filter(ReplayHistoryBlobTable.hash.in_(blob_hashes))
+    )
+    rehydrated = []
+    for message in replay_history_json:
+        message = dict(message)
+        for field in BLOB_FIELDS:
+            if isinstance(message.get(field), dict):
+                message[field] = json.loads(bodies[message[field][BLOB_REF]])
+        rehydrated.append(message)
+    return rehydrated
+
+
 @session_manager
-def add_event(
-    session,
+def load_replay_history(
+    session, event_id: int
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    The replay history of an event as it was passed to add_event(dumped in json
+    mode), whether it was stored deduplicated, compressed or neither.
+    """
+    row = (
+        session.query(
+            ParsedEventTable.replay_history,
+            ParsedEventTable.replay_history_compressed,
+        )
+        .filter(ParsedEventTable.id == event_id)
+        .one()
+    )
+    if row.replay_history_compressed is not None:
+        replay_history_json = json.loads(
+            zlib.decompress(row.replay_history_compressed)
+        )
+    else:
+        replay_history_json = row.replay_history
+    if replay_history_json is None:
+        return None
+    return _rehydrate_replay_history(session, replay_history_json)
+
+
+@dataclass
+class PreparedEvent:
+    """
+    The ParsedEventTable columns of an event and the replay history blobs it
+    refers to, see prepare_event.
+    """
+
+    columns: Dict[str, Any]
+    blobs: Dict[str, str]
+
+
+def prepare_event(
     event: Optional[BaseModel],
     original_text: str,
     failure_reason: Optional[str],
@@ -145,32 +589,113 @@ def add_event(
     filename: str,
     version: str,
     chat_history: Optional[List[str]] = None,
-) -> int:
-    try:
+    compress_replay_history: bool = True,
+    replay_history_template: Optional[ReplayHistoryTemplate] = None,
+) -> PreparedEvent:
+    """
+    Serializes an event for add_events without touching the database, so it
+    can run on another thread than the writer.
+
+    The messages of replay_history_template that start replay_history are not
+    serialized again.
+    """
+    replay_history_json = None
+    replay_history_compressed = None
+    blobs: Dict[str, str] = {}
+    if replay_history and replay_history_template is not None:
+        replay_history_json, blobs = replay_history_template.dedupe(
+            replay_history
+        )
+    elif replay_history:
+        replay_history_json, blobs = _dedupe_replay_history(
+            [message.model_dump(mode="json") for message in replay_history]
+        )
+    if replay_history_json is not None and compress_replay_history:
+        replay_history_compressed = zlib.compress(
+            json.dumps(replay_history_json).encode("utf-8")
+        )
         replay_history_json = None
-        if replay_history:
-            replay_history_json = [
-                message.model_dump(mode="json") for message in replay_history
-            ]
-        event_table = ParsedEventTable(
+    return PreparedEvent(
+        columns=dict(
             name=event.name if event and "name" in event.model_fields else None,  # type: ignore
-            description=event.description  # type: ignore
-            if event and "description" in event.model_fields
-            else None,
-            event_json=json.loads(event.model_dump_json(exclude=["name", "description"]))
-            if event is not None
-            else None,
+            description=(
+                event.description  # type: ignore
+                if event and "description" in event.model_fields
+                else None
+            ),
+            event_json=(
+                json.loads(
+                    event.model_dump_json(exclude=["name", "description"])
+                )
+                if event is not None
+                else None
+            ),
             original_event=original_text,
             replay_history=replay_history_json,
+            replay_history_compressed=replay_history_compressed,
             chat_history=chat_history,
             failure_reason=failure_reason,
             filename=filename,
             version=version,
-        )
+        ),
+        blobs=blobs,
+    )
 
-        session.add(event_table)
-        session.commit()
-        return event_table.id  # type: ignore
+
+def _add_prepared_events(session, events: List[PreparedEvent]) -> List[int]:
+    blobs: Dict[str, str] = {}
+    for event in events:
+        blobs.update(event.blobs)
+    _add_replay_history_blobs(session, blobs)
+    event_tables = [ParsedEventTable(**event.columns) for event in events]
+    session.add_all(event_tables)
+    session.flush()
+    for event_table in event_tables:
+        if event_table.event_json is not None:
+            session.add_all(
+                build_event_time_windows(
+                    event_table.id, event_table.event_json  # type: ignore
+                )
+            )
+    session.commit()
+    return [event_table.id for event_table in event_tables]  # type: ignore
+
+
+@session_manager
+def add_event(
+    session,
+    event: Optional[BaseModel],
+    original_text: str,
+    failure_reason: Optional[str],
+    replay_history: Optional[List[MessageNode]],
+    filename: str,
+    version: str,
+    chat_history: Optional[List[str]] = None,
+    compress_replay_history: bool = True,
+    replay_history_template: Optional[ReplayHistoryTemplate] = None,
+) -> int:
+    """
+    Read the replay history back with load_replay_history, its large repeated
+    messages are stored once in ReplayHistoryBlobs and, if
+    compress_replay_history, the rest is zlib compressed.
+    """
+    try:
+        return _add_prepared_events(
+            session,
+            [
+                prepare_event(
+                    event,
+                    original_text,
+                    failure_reason,
+                    replay_history,
+                    filename,
+                    version,
+                    chat_history=chat_history,
+                    compress_replay_history=compress_replay_history,
+                    replay_history_template=replay_history_template,
+                )
+            ],
+        )[0]
     except SQLAlchemyError as error:
         session.rollback()
         logger.error("Failed to add event %s to database!", original_text)
@@ -178,6 +703,21 @@ def add_event(
         raise error
 
 
+@session_manager
+def add_events(session, events: List[PreparedEvent]) -> List[int]:
+    """
+    Adds the prepared events in one transaction and returns their ids in
+    order. Much cheaper per event than add_event for SQLite.
+    """
+    try:
+        return _add_prepared_events(session, events)
+    except SQLAlchemyError as error:
+        session.rollback()
+        logger.error("Failed to add %d events to database!", len(events))
+        logger.exception(error)
+        raise error
+
+
 @session_manager
 def get_max_id_by_version_and_filename(session, version, filename):
     try:
@@ -312,8 +852,6 @@ def fetch_events_geocoded_mood_attached(
     - db (Session): The database session.
     - filename (str): The filename to filter events on.
     - version (str): The version to filter events on.
-    - lat (float): Latitude of the reference location.
-    - long (float): Longitude of the reference location.
 
     Returns:
     - List[models.ParsedEventTable]: A list of events.
@@ -491,6 +1029,379 @@ def should_include_event(
     return False
 
 
+class EventTimeWindowTable(Base):  # type: ignore
+    """
+    Occurrences of an event normalized at ingest so that should_include_event does
+    not have to parse dates for every event on every request.
+
+    Times are seconds since the epoch of the naive datetimes in event_json. Where
+    should_include_event defaults a missing date or time to `datetime_now` the
+    row is relative(is_relative): start_ts/end_ts are NULL and the NULL
+    start_day/start_second/end_day components are filled in at query time.
+    occurrence == NO_OCCURRENCE marks an event without any dated occurrence, it
+    is included only if it is ongoing.
+    """
+
+    __tablename__ = "EventTimeWindows"
+
+    id = Column(Integer, primary_key=True)
+    event_id = Column(
+        Integer, ForeignKey("parsed_events.id"), nullable=False, index=True
+    )
+    occurrence = Column(Integer, nullable=False)
+    start_ts = Column(Integer, nullable=True, index=True)
+    end_ts = Column(Integer, nullable=True, index=True)
+    is_ongoing = Column(Boolean, nullable=False, default=False)
+    is_relative = Column(Boolean, nullable=False, default=False)
+    start_day = Column(Integer, nullable=True)  # Days since the epoch.
+    start_second = Column(Integer, nullable=True)  # Second of the day.
+    end_day = Column(Integer, nullable=True)
+    end_second = Column(Integer, nullable=False, default=0)
+
+
+NO_OCCURRENCE = -1
+_EPOCH = datetime(1970, 1, 1)
+_SECONDS_PER_DAY = 86400
+_MICROS = 1_000_000
+
+
+def _parse_day(date_str: str) -> int:
+    return (datetime.strptime(date_str, "%Y-%m-%d").date() - _EPOCH.date()).days
+
+
+def _parse_second(time_str: str) -> int:
+    try:
+        parsed = datetime.strptime(time_str, "%H:%M")
+    except ValueError:
+        parsed = datetime.strptime(time_str, "%H:%M:%S")
+    return parsed.hour * 3600 + parsed.minute * 60 + parsed.second
+
+
+def build_event_time_windows(
+    event_id: int, event_json: Dict[str, Any]
+) -> List[EventTimeWindowTable]:
+    """
+    Mirror of the defaults in should_include_event, see there for the rules.
+    Returns no rows if the dates can't be parsed; such events are left to
+    should_include_event(which raises for them).
+    """
+    start_dates = event_json.get("start_date", []) or []
+    end_dates = event_json.get("end_date", []) or []
+    start_times = event_json.get("start_time", []) or []
+    end_times = event_json.get("end_time", []) or []
+    is_ongoing = bool(event_json.get("is_ongoing", False))
+
+    if not all(
+        isinstance(i, list)
+        for i in [start_dates, end_dates, start_times, end_times]
+    ):
+        return []
+    if (start_times and not start_dates) or (end_times and not end_dates):
+        # Invalid data, never included.
+        return [
+            EventTimeWindowTable(
+                event_id=event_id, occurrence=NO_OCCURRENCE, is_ongoing=False
+            )
+        ]
+    if not any([start_dates, end_dates, start_times, end_times]):
+        return [
+            EventTimeWindowTable(
+                event_id=event_id,
+                occurrence=NO_OCCURRENCE,
+                is_ongoing=is_ongoing,
+            )
+        ]
+
+    windows = []
+    max_occurrences = max(
+        [len(start_dates), len(end_dates), len(start_times), len(end_times)]
+    )
+    try:
+        for i in range(max_occurrences):
+            # None stands for the date or time of datetime_now.
+            start_day = (
+                _parse_day(start_dates[i]) if i < len(start_dates) else None
+            )
+            end_day = (
+                _parse_day(end_dates[i]) if i < len(end_dates) else start_day
+            )
+            if i < len(start_times):
+                start_second: Optional[int] = _parse_second(start_times[i])
+            else:
+                start_second = 0 if len(start_dates) < i else None
+            end_second = (
+                _parse_second(end_times[i])
+                if i < len(end_times)
+                else _parse_second("23:59")
+            )
+            is_relative = start_day is None or start_second is None
+            windows.append(
+                EventTimeWindowTable(
+                    event_id=event_id,
+                    occurrence=i,
+                    start_ts=(
+                        None
+                        if is_relative
+                        else start_day * _SECONDS_PER_DAY + start_second
+                    ),  # type: ignore
+                    end_ts=(
+                        None
+                        if end_day is None
+                        else end_day * _SECONDS_PER_DAY + end_second
+                    ),
+                    is_ongoing=is_ongoing,
+                    is_relative=is_relative or end_day is None,
+                    start_day=start_day,
+                    start_second=start_second,
+                    end_day=end_day,
+                    end_second=end_second,
+                )
+            )
+    except (ValueError, TypeError) as exc:
+        logger.warning(
+            "Not indexing time windows for event %d: %s", event_id, exc
+        )
+        return []
+    return windows
+
+
+def _epoch_micros(datetime_now: datetime) -> int:
+    delta = datetime_now - _EPOCH
+    return (
+        delta.days * _SECONDS_PER_DAY + delta.seconds
+    ) * _MICROS + delta.microseconds
+
+
+def include_event_from_windows(
+    when: When,
+    datetime_now: datetime,
+    now_window: int,
+    windows: List[EventTimeWindowTable],
+) -> bool:
+    """
+    Same decision as should_include_event but over the precomputed windows of an
+    event(ordered by occurrence) with integer arithmetic only.
+    """
+    now = _epoch_micros(datetime_now)
+    window = now_window * 3600 * _MICROS
+    today = (datetime_now.date() - _EPOCH.date()).days
+    # should_include_event formats the default start time as %H:%M
+    now_second = datetime_now.hour * 3600 + datetime_now.minute * 60
+    for row in windows:
+        if row.occurrence == NO_OCCURRENCE:
+            return bool(row.is_ongoing) and when == When.NOW
+        start_day = today if row.start_day is None else row.start_day
+        start_second = (
+            now_second if row.start_second is None else row.start_second
+        )
+        end_day = today if row.end_day is None else row.end_day
+        start = (start_day * _SECONDS_PER_DAY + start_second) * _MICROS
+        end = (end_day * _SECONDS_PER_DAY + row.end_second) * _MICROS
+
+        has_already_started = start <= now
+        has_already_ended = end < now
+        if has_already_started and not has_already_ended:
+            return when == When.NOW
+        if has_already_ended:
+            return False
+        if when == When.NOW:
+            if (start - now <= window) or (0 <= end - now <= window):
+                return True
+        elif start - now > window:
+            return True
+    return False
+
+
+@dataclass
+class TimeWindowFilter:
+    # Events whose windows say they should be included.
+    included: Set[int]
+    # All events that have windows; the others need should_include_event.
+    indexed: Set[int]
+
+    def should_include(self, event_id: int) -> Optional[bool]:
+        if event_id not in self.indexed:
+            return None
+        return event_id in self.included
+
+
+@session_manager
+def get_time_window_filter(
+    session,
+    file_versions_constraints: Dict[str, List[str]],
+    when: When,
+    datetime_now: datetime,
+    now_window: int,
+) -> TimeWindowFilter:
+    """
+    NOW/LATER filtering over EventTimeWindows. A range query on the start_ts and
+    end_ts indices picks the candidate events; only those(and events with
+    relative windows) are checked exactly with include_event_from_windows.
+    """
+    file_filter = or_(
+        *[
+            and_(
+                ParsedEventTable.filename == filename,
+                ParsedEventTable.version.in_(versions),
+            )
+            for filename, versions in file_versions_constraints.items()
+        ]
+    )
+    indexed = {
+        row.event_id
+        for row in session.query(EventTimeWindowTable.event_id)
+        .join(
+            ParsedEventTable,
+            ParsedEventTable.id == EventTimeWindowTable.event_id,
+        )
+        .filter(file_filter)
+        .distinct()
+    }
+    # Whole seconds, rounded so that the candidates are a superset.
+    now_floor = _epoch_micros(datetime_now) // _MICROS
+    now_ceil = -(-_epoch_micros(datetime_now) // _MICROS)
+    window = now_window * 3600
+    if when == When.NOW:
+        absolute = and_(
+            EventTimeWindowTable.end_ts >= now_floor,
+            or_(
+                EventTimeWindowTable.start_ts <= now_ceil + window,
+                EventTimeWindowTable.end_ts <= now_ceil + window,
+            ),
+        )
+        no_occurrence = and_(
+            EventTimeWindowTable.occurrence == NO_OCCURRENCE,
+            EventTimeWindowTable.is_ongoing.is_(True),
+        )
+    else:
+        absolute = and_(
+            EventTimeWindowTable.start_ts >= now_floor + window,
+            EventTimeWindowTable.end_ts >= now_floor,
+        )
+        no_occurrence = False  # type: ignore
+    candidates = (
+        session.query(EventTimeWindowTable.event_id)
+        .join(
+            ParsedEventTable,
+            ParsedEventTable.id == EventTimeWindowTable.event_id,
+        )
+        .filter(file_filter)
+        .filter(
+            or_(
+                and_(EventTimeWindowTable.is_relative.is_(False), absolute),
+                EventTimeWindowTable.is_relative.is_(True),
+                no_occurrence,
+            )
+        )
+        .distinct()
+        .subquery()
+    )
+    windows_by_event: Dict[int, List[EventTimeWindowTable]] = {}
+    for row in (
+        session.query(EventTimeWindowTable)
+        .filter(EventTimeWindowTable.event_id.in_(candidates.select()))
+        .order_by(
+            EventTimeWindowTable.event_id, EventTimeWindowTable.occurrence
+        )
+    ):
+        windows_by_event.setdefault(row.event_id, []).append(row)
+    included = {
+        event_id
+        for event_id, windows in windows_by_event.items()
+        if include_event_from_windows(when, datetime_now, now_window, windows)
+    }
+    return TimeWindowFilter(included=included, indexed=indexed)
+
+
+@session_manager
+def index_event_time_windows(
+    session, filename: str, version: str, reindex: bool = False
+) -> int:
+    """Backfill EventTimeWindows for events ingested before it existed."""
+    already_indexed = session.query(EventTimeWindowTable.event_id).distinct()
+    query = session.query(
+        ParsedEventTable.id, ParsedEventTable.event_json
+    ).filter(
+        ParsedEventTable.filename == filename,
+        ParsedEventTable.version == version,
+        ParsedEventTable.event_json.isnot(None),
+    )
+    if reindex:
+        session.query(EventTimeWindowTable).filter(
+            EventTimeWindowTable.event_id.in_(
+                session.query(ParsedEventTable.id).filter(
+                    ParsedEventTable.filename == filename,
+                    ParsedEventTable.version == version,
+                )
+            )
+        ).delete(synchronize_session=False)
+    else:
+        query = query.filter(ParsedEventTable.id.notin_(already_indexed))
+    num_indexed = 0
+    for event_id, event_json in query.all():
+        if not isinstance(event_json, dict):
+            continue
+        session.add_all(build_event_time_windows(event_id, event_json))
+        num_indexed += 1
+    return num_indexed
+
+
+class DataVersionTable(Base):  # type: ignore
+    """
+    A counter per (filename, version) that the batch commands bump whenever
+    they write events, geo addresses or moods for it. Readers that cache
+    derived data compare these stamps to know when to rebuild.
+    """
+
+    __tablename__ = "DataVersions"
+
+    filename = Column(String, primary_key=True)
+    version = Column(String, primary_key=True)
+    stamp = Column(Integer, nullable=False, default=0)
+
+
+@session_manager
+def bump_data_version(session, filename: str, version: str) -> int:
+    row = session.get(DataVersionTable, (filename, version))
+    if row is None:
+        row = DataVersionTable(filename=filename, version=version, stamp=0)
+        session.add(row)
+    row.stamp += 1
+    return row.stamp
+
+
+@session_manager
+def get_data_versions(
+    session, file_versions_constraints: Dict[str, List[str]]
+) -> Dict[Tuple[str, str], int]:
+    """Stamps for the constraints, 0 for data that was never stamped."""
+    stamps = {
+        (filename, version): 0
+        for filename, versions in file_versions_constraints.items()
+        for version in versions
+    }
+    if not stamps:
+        return stamps
+    rows = session.query(
+        DataVersionTable.filename,
+        DataVersionTable.version,
+        DataVersionTable.stamp,
+    ).filter(
+        or_(
+            *[
+                and_(
+                    DataVersionTable.filename == filename,
+                    DataVersionTable.version.in_(versions),
+                )
+                for filename, versions in file_versions_constraints.items()
+            ]
+        )
+    )
+    for filename, version, stamp in rows:
+        stamps[(filename, version)] = stamp
+    return stamps
+
+
 @session_manager
 def get_parsed_embeddings_by_version_and_filename(
     session, version: str, filename: str, embedding_type: str
@@ -527,6 +1438,24 @@ def get_parsed_embeddings_by_version_and_filename(
         raise error
 
 
+@session_manager
+def get_embedded_event_ids(
+    session, filename: str, version: str, embedding_type: str
+) -> Set[int]:
+    """The events of filename and version with an embedding_type embedding."""
+    return {
+        row.parsed_event_id
+        for row in session.query(ParsedEventEmbeddingsTable.parsed_event_id)
+        .join(ParsedEventTable)
+        .filter(
+            ParsedEventTable.filename == filename,
+            ParsedEventTable.version == version,
+            ParsedEventEmbeddingsTable.embedding_version == version,
+            ParsedEventEmbeddingsTable.embedding_type == embedding_type,
+        )
+    }
+
+
 @session_manager
 def insert_parsed_event_embeddings(session, events: List[Dict[str, str]]):
     # Query the database for the given column with the given version and filename
@@ -540,3 +1469,101 @@ def insert_parsed_event_embeddings(session, events: List[Dict[str, str]]):
         )
         embedding_lst.append(parsed_event_embedding)
     session.add_all(embedding_lst)
+
+
+@dataclass
+class ExportChunk:
+    """
+    Rows of one chunk of events and of the rows that refer to them, read by
+    get_export_chunk. Rows are tuples in the order of the queried columns.
+    """
+
+    last_event_id: int
+    events: List[Tuple[Any, ...]]
+    geo_addresses: List[Tuple[Any, ...]]
+    moods: List[Tuple[Any, ...]]
+    embeddings: List[Tuple[Any, ...]]
+
+
+@session_manager
+def get_export_chunk(
+    session,
+    filename: str,
+    version: str,
+    after_event_id: int,
+    chunk_size: int,
+) -> Optional[ExportChunk]:
+    """
+    The next chunk_size events with id > after_event_id, None after the last
+    one. Paging on the id keeps each query an index range scan and only one
+    chunk in memory, the large text and history columns are not read.
+    """
+    events = (
+        session.query(
+            ParsedEventTable.id,
+            ParsedEventTable.filename,
+            ParsedEventTable.version,
+            ParsedEventTable.name,
+            ParsedEventTable.description,
+            ParsedEventTable.failure_reason,
+            ParsedEventTable.event_json,
+        )
+        .filter(ParsedEventTable.filename == filename)
+        .filter(ParsedEventTable.version == version)
+        .filter(ParsedEventTable.id > after_event_id)
+        .order_by(ParsedEventTable.id)
+        .limit(chunk_size)
+        .all()
+    )
+    if not events:
+        return None
+    event_ids = [event[0] for event in events]
+    geo_addresses = (
+        session.query(
+            GeoAddresses.id,
+            GeoAddresses.parsed_event_id,
+            GeoAddresses.address,
+            GeoAddresses.latitude,
+            GeoAddresses.longitude,
+            GeoAddresses.failure_reason,
+        )
+        .filter(GeoAddresses.parsed_event_id.in_(event_ids))
+        .order_by(GeoAddresses.parsed_event_id, GeoAddresses.id)
+        .all()
+    )
+    moods = (
+        session.query(
+            SubMoodEventTable.event_id,
+            MoodSubmoodTable.id,
+            MoodSubmoodTable.mood,
+            MoodSubmoodTable.submood,
+        )
+        .join(
+            MoodSubmoodTable,
+            SubMoodEventTable.mood_sub_mood_id == MoodSubmoodTable.id,
+        )
+        .filter(SubMoodEventTable.event_id.in_(event_ids))
+        .order_by(SubMoodEventTable.event_id, MoodSubmoodTable.id)
+        .all()
+    )
+    embeddings = (
+        session.query(
+            ParsedEventEmbeddingsTable.parsed_event_id,
+            ParsedEventEmbeddingsTable.embedding_type,
+            ParsedEventEmbeddingsTable.embedding_version,
+            ParsedEventEmbeddingsTable.embedding,
+        )
+        .filter(ParsedEventEmbeddingsTable.parsed_event_id.in_(event_ids))
+        .order_by(
+            ParsedEventEmbeddingsTable.parsed_event_id,
+            ParsedEventEmbeddingsTable.id,
+        )
+        .all()
+    )
+    return ExportChunk(
+        last_event_id=event_ids[-1],
+        events=[tuple(row) for row in events],
+        geo_addresses=[tuple(row) for row in geo_addresses],
+        moods=[tuple(row) for row in moods],
+        embeddings=[tuple(row) for row in embeddings],
+    )
@@ -208,3 +208,12 @@ def city_event_function_call_param() -> Tuple[List[OpenAIFunctionCallSpec], User
         ],
         UserExplicitFunctionCall(name="create_city_event"),
     )
+
+import functools
+from typing import Any, Callable, Dict
+
+from drop_backend.lib.config_generator import compile_arguments_validator
+
+@functools.lru_cache(maxsize=None)
+def city_event_arguments_validator() -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+    return compile_arguments_validator(city_event_json_schema())
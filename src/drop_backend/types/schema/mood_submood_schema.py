@@ -103,3 +103,12 @@ def mood_submood_function_call_param() -> Tuple[List[OpenAIFunctionCallSpec], Us
         # TODO: Also support "auto" and "none"
         UserExplicitFunctionCall(name="create_mood_submood"),
     )
+
+import functools
+from typing import Any, Callable, Dict
+
+from drop_backend.lib.config_generator import compile_arguments_validator
+
+@functools.lru_cache(maxsize=None)
+def mood_submood_arguments_validator() -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+    return compile_arguments_validator(mood_submood_json_schema())
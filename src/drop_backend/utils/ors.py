@@ -1,8 +1,10 @@
 import enum
 import logging
 import math
+import threading
+import time
 from dataclasses import dataclass
-from typing import Dict, Union
+from typing import Callable, Dict, Optional, Tuple, Union
 
 import requests
 from pydantic import BaseModel, ValidationError
@@ -62,30 +64,210 @@ class GeoLocation:
     longitude: float
 
 
+class CircuitState(str, enum.Enum):
+    closed = "closed"
+    open = "open"
+    half_open = "half_open"
+
+
+@dataclass
+class _ProfileCircuit:
+    state: CircuitState = CircuitState.closed
+    consecutive_failures: int = 0
+    opened_at: float = 0.0
+    # Only one request is let through while half open.
+    probe_in_flight: bool = False
+
+
+class CircuitBreaker:
+    """
+    Per profile circuit breaker for the ORS directions API.
+
+    - closed: requests go to ORS. `failure_threshold` consecutive timeouts open the circuit.
+    - open: requests are short circuited(callers use the haversine fallback) until
+    `cooldown_seconds` have passed.
+    - half_open: a single probe request is allowed; success closes the circuit,
+    failure opens it again for another cooldown.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 3,
+        cooldown_seconds: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if failure_threshold < 1:
+            raise ValueError("failure_threshold must be at least 1")
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._circuits: Dict[Profile, _ProfileCircuit] = {}
+
+    def _circuit(self, profile: Profile) -> _ProfileCircuit:
+        if profile not in self._circuits:
+            self._circuits[profile] = _ProfileCircuit()
+        return self._circuits[profile]
+
+    def state(self, profile: Profile) -> CircuitState:
+        with self._lock:
+            return self._circuit(profile).state
+
+    def cooldown_elapsed(self, profile: Profile) -> bool:
+        with self._lock:
+            circuit = self._circuit(profile)
+            return (
+                circuit.state == CircuitState.open
+                and self._clock() - circuit.opened_at >= self.cooldown_seconds
+            )
+
+    def allow_request(self, profile: Profile) -> bool:
+        with self._lock:
+            circuit = self._circuit(profile)
+            if circuit.state == CircuitState.closed:
+                return True
+            if circuit.state == CircuitState.open:
+                if self._clock() - circuit.opened_at < self.cooldown_seconds:
+                    return False
+                logger.info("Circuit for %s is half open", profile.value)
+                circuit.state = CircuitState.half_open
+                circuit.probe_in_flight = False
+            # half open
+            if circuit.probe_in_flight:
+                return False
+            circuit.probe_in_flight = True
+            return True
+
+    def record_success(self, profile: Profile) -> None:
+        with self._lock:
+            circuit = self._circuit(profile)
+            if circuit.state != CircuitState.closed:
+                logger.info("Circuit for %s is closed again", profile.value)
+            circuit.state = CircuitState.closed
+            circuit.consecutive_failures = 0
+            circuit.probe_in_flight = False
+
+    def record_failure(self, profile: Profile) -> None:
+        with self._lock:
+            circuit = self._circuit(profile)
+            circuit.consecutive_failures += 1
+            circuit.probe_in_flight = False
+            if (
+                circuit.state == CircuitState.half_open
+                or circuit.consecutive_failures >= self.failure_threshold
+            ):
+                if circuit.state != CircuitState.open:
+                    logger.warning(
+                        "Opening circuit for %s after %d failures",
+                        profile.value,
+                        circuit.consecutive_failures,
+                    )
+                circuit.state = CircuitState.open
+                circuit.opened_at = self._clock()
+
+
+# Breakers are shared per endpoint so that state survives across the short
+# lived calculators created for every webdemo request.
+_circuit_breakers: Dict[str, CircuitBreaker] = {}
+_circuit_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(ors_api_endpoint: str, **kwargs) -> CircuitBreaker:
+    with _circuit_breakers_lock:
+        if ors_api_endpoint not in _circuit_breakers:
+            _circuit_breakers[ors_api_endpoint] = CircuitBreaker(**kwargs)
+        return _circuit_breakers[ors_api_endpoint]
+
+
+class ORSHealthCheck(threading.Thread):
+    """
+    Background thread that probes open circuits once their cooldown is over, so
+    that recovery does not have to wait for(and slow down) a user request.
+    """
+
+    def __init__(
+        self,
+        calculator: "TransitDistanceDurationCalculator",
+        interval_seconds: float = 10.0,
+        probe_coordinates: Tuple[Tuple[float, float], Tuple[float, float]] = (
+            # Two points in Hoboken.
+            (40.7440, -74.0324),
+            (40.7484, -74.0270),
+        ),
+    ):
+        super().__init__(name="ors-health-check", daemon=True)
+        self.calculator = calculator
+        self.interval_seconds = interval_seconds
+        self.probe_coordinates = probe_coordinates
+        self._stopped = threading.Event()
+
+    def probe_once(self) -> None:
+        breaker = self.calculator.circuit_breaker
+        (lat1, lon1), (lat2, lon2) = self.probe_coordinates
+        for profile in Profile:
+            if breaker.cooldown_elapsed(profile) and breaker.allow_request(
+                profile
+            ):
+                self.calculator.request_direction(
+                    profile, lat1, lon1, lat2, lon2
+                )
+
+    def run(self) -> None:
+        while not self._stopped.wait(self.interval_seconds):
+            try:
+                self.probe_once()
+            except Exception as exc:  # pylint: disable=broad-except
+                logger.exception(exc)
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+
+# Answers of an ORS that is overloaded or down rather than of a bad request.
+_OVERLOADED_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+# One health check per endpoint, like the circuit breakers.
+_health_checks: Dict[str, ORSHealthCheck] = {}
+
+
+def ensure_health_check(
+    calculator: "TransitDistanceDurationCalculator",
+    interval_seconds: float = 10.0,
+) -> ORSHealthCheck:
+    """Starts the health check of the calculator's endpoint if not running."""
+    with _circuit_breakers_lock:
+        health_check = _health_checks.get(calculator.ors_api_endpoint)
+        if health_check is None or not health_check.is_alive():
+            health_check = calculator.start_health_check(interval_seconds)
+            _health_checks[calculator.ors_api_endpoint] = health_check
+        return health_check
+
+
 class TransitDistanceDurationCalculator:
     def __init__(
         self,
         ors_api_endpoint="http://127.0.0.1:8080/ors/v2/directions/{profile}",
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        request_timeout: float = 3,
     ):
-        # Incase of a time out connecting to ORS
-        self.should_use_fallback_distance = False
         self.ors_api_endpoint = ors_api_endpoint
+        # Incase of time outs connecting to ORS we fall back to haversine
+        # distance per profile while the circuit is open.
+        self.circuit_breaker = circuit_breaker or get_circuit_breaker(
+            ors_api_endpoint
+        )
+        self.request_timeout = request_timeout
         self.default_walking_speed = (
             1.42  # Assume walking at 5 kmph. This is m/s
         )
         self.default_driving_speed = 11.16  # Assume driving at 40 kmph
 
-    def _should_use_fallback_distance(
-        self,
-        direction: Dict[
-            Profile, Union[TransitDirectionSummary, TransitDirectionError]
-        ],
-    ):
-        # use haversine distance if the error in any one profile has a 999 time out error return true
-        for _, val in direction.items():
-            if isinstance(val, TransitDirectionError) and val.code == 999:
-                return True
-        return False
+    def start_health_check(
+        self, interval_seconds: float = 10.0
+    ) -> ORSHealthCheck:
+        health_check = ORSHealthCheck(self, interval_seconds=interval_seconds)
+        health_check.start()
+        return health_check
 
     def get_transit_distance_duration_wrapper(
         self, source_lat, source_lon, geo_dict: dict[str, GeoLocation]
@@ -107,29 +289,17 @@ class TransitDistanceDurationCalculator:
         return_data = []
 
         for address, geoloc in geo_dict.items():
-            val_or_error = self.get_transit_distance_duration(
-                source_lat,
-                source_lon,
-                geoloc.latitude,
-                geoloc.longitude,
-                self.should_use_fallback_distance,
-            )
-            if self._should_use_fallback_distance(val_or_error):
-                self.should_use_fallback_distance = True
-                return_data.append(
-                    (
-                        self.get_transit_distance_duration(
-                            source_lat,
-                            source_lon,
-                            geoloc.latitude,
-                            geoloc.longitude,
-                            self.should_use_fallback_distance,
-                        ),
-                        address,
-                    )
+            return_data.append(
+                (
+                    self.get_transit_distance_duration(
+                        source_lat,
+                        source_lon,
+                        geoloc.latitude,
+                        geoloc.longitude,
+                    ),
+                    address,
                 )
-            else:
-                return_data.append((val_or_error, address))
+            )
         return sorted(
             return_data,
             key=lambda x: _fn(*x),
@@ -160,6 +330,26 @@ class TransitDistanceDurationCalculator:
 
         return distance
 
+    def _fallback_direction(
+        self,
+        profile: Profile,
+        lat1: float,
+        lon1: float,
+        lat2: float,
+        lon2: float,
+    ) -> TransitDirectionSummary:
+        distance = self.haversine_distance((lat1, lon1), (lat2, lon2))
+        speed = (
+            self.default_walking_speed
+            if profile == Profile.foot_walking
+            else self.default_driving_speed
+        )
+        return TransitDirectionSummary(
+            distance,
+            distance / speed,
+            Units("meters", "seconds"),
+        )
+
     def get_transit_distance_duration(
         self,
         lat1: float,
@@ -168,28 +358,6 @@ class TransitDistanceDurationCalculator:
         lon2: float,
         use_haversine=False,
     ) -> Dict[Profile, Union[TransitDirectionSummary, TransitDirectionError]]:
-        if use_haversine:
-            distance = self.haversine_distance((lat1, lon1), (lat2, lon2))
-            walking_time = distance / self.default_walking_speed  # Assume walking at 5 kmph
-            driving_time = distance / self.default_driving_speed  # Assume driving at 40 kmph
-            return {
-                Profile.foot_walking: TransitDirectionSummary(
-                    distance,
-                    walking_time,
-                    Units("meters", "seconds"),
-                ),
-                Profile.driving_car: TransitDirectionSummary(
-                    self.haversine_distance((lat1, lon1), (lat2, lon2)),
-                    driving_time,
-                    Units("meters", "seconds"),
-                ),
-            }
-        headers = {
-            "Content-Type": "application/json; charset=utf-8",
-            "Accept": "application/json, application/geo+json, application/gpx+xml, img/png; charset=utf-8",
-        }
-        data = {"coordinates": [[lon1, lat1], [lon2, lat2]], "radiuses": [-1]}
-
         profiles = [
             Profile.driving_car,
             Profile.foot_walking,
@@ -199,52 +367,98 @@ class TransitDistanceDurationCalculator:
         ] = {}
 
         for profile in profiles:
-            try:
-                response = requests.post(
-                    self.ors_api_endpoint.format(profile=profile.value),
-                    headers=headers,
-                    json=data,
-                    timeout=3,
-                )
-            except (
-                requests.exceptions.ReadTimeout,
-                requests.exceptions.ConnectionError,
-            ) as exc:
-                logger.exception(
-                    "Read or connection Timeout for profile %s", profile.value
+            if use_haversine or not self.circuit_breaker.allow_request(profile):
+                directions[profile] = self._fallback_direction(
+                    profile, lat1, lon1, lat2, lon2
                 )
-                directions[profile] = TransitDirectionError(999, str(exc))
                 continue
-            if response.status_code == 200:
-                try:
-                    response_data = SuccessfulResponse.model_validate_json(
-                        response.text
-                    )
-                    directions[profile] = TransitDirectionSummary(
-                        response_data.routes[0].summary.distance,
-                        response_data.routes[0].summary.duration,
-                        Units("meters", "seconds"),
-                    )
-                except ValidationError as ex:
-                    logger.exception(
-                        "Failed to parse successful response for profile %s: %s",
-                        profile.value,
-                        str(ex),
-                    )
-                    raise ex
-            else:
-                try:
-                    error_data = ErrorResponse.model_validate(response.json())
-                    directions[profile] = TransitDirectionError(
-                        error_data.error.code,
-                        error_data.error.message,
-                    )
-                except ValidationError as ex:
-                    logger.exception(
-                        "Failed to parse error response for profile %s: %s",
-                        profile,
-                        str(ex),
-                    )
-                    raise ex
+            direction = self.request_direction(profile, lat1, lon1, lat2, lon2)
+            if (
+                isinstance(direction, TransitDirectionError)
+                and direction.code == 999
+            ):
+                # ORS timed out; degrade to haversine for this call.
+                direction = self._fallback_direction(
+                    profile, lat1, lon1, lat2, lon2
+                )
+            directions[profile] = direction
 
         return directions
+
+    def request_direction(
+        self,
+        profile: Profile,
+        lat1: float,
+        lon1: float,
+        lat2: float,
+        lon2: float,
+    ) -> Union[TransitDirectionSummary, TransitDirectionError]:
+        """
+        Call ORS for a single profile and record the outcome on the circuit breaker.
+        Failed requests and overloaded answers(429, 5xx) are returned as a
+        TransitDirectionError with code 999.
+        """
+        headers = {
+            "Content-Type": "application/json; charset=utf-8",
+            "Accept": "application/json, application/geo+json, application/gpx+xml, img/png; charset=utf-8",
+        }
+        data = {"coordinates": [[lon1, lat1], [lon2, lat2]], "radiuses": [-1]}
+        try:
+            response = requests.post(
+                self.ors_api_endpoint.format(profile=profile.value),
+                headers=headers,
+                json=data,
+                timeout=self.request_timeout,
+            )
+        except requests.exceptions.RequestException as exc:
+            logger.exception(
+                "Request to ORS failed for profile %s", profile.value
+            )
+            self.circuit_breaker.record_failure(profile)
+            return TransitDirectionError(999, str(exc))
+        except Exception:
+            # Never leave a half open circuit waiting for its probe.
+            self.circuit_breaker.record_failure(profile)
+            raise
+        if response.status_code in _OVERLOADED_STATUS_CODES:
+            logger.warning(
+                "ORS answered %d for profile %s",
+                response.status_code,
+                profile.value,
+            )
+            self.circuit_breaker.record_failure(profile)
+            return TransitDirectionError(
+                999, f"ORS answered {response.status_code}"
+            )
+        # ORS answered, even if it was an error for these coordinates.
+        self.circuit_breaker.record_success(profile)
+        if response.status_code == 200:
+            try:
+                response_data = SuccessfulResponse.model_validate_json(
+                    response.text
+                )
+                return TransitDirectionSummary(
+                    response_data.routes[0].summary.distance,
+                    response_data.routes[0].summary.duration,
+                    Units("meters", "seconds"),
+                )
+            except ValidationError as ex:
+                logger.exception(
+                    "Failed to parse successful response for profile %s: %s",
+                    profile.value,
+                    str(ex),
+                )
+                raise ex
+        try:
+            error_data = ErrorResponse.model_validate(response.json())
+            return TransitDirectionError(
+                error_data.error.code,
+                error_data.error.message,
+            )
+        except ValidationError as ex:
+            logger.exception(
+                "Failed to parse error response for profile %s: %s",
+                profile,
+                str(ex),
+            )
+            raise ex
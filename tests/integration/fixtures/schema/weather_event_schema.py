@@ -61,3 +61,12 @@ def weather_event_function_call_param() -> Tuple[List[OpenAIFunctionCallSpec], U
         # TODO: Also support "auto" and "none"
         UserExplicitFunctionCall(name="get_current_weather"),
     )
+
+import functools
+from typing import Any, Callable, Dict
+
+from drop_backend.lib.config_generator import compile_arguments_validator
+
+@functools.lru_cache(maxsize=None)
+def weather_event_arguments_validator() -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+    return compile_arguments_validator(weather_event_json_schema())
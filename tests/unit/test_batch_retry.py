@@ -0,0 +1,102 @@
+import threading
+import unittest
+
+from drop_backend.lib.batch_retry import (
+    ItemOutcome,
+    ItemStatus,
+    retry_by_bisection,
+)
+from drop_backend.lib.token_batching import TokenBatch
+
+
+_ALL = TokenBatch(items={f"Event{num}": f"event {num}" for num in range(16)})
+
+
+def _batch(*nums):
+    return _ALL.subset(f"Event{num}" for num in nums)
+
+
+class TestRetryByBisection(unittest.TestCase):
+    def setUp(self):
+        self.bad = {"Event3", "Event12"}
+        self.lock = threading.Lock()
+        self.attempted = []
+        self.stored = set()
+
+    def _attempt(self, batch):
+        with self.lock:
+            self.attempted.append(list(batch.items))
+        bad = self.bad & batch.items.keys()
+        if bad:
+            raise ValueError(f"bad events {bad}")
+        return set(batch.items)
+
+    def _on_result(self, batch, covered):
+        self.stored.update(covered)
+        return covered
+
+    def _retry(self, failed, retry_budget):
+        outcomes = {
+            key: ItemOutcome(ItemStatus.failed, attempts=1, failure_reason="x")
+            for batch, _ in failed
+            for key in batch.items
+        }
+        num_retries = retry_by_bisection(
+            failed,
+            self._attempt,
+            self._on_result,
+            outcomes,
+            retry_budget=retry_budget,
+            max_workers=4,
+        )
+        self.assertEqual(num_retries, len(self.attempted))
+        return outcomes
+
+    def test_isolates_the_bad_events(self):
+        outcomes = self._retry(
+            [(_batch(*range(8)), "x"), (_batch(*range(8, 16)), "x")],
+            retry_budget=100,
+        )
+        self.assertEqual(
+            {key for key, o in outcomes.items() if o.status == "failed"},
+            self.bad,
+        )
+        self.assertEqual(self.stored, set(_ALL.items) - self.bad)
+        # Each bad event ends up retried by itself, twice.
+        self.assertEqual(self.attempted.count(["Event3"]), 2)
+        self.assertEqual(
+            outcomes["Event3"].failure_reason, "bad events {'Event3'}"
+        )
+        # 8 -> 4 -> 2 -> 1 and the retry alone.
+        self.assertEqual(outcomes["Event3"].attempts, 1 + 4)
+        self.assertEqual(outcomes["Event7"].attempts, 1 + 1)
+
+    def test_budget_bounds_the_retries(self):
+        outcomes = self._retry([(_batch(*range(16)), "x")], retry_budget=4)
+        # Both halves fail, then only one of them is split again.
+        self.assertEqual(len(self.attempted), 4)
+        # Every event has an outcome, the ones not reached failed.
+        self.assertEqual(set(outcomes), set(_ALL.items))
+        self.assertEqual(
+            {key for key, o in outcomes.items() if o.status == "tagged"},
+            self.stored,
+        )
+        self.assertEqual(len(self.stored), 4)
+
+    def test_missing_events_are_retried(self):
+        self.bad = set()
+        dropped = {"Event1"}
+
+        def _on_result(batch, covered):
+            if len(batch.items) > 1:
+                covered = covered - dropped
+            self.stored.update(covered)
+            return covered
+
+        self._on_result = _on_result
+        outcomes = self._retry([(_batch(0, 1, 2, 3), "x")], retry_budget=10)
+        self.assertEqual(self.stored, {"Event0", "Event1", "Event2", "Event3"})
+        self.assertTrue(
+            all(o.status == ItemStatus.tagged for o in outcomes.values())
+        )
+        self.assertIn(["Event1"], self.attempted)
@@ -0,0 +1,77 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+import drop_backend
+
+# Imported by the commands when they run, not by --help.
+HEAVY_MODULES = [
+    "openai",
+    "pydantic",
+    "requests",
+    "sqlalchemy",
+    "drop_backend.commands.geo",
+    "drop_backend.model.mood_seed",
+    "drop_backend.model.persistence_model",
+    "drop_backend.types.schema",
+    "drop_backend.utils.ors",
+]
+
+HELP_SCRIPT = """
+import json, runpy, sys
+sys.argv = ["drop_backend.commands"] + sys.argv[1:]
+try:
+    runpy.run_module("drop_backend.commands", run_name="__main__")
+except SystemExit:
+    pass
+print(json.dumps(sorted(sys.modules)))
+"""
+
+
+class TestCliStartup(unittest.TestCase):
+    def _modules_after(self, *args, creates_files=False):
+        with tempfile.TemporaryDirectory() as cwd:
+            result = subprocess.run(
+                [sys.executable, "-c", HELP_SCRIPT, *args],
+                cwd=cwd,
+                env={
+                    **os.environ,
+                    "PYTHONPATH": str(Path(drop_backend.__file__).parents[1]),
+                },
+                capture_output=True,
+                text=True,
+                check=True,
+                timeout=60,
+            )
+            if not creates_files:
+                # Like app.log or drop.db.
+                self.assertEqual(os.listdir(cwd), [])
+        return set(json.loads(result.stdout.splitlines()[-1]))
+
+    def test_help_imports_no_command_dependencies(self):
+        for args in (
+            ["--help"],
+            ["data-ingestion-commands", "--help"],
+            ["export-commands", "--help"],
+        ):
+            modules = self._modules_after(*args)
+            self.assertIn("drop_backend.commands.lazy_group", modules)
+            self.assertEqual(
+                [module for module in HEAVY_MODULES if module in modules],
+                [],
+                args,
+            )
+
+    def test_lazy_command_is_loaded_for_its_help(self):
+        modules = self._modules_after(
+            "export-commands", "export-events", "--help", creates_files=True
+        )
+        self.assertIn("drop_backend.commands.export_commands", modules)
+
+
+if __name__ == "__main__":
+    unittest.main()
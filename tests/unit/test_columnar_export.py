@@ -0,0 +1,137 @@
+import struct
+import tempfile
+import unittest
+from datetime import date
+from pathlib import Path
+from types import SimpleNamespace
+
+from sqlalchemy import create_engine
+
+from drop_backend.commands.export_commands import ExportFormat, export_events
+from drop_backend.model.merge_base import Base
+from drop_backend.model.mood_model_supervised import (
+    MoodSubmoodTable,
+    SubMoodEventTable,
+)
+from drop_backend.model.persistence_model import (
+    ParsedEventEmbeddingsTable,
+    ParsedEventTable,
+    add_geoaddress,
+)
+
+try:
+    import pyarrow  # type: ignore
+    import pyarrow.ipc  # type: ignore
+    import pyarrow.parquet  # type: ignore
+except ImportError:
+    pyarrow = None  # type: ignore
+
+
+@unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+class TestColumnarExport(unittest.TestCase):
+    def setUp(self):
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(engine)
+        self.ctx = SimpleNamespace(obj={"engine": engine})
+        with engine.begin() as conn:
+            conn.execute(
+                MoodSubmoodTable.__table__.insert().values(
+                    id=1, mood="calm", submood="reading"
+                )
+            )
+            for event_id in range(1, 6):
+                conn.execute(
+                    ParsedEventTable.__table__.insert().values(
+                        id=event_id,
+                        original_event="",
+                        name=f"event {event_id}",
+                        event_json={
+                            "categories": ["Books", "Kids"],
+                            "start_date": ["2023-11-10"],
+                            "start_time": ["10:00:00"],
+                            "is_paid": event_id % 2 == 0,
+                        },
+                        # Only the file and version asked for are exported.
+                        filename="f" if event_id != 5 else "g",
+                        version="v1",
+                    )
+                )
+                conn.execute(
+                    SubMoodEventTable.__table__.insert().values(
+                        event_id=event_id,
+                        mood_sub_mood_id=1,
+                        complete_json="{}",
+                    )
+                )
+                conn.execute(
+                    ParsedEventEmbeddingsTable.__table__.insert().values(
+                        parsed_event_id=event_id,
+                        embedding=struct.pack("fff", event_id, 0.5, -1),
+                        embedding_version="v1",
+                        embedding_type="description",
+                    )
+                )
+        for event_id in (1, 3):
+            add_geoaddress(
+                self.ctx,
+                parsed_event_id=event_id,
+                address=f"address {event_id}",
+                latitude=40.7,
+                longitude=-74.0,
+            )
+
+    def _export(self, export_format):
+        output_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(output_dir.cleanup)
+        return export_events(
+            self.ctx,
+            "f",
+            "v1",
+            output_dir=Path(output_dir.name),
+            export_format=export_format,
+            chunk_size=3,
+        )
+
+    def _check(self, tables):
+        events = tables["events"].to_pylist()
+        self.assertEqual([e["id"] for e in events], [1, 2, 3, 4])
+        self.assertEqual(events[0]["categories"], ["Books", "Kids"])
+        self.assertEqual(events[0]["start_date"], [date(2023, 11, 10)])
+        self.assertEqual(events[0]["start_time"], ["10:00:00"])
+        self.assertEqual(
+            [e["is_paid"] for e in events], [False, True, False, True]
+        )
+        self.assertIsNone(events[0]["links"])
+        self.assertEqual(
+            tables["geo_addresses"].column("parsed_event_id").to_pylist(),
+            [1, 3],
+        )
+        self.assertEqual(
+            tables["moods"].column("submood").to_pylist(), ["reading"] * 4
+        )
+        self.assertEqual(
+            tables["embeddings"].column("embedding").to_pylist(),
+            [[event_id, 0.5, -1.0] for event_id in range(1, 5)],
+        )
+
+    def test_parquet(self):
+        paths = self._export(ExportFormat.parquet)
+        self._check(
+            {
+                name: pyarrow.parquet.read_table(path)
+                for name, path in paths.items()
+            }
+        )
+        # One row group per chunk of events.
+        self.assertEqual(
+            pyarrow.parquet.ParquetFile(paths["events"]).num_row_groups, 2
+        )
+
+    def test_arrow_ipc(self):
+        paths = self._export(ExportFormat.arrow)
+        self._check(
+            {
+                name: pyarrow.ipc.open_file(path).read_all()
+                for name, path in paths.items()
+            }
+        )
@@ -0,0 +1,100 @@
+import json
+import unittest
+
+from drop_backend.model.ai_conv_types import (
+    AIFunctionCall,
+    CompactMessage,
+    EventNode,
+    MessageNode,
+    OpenAIFunctionCallSpec,
+    Role,
+    UserExplicitFunctionCall,
+    same_functions,
+)
+from drop_backend.model.persistence_model import ReplayHistoryTemplate
+
+
+def _history(system_prompt: str):
+    return [
+        MessageNode(role=Role.system, message_content=system_prompt),
+        MessageNode(
+            role=Role.user,
+            message_content="What is the weather in Hoboken?",
+            functions=[
+                OpenAIFunctionCallSpec(
+                    name="get_current_weather",
+                    description="Get the weather",
+                    parameters={"type": "object", "properties": {}},
+                )
+            ],
+            explicit_fn_call=UserExplicitFunctionCall(
+                name="get_current_weather"
+            ),
+            metadata={"file": "f"},
+        ),
+        MessageNode(
+            role=Role.assistant,
+            ai_function_call=AIFunctionCall(
+                name="get_current_weather",
+                arguments=json.dumps({"location": "Hoboken, NJ"}),
+            ),
+        ),
+        MessageNode(
+            role=Role.function,
+            ai_function_call_result_name="get_current_weather",
+            ai_function_call_result="Sunny",
+        ),
+    ]
+
+
+class TestCompactMessage(unittest.TestCase):
+    def test_round_trip(self):
+        for message in _history("You are a helpful assistant."):
+            self.assertEqual(
+                CompactMessage.from_message_node(message)
+                .to_message_node()
+                .model_dump(mode="json"),
+                message.model_dump(mode="json"),
+            )
+
+    def test_identical_prompts_and_specs_are_shared(self):
+        first, second = (
+            [
+                CompactMessage.from_message_node(message)
+                for message in _history("".join(["You are ", "helpful."]))
+            ]
+            for _ in range(2)
+        )
+        self.assertIs(first[0].message_content, second[0].message_content)
+        self.assertIs(first[1].functions, second[1].functions)
+
+    def test_event_node_history_is_inflated_on_access(self):
+        event_node = EventNode._create("raw event")
+        event_node.history = _history("You are a helpful assistant.")
+        expected = [
+            message.model_dump(mode="json") for message in event_node.history
+        ]
+        event_node.compact()
+        self.assertIsNone(event_node._history)
+        self.assertEqual(
+            list(event_node.to_open_ai_api_messages())[0]["role"], "system"
+        )
+        assert event_node.history is not None
+        self.assertEqual(
+            [message.model_dump(mode="json") for message in event_node.history],
+            expected,
+        )
+
+    def test_shared_messages_and_functions_are_kept(self):
+        history = _history("You are a helpful assistant.")
+        template = ReplayHistoryTemplate(history[:1], history[1].functions)
+        expected = template.dedupe(history)
+        event_node = EventNode._create("raw event")
+        event_node.history = history
+        event_node.compact(template.messages, template.functions)
+        assert event_node.history is not None
+        self.assertIs(event_node.history[0], history[0])
+        self.assertTrue(
+            same_functions(event_node.history[1].functions, template.functions)
+        )
+        self.assertEqual(template.dedupe(event_node.history), expected)
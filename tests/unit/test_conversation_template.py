@@ -0,0 +1,144 @@
+import unittest
+from unittest.mock import patch
+
+import openai
+
+from drop_backend.lib.ai import (
+    AIDriver,
+    AltAI,
+    ConversationTemplate,
+    _estimate_prompt_tokens,
+    driver_wrapper,
+)
+from drop_backend.lib.event_node_manager import EventManager
+from drop_backend.lib.instrumentation import RunStats
+from drop_backend.lib.llm_standin import StandinConfig, StandinServer
+from drop_backend.model.ai_conv_types import (
+    ApiMessagesCache,
+    EventNode,
+    MessageNode,
+    Role,
+    same_functions,
+)
+from drop_backend.prompts.hoboken_girl_prompt import base_prompt_hoboken_girl
+
+
+def _event_manager():
+    return EventManager(
+        "CityEvent", "drop_backend.types", "drop_backend.types.schema"
+    )
+
+
+def _system_message():
+    return MessageNode(
+        role=Role.system,
+        message_content=base_prompt_hoboken_girl(["Hoboken"], "2023-11-10"),
+    )
+
+
+class TestConversationTemplate(unittest.TestCase):
+    def test_api_request(self):
+        template = ConversationTemplate.for_event_manager(
+            _system_message(), _event_manager()
+        )
+        user_message = template.user_message("Jazz at the pier")
+        context = [template.system_message, user_message]
+        self.assertIs(ConversationTemplate.of(context), template)
+        messages, functions, explicit_fn_call = template.api_request(
+            context, ApiMessagesCache()
+        )
+        # The same as without the template.
+        expected = list(EventNode.context_to_openai_api_messages(context))
+        self.assertEqual(
+            (messages, functions, explicit_fn_call),
+            (
+                expected[:-1]
+                + [{"role": "user", "content": "Jazz at the pier"}],
+                expected[-1]["functions"],
+                expected[-1]["explicit_fn_call"],
+            ),
+        )
+        self.assertIs(messages[0], template.api_system_message)
+        self.assertIs(functions, template.api_functions)
+        self.assertEqual(
+            template.prefix_tokens,
+            _estimate_prompt_tokens([messages[0]], functions),
+        )
+
+        # An equal system message is not the template's.
+        self.assertIsNone(
+            ConversationTemplate.of([_system_message(), user_message])
+        )
+        other_functions = MessageNode(
+            role=Role.user,
+            message_content="x",
+            functions=[
+                function.model_copy() for function in template.functions
+            ],
+            explicit_fn_call=template.explicit_fn_call,
+        )
+        self.assertIsNone(
+            template.api_request(
+                [template.system_message, other_functions], ApiMessagesCache()
+            )
+        )
+
+    def test_requests_reuse_the_prefix(self):
+        server = StandinServer(config=StandinConfig())
+        server.__enter__()
+        self.addCleanup(server.__exit__, None, None, None)
+        for name, value in (
+            ("api_base", server.base_url),
+            ("api_key", "standin"),
+        ):
+            patcher = patch.object(openai, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        requests = []
+        try_completion = AltAI._try_completion
+
+        def _try_completion(slf, messages, functions=None, function_call=None):
+            requests.append((messages, functions, function_call))
+            return try_completion(slf, messages, functions, function_call)
+
+        stats = RunStats()
+        event_manager = _event_manager()
+        template = ConversationTemplate.for_event_manager(
+            _system_message(), event_manager
+        )
+        with patch.object(AltAI, "_try_completion", _try_completion):
+            results = list(
+                driver_wrapper(
+                    ["Jazz at the pier", "Farmers market"],
+                    template,
+                    AIDriver(AltAI(hooks=stats), event_manager, hooks=stats),
+                    event_manager,
+                    user_message_prompt_fn=lambda event: event.raw_event_str,
+                )
+            )
+        self.assertEqual([error for _, error in results], [None, None])
+        for event, _ in results:
+            self.assertIs(event.history[0], template.system_message)
+            self.assertTrue(
+                same_functions(event.history[1].functions, template.functions)
+            )
+        (first, first_functions, _), (second, second_functions, _) = requests
+        self.assertIs(first[0], second[0])
+        self.assertIs(first_functions, second_functions)
+        self.assertNotEqual(first[1], second[1])
+
+        counters = stats.summary()["counters"]
+        self.assertEqual(counters["prefix_tokens"], template.prefix_tokens)
+        self.assertEqual(
+            counters["prompt_tokens"],
+            2 * template.prefix_tokens
+            + sum(
+                _estimate_prompt_tokens(messages[1:], None)
+                for messages, _, _ in requests
+            ),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+from unittest.mock import patch
+
+from drop_backend.lib import event_node_manager
+from drop_backend.lib.event_node_manager import EventManager
+from drop_backend.model.ai_conv_types import (
+    UserExplicitFunctionCall,
+    UserFunctionCallMode,
+)
+from drop_backend.types.city_event import CityEvent
+from drop_backend.types.mood_submood import MoodSubmood
+
+MOOD_SUBMOOD_ARGS = {
+    "MOODS": [
+        {
+            "MOOD": "Music & Culture",
+            "SUB_MOODS": [
+                {
+                    "SUB_MOOD": "Concert Vibes",
+                    "DEMOGRAPHICS": ["GenZ"],
+                    "EVENTS": ["Event1"],
+                    "REASONING": "Live music.",
+                }
+            ],
+        }
+    ]
+}
+
+
+class TestMultiTypeEventManager(unittest.TestCase):
+    def setUp(self):
+        with patch.object(
+            event_node_manager.importlib, "import_module"
+        ) as import_module:
+            self.manager = EventManager(
+                ["CityEvent", "MoodSubmood"],
+                "drop_backend.types",
+                "drop_backend.types.schema",
+            )
+            # Modules are imported on first use.
+            import_module.assert_not_called()
+        self.manager.create_event_node("raw event")
+
+    def test_function_call_spec_has_every_type(self):
+        specs, explicit_fn_call = self.manager.get_function_call_spec()
+        assert specs is not None
+        self.assertEqual(
+            [spec.name for spec in specs],
+            ["create_city_event", "create_mood_submood"],
+        )
+        self.assertEqual(explicit_fn_call, UserFunctionCallMode.auto)
+
+    def test_call_fn_by_name_dispatches_by_function_name(self):
+        event_obj, _ = self.manager.call_fn_by_name(
+            "create_mood_submood", **MOOD_SUBMOOD_ARGS
+        )
+        self.assertIsInstance(event_obj, MoodSubmood)
+        event_obj, _ = self.manager.call_fn_by_name(
+            "create_city_event", name="x", description="y", categories=[]
+        )
+        self.assertIsInstance(event_obj, CityEvent)
+        with self.assertRaises(AttributeError):
+            self.manager.call_fn_by_name("create_venue", name="x")
+
+    def test_single_type_keeps_explicit_function_call(self):
+        manager = EventManager(
+            "CityEvent", "drop_backend.types", "drop_backend.types.schema"
+        )
+        _, explicit_fn_call = manager.get_function_call_spec()
+        self.assertEqual(
+            explicit_fn_call, UserExplicitFunctionCall(name="create_city_event")
+        )
+
+    def test_duplicate_registration(self):
+        with self.assertRaises(ValueError):
+            self.manager.register(
+                "CityEvent", "drop_backend.types", "drop_backend.types.schema"
+            )
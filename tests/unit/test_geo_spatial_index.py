@@ -0,0 +1,107 @@
+import random
+import unittest
+from types import SimpleNamespace
+
+from sqlalchemy import create_engine
+
+from drop_backend.model.merge_base import Base
+from drop_backend.model.persistence_model import (
+    ParsedEventTable,
+    add_geoaddress,
+    ensure_geo_spatial_index,
+    get_events_within_radius,
+    get_geocoded_addresses,
+    get_k_nearest_events,
+)
+from drop_backend.utils.ors import TransitDistanceDurationCalculator
+
+HOBOKEN = (40.7440, -74.0324)
+
+
+class TestGeoSpatialIndex(unittest.TestCase):
+    def setUp(self):
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(engine)
+        self.ctx = SimpleNamespace(obj={"engine": engine})
+        ensure_geo_spatial_index(self.ctx)
+        rng = random.Random(7)
+        self.points = {}
+        with engine.begin() as conn:
+            for event_id in range(1, 41):
+                conn.execute(
+                    ParsedEventTable.__table__.insert().values(
+                        id=event_id,
+                        original_event="",
+                        filename="f" if event_id % 2 else "g",
+                        version="v1",
+                    )
+                )
+        for event_id in range(1, 41):
+            # A couple of addresses per event within ~10km of Hoboken.
+            for i in range(2):
+                lat = HOBOKEN[0] + rng.uniform(-0.09, 0.09)
+                lon = HOBOKEN[1] + rng.uniform(-0.09, 0.09)
+                add_geoaddress(
+                    self.ctx,
+                    parsed_event_id=event_id,
+                    address=f"{event_id}-{i}",
+                    latitude=lat,
+                    longitude=lon,
+                )
+                self.points.setdefault(event_id, []).append((lat, lon))
+        # Failed geocodes are not indexed.
+        add_geoaddress(
+            self.ctx, parsed_event_id=1, address="nowhere", failure_reason="x"
+        )
+
+    def _brute_force(self, event_ids=None):
+        distances = {
+            event_id: min(
+                TransitDistanceDurationCalculator.haversine_distance(
+                    HOBOKEN, point
+                )
+                for point in points
+            )
+            for event_id, points in self.points.items()
+            if event_ids is None or event_id in event_ids
+        }
+        return sorted(distances.items(), key=lambda kv: kv[1])
+
+    def test_within_radius_matches_brute_force(self):
+        for radius in (500, 2000, 5000, 20000):
+            hits = get_events_within_radius(
+                self.ctx, HOBOKEN[0], HOBOKEN[1], radius
+            )
+            expected = [
+                event_id
+                for event_id, distance in self._brute_force()
+                if distance <= radius
+            ]
+            self.assertEqual([hit.parsed_event_id for hit in hits], expected)
+
+    def test_k_nearest_matches_brute_force(self):
+        for k in (1, 5, 40, 100):
+            hits = get_k_nearest_events(self.ctx, HOBOKEN[0], HOBOKEN[1], k)
+            expected = [event_id for event_id, _ in self._brute_force()][:k]
+            self.assertEqual([hit.parsed_event_id for hit in hits], expected)
+
+    def test_file_version_constraints(self):
+        hits = get_k_nearest_events(
+            self.ctx, HOBOKEN[0], HOBOKEN[1], 5, {"f": ["v1"]}
+        )
+        expected = [
+            event_id for event_id, _ in self._brute_force(set(range(1, 41, 2)))
+        ][:5]
+        self.assertEqual([hit.parsed_event_id for hit in hits], expected)
+
+    def test_geocoded_addresses_leave_out_failures(self):
+        geocoded = get_geocoded_addresses(self.ctx, "f", "v1")
+        self.assertEqual(
+            geocoded,
+            {
+                (event_id, f"{event_id}-{i}")
+                for event_id in range(1, 41, 2)
+                for i in range(2)
+            },
+        )
+        self.assertNotIn((1, "nowhere"), geocoded)
@@ -0,0 +1,186 @@
+import json
+import unittest
+
+from openai.openai_object import OpenAIObject
+from pydantic import ValidationError
+
+from drop_backend.lib.ai import _chat_function_call_from_response
+from drop_backend.lib.config_generator import compile_field_validators
+from drop_backend.lib.incremental_json import (
+    ArgumentsViolation,
+    IncrementalArgumentsParser,
+)
+from drop_backend.types.schema.city_event_schema import (
+    city_event_function_call_param,
+)
+
+ARGUMENTS = {
+    "name": 'Jazz "night", {live}',
+    "description": "Back\\slash, brackets ] and } and unicode é",
+    "categories": ["Music", {"nested": [1, {"deep": "]"}]}],
+    "addresses": None,
+    "is_ongoing": False,
+}
+
+
+def _city_event_parameters():
+    specs, _ = city_event_function_call_param()
+    return specs[0].parameters
+
+
+def _parser():
+    return IncrementalArgumentsParser(
+        compile_field_validators(_city_event_parameters()),
+        allow_unknown_fields=False,
+    )
+
+
+def _feed_all(parser, text, step):
+    fields = []
+    for i in range(0, len(text), step):
+        fields.extend(parser.feed(text[i : i + step]))
+    return fields
+
+
+class TestIncrementalArgumentsParser(unittest.TestCase):
+    def test_any_fragmentation(self):
+        text = json.dumps(ARGUMENTS, indent=2)
+        for step in (1, 2, 3, 7, 64, len(text)):
+            parser = IncrementalArgumentsParser()
+            fields = _feed_all(parser, text, step)
+            self.assertEqual(fields, list(ARGUMENTS.items()), step)
+            self.assertTrue(parser.done)
+            self.assertEqual(parser.text(), text)
+            self.assertEqual(parser.fields, ARGUMENTS)
+
+    def test_fields_complete_as_they_stream(self):
+        parser = IncrementalArgumentsParser()
+        self.assertEqual(parser.feed(' {"name": "Ja'), [])
+        self.assertEqual(parser.feed('zz", "cate'), [("name", "Jazz")])
+        self.assertEqual(parser.feed('gories": []'), [])
+        self.assertFalse(parser.done)
+        self.assertEqual(parser.feed("}\n"), [("categories", [])])
+        self.assertTrue(parser.done)
+
+    def test_empty_object(self):
+        parser = IncrementalArgumentsParser()
+        self.assertEqual(parser.feed("{ }"), [])
+        self.assertTrue(parser.done)
+
+    def test_structural_violations(self):
+        for text in (
+            "[1]",
+            "Sure, here are the arguments",
+            '{"a": 1]',
+            '{"a": 1,}',
+            '{"a": [1}, "b": 2}',
+            '{"a": 1 "b": 2}',
+            '{"a": 1, "a": 2}',
+            '{"a": 1} {',
+        ):
+            with self.assertRaises(ArgumentsViolation, msg=text):
+                _feed_all(IncrementalArgumentsParser(), text, 1)
+
+    def test_schema_violations(self):
+        parser = _parser()
+        parser.feed('{"name": "Jazz", "description": 1')
+        with self.assertRaises(ArgumentsViolation) as context:
+            parser.feed(", ")
+        self.assertEqual(context.exception.field, "description")
+
+        with self.assertRaises(ArgumentsViolation) as context:
+            _parser().feed('{"venue": "Pier A", ')
+        self.assertEqual(context.exception.field, "venue")
+
+        with self.assertRaises(ArgumentsViolation) as context:
+            _parser().feed('{"payment_mode": "cash"}')
+        self.assertEqual(context.exception.field, "payment_mode")
+
+        # Dates are left to the model's own validators.
+        _parser().feed('{"start_date": ["Friday"], "payment_mode": "ticket"}')
+
+    def test_values_the_model_coerces(self):
+        for value in ('"true"', "1", '"yes"', "0.0"):
+            text = '{"is_paid": %s, "has_promotion": %s}' % (value, value)
+            self.assertEqual(
+                [field for field, _ in _parser().feed(text)],
+                ["is_paid", "has_promotion"],
+            )
+
+
+class TestStreamedFunctionCall(unittest.TestCase):
+    def _stream(self, fragments, consumed):
+        try:
+            yield OpenAIObject.construct_from(
+                {
+                    "choices": [
+                        {
+                            "delta": {
+                                "role": "assistant",
+                                "function_call": {
+                                    "name": "create_city_event",
+                                    "arguments": "",
+                                },
+                            }
+                        }
+                    ]
+                }
+            )
+            for fragment in fragments:
+                consumed.append(fragment)
+                yield OpenAIObject.construct_from(
+                    {
+                        "choices": [
+                            {
+                                "delta": {
+                                    "function_call": {"arguments": fragment}
+                                }
+                            }
+                        ]
+                    }
+                )
+        finally:
+            consumed.append("closed")
+
+    def _functions(self):
+        specs, _ = city_event_function_call_param()
+        return [spec.model_dump(exclude_none=True) for spec in specs]
+
+    def test_valid_arguments(self):
+        text = json.dumps({"name": "Jazz", "categories": ["Music"]})
+        consumed = []
+        _, func_call = _chat_function_call_from_response(
+            self._stream([text[:5], text[5:12], text[12:]], consumed),
+            self._functions(),
+        )
+        self.assertEqual(
+            func_call, {"name": "create_city_event", "arguments": text}
+        )
+
+    def test_lax_values_do_not_stop_the_stream(self):
+        text = json.dumps({"name": "Jazz", "is_paid": "true", "is_ongoing": 1})
+        consumed = []
+        _, func_call = _chat_function_call_from_response(
+            self._stream([text[:10], text[10:30], text[30:]], consumed),
+            self._functions(),
+        )
+        self.assertEqual(func_call["arguments"], text)
+        self.assertEqual(consumed[-1], "closed")
+        self.assertEqual(len(consumed), 4)
+
+    def test_stops_at_the_first_violation(self):
+        fragments = ['{"name": "Jazz", ', '"links": "x", ', '"is_paid"']
+        consumed = []
+        with self.assertRaises(ValidationError) as context:
+            _chat_function_call_from_response(
+                self._stream(fragments + ["x"] * 100, consumed),
+                self._functions(),
+            )
+        self.assertEqual(consumed, fragments[:2] + ["closed"])
+        (error,) = context.exception.errors()
+        self.assertEqual(error["loc"], ("arguments", "links"))
+        self.assertEqual(error["input"], "".join(fragments[:2]))
+
+
+if __name__ == "__main__":
+    unittest.main()
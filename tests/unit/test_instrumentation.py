@@ -0,0 +1,177 @@
+import unittest
+from typing import List
+from unittest.mock import patch
+
+import openai
+from tenacity import RetryError
+
+from drop_backend.lib.ai import (
+    AIDriver,
+    AltAI,
+    completion_with_backoff,
+    driver_wrapper,
+)
+from drop_backend.lib.event_node_manager import EventManager
+from drop_backend.lib.instrumentation import (
+    EventSpan,
+    InstrumentationHooks,
+    MessageSpan,
+    RunStats,
+)
+from drop_backend.lib.llm_standin import StandinConfig, StandinServer
+from drop_backend.model.ai_conv_types import MessageNode, Role
+
+
+class _Recorder(InstrumentationHooks):
+    def __init__(self):
+        self.messages: List[MessageSpan] = []
+        self.events: List[EventSpan] = []
+
+    def on_message(self, span: MessageSpan) -> None:
+        self.messages.append(span)
+
+    def on_event(self, span: EventSpan) -> None:
+        self.events.append(span)
+
+
+class TestInstrumentation(unittest.TestCase):
+    def _serve(self, **config):
+        server = StandinServer(config=StandinConfig(**config))
+        server.__enter__()
+        self.addCleanup(server.__exit__, None, None, None)
+        for name, value in (
+            ("api_base", server.base_url),
+            ("api_key", "standin"),
+        ):
+            patcher = patch.object(openai, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        return server
+
+    def _extract(self, hooks, events):
+        event_manager = EventManager(
+            "CityEvent", "drop_backend.types", "drop_backend.types.schema"
+        )
+        ai_driver = AIDriver(AltAI(hooks=hooks), event_manager, hooks=hooks)
+        return list(
+            driver_wrapper(
+                events,
+                MessageNode(role=Role.system, message_content="Extract"),
+                ai_driver,
+                event_manager,
+                user_message_prompt_fn=lambda event: event.raw_event_str,
+            )
+        )
+
+    def test_spans_of_an_extraction(self):
+        self._serve(chunk_chars=5)
+        recorder = _Recorder()
+        results = self._extract(
+            recorder, ["Jazz at the pier\nFriday", "Farmers market"]
+        )
+        self.assertEqual([error for _, error in results], [None, None])
+        self.assertEqual(len(recorder.messages), 2)
+        self.assertEqual(
+            [event.title for event in recorder.events],
+            ["Jazz at the pier", "Farmers market"],
+        )
+        for event, message in zip(recorder.events, recorder.messages):
+            self.assertEqual(event.messages, [message])
+            self.assertEqual(message.event_id, event.event_id)
+            self.assertEqual(message.function_call, "create_city_event")
+            self.assertIsNone(message.error)
+            self.assertEqual(message.retries, 0)
+            self.assertGreater(message.prompt_tokens, 0)
+            self.assertGreater(message.completion_tokens, 0)
+            self.assertIsNotNone(message.time_to_first_token)
+            self.assertLessEqual(
+                message.time_to_first_token + message.stream_seconds,
+                message.total_seconds,
+            )
+            self.assertGreater(event.validation_seconds, 0)
+            self.assertGreaterEqual(event.total_seconds, message.total_seconds)
+        self.assertNotEqual(
+            recorder.events[0].event_id, recorder.events[1].event_id
+        )
+
+    def test_retries_and_failures(self):
+        # Seeded to rate limit the first two requests.
+        self._serve(rate_limit_rate=0.5, seed=7)
+        recorder = _Recorder()
+        with patch.object(
+            completion_with_backoff.retry, "wait", return_value=0
+        ):
+            self._extract(recorder, ["Jazz at the pier"])
+        self.assertEqual(recorder.messages[0].retries, 2)
+        self.assertEqual(recorder.events[0].retries, 2)
+
+        self._serve(server_error_rate=1.0)
+        recorder = _Recorder()
+        with patch.object(
+            completion_with_backoff.retry, "wait", return_value=0
+        ), self.assertRaises(RetryError):
+            self._extract(recorder, ["Jazz at the pier"])
+        self.assertIsNotNone(recorder.messages[0].error)
+        self.assertIsNotNone(recorder.events[0].error)
+
+    def test_run_stats(self):
+        stats = RunStats()
+        for seconds in (1.0, 2.0, 3.0):
+            message = MessageSpan(
+                model="m",
+                started_at=0,
+                time_to_first_token=seconds / 2,
+                stream_seconds=seconds / 2,
+                total_seconds=seconds,
+                prompt_tokens=100,
+                prefix_tokens=80,
+                prefix_hash="prefix",
+                completion_tokens=10,
+                retries=1,
+                function_call="create_city_event",
+            )
+            stats.on_message(message)
+            stats.on_event(
+                EventSpan(
+                    event_id=0,
+                    title="",
+                    started_at=0,
+                    total_seconds=seconds,
+                    messages=[message],
+                )
+            )
+        stats.on_event(EventSpan(event_id=1, title="", started_at=0, error="x"))
+        summary = stats.summary()
+        self.assertEqual(
+            summary["counters"],
+            {
+                "events": 4,
+                "failed_events": 1,
+                "messages": 3,
+                "failed_messages": 0,
+                "function_calls": 3,
+                "retries": 3,
+                "prompt_tokens": 300,
+                "prefix_tokens": 80,
+                "completion_tokens": 30,
+            },
+        )
+        self.assertEqual(
+            summary["histograms"]["message_seconds"],
+            {
+                "count": 3,
+                "sum": 6.0,
+                "mean": 2.0,
+                "p50": 2.0,
+                "p90": 3.0,
+                "p99": 3.0,
+                "max": 3.0,
+            },
+        )
+        self.assertEqual(
+            summary["histograms"]["event_prompt_tokens"]["max"], 100
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import json
+import unittest
+from dataclasses import asdict
+from types import SimpleNamespace
+
+from jsonpath_ng import parse  # type: ignore
+
+from drop_backend.model.mood_model_unsupervised import (
+    MoodFlavors,
+    generate_submoods_json_accessors,
+    get_submood_embedding_text,
+    json_path_finder,
+)
+
+
+def _parsed_values(path, doc):
+    return [match.value for match in parse(path).find(doc)]
+
+
+class TestJsonPathFinder(unittest.TestCase):
+    def test_same_as_jsonpath_ng_on_mood_seeds(self):
+        for flavor in MoodFlavors:
+            for mood in flavor.get_moods_for_flavor():
+                doc = [asdict(sub_mood) for sub_mood in mood.SUB_MOODS]
+                for accessor in generate_submoods_json_accessors(
+                    1, mood.SUB_MOODS
+                ):
+                    for path in accessor.embedding_accessor_json_path.split(
+                        ","
+                    ) + [accessor.submood_accessor_json_path]:
+                        path = path.strip()
+                        self.assertEqual(
+                            json_path_finder(path)(doc),
+                            _parsed_values(path, doc),
+                            f"{flavor} {mood.MOOD} {path}",
+                        )
+
+    def test_falls_back_when_the_document_has_another_shape(self):
+        docs = [
+            [],
+            {"0": "not a list"},
+            [{"SUB_MOOD": "a"}],
+            [{"PLACE_OR_ACTIVITY": []}],
+            [{"PLACE_OR_ACTIVITY": "a string"}],
+            [{"PLACE_OR_ACTIVITY": ["a", "b"]}],
+        ]
+        for path in (
+            "$[0].SUB_MOOD",
+            "$[1].SUB_MOOD",
+            "$[0].PLACE_OR_ACTIVITY[1]",
+            "$[*].SUB_MOOD",
+        ):
+            for doc in docs:
+                try:
+                    expected = _parsed_values(path, doc)
+                except Exception as error:  # pylint: disable=broad-except
+                    with self.assertRaises(type(error)):
+                        json_path_finder(path)(doc)
+                    continue
+                self.assertEqual(
+                    json_path_finder(path)(doc), expected, f"{path} {doc}"
+                )
+
+    def test_embedding_text(self):
+        mood = MoodFlavors.GEN_Z.get_moods_for_flavor()[0]
+        db_mood = SimpleNamespace(
+            sub_moods=json.dumps([asdict(m) for m in mood.SUB_MOODS])
+        )
+        records = get_submood_embedding_text(
+            db_mood,  # type: ignore
+            "v1",
+            generate_submoods_json_accessors(1, mood.SUB_MOODS),
+        )
+        first = mood.SUB_MOODS[0]
+        self.assertEqual(records[0]["sub_mood"], first.SUB_MOOD)
+        self.assertEqual(
+            records[2]["embedding_text"],
+            ". ".join(
+                [first.SUB_MOOD] + first.PLACE_OR_ACTIVITY + [first.REASONING]
+            ),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,151 @@
+import json
+import unittest
+from unittest.mock import patch
+
+import openai
+
+from drop_backend.lib.ai import (
+    AltAI,
+    _chat_function_call_from_response,
+    completion_with_backoff,
+)
+from drop_backend.lib.llm_standin import (
+    Latency,
+    StandinConfig,
+    StandinServer,
+)
+from drop_backend.model.ai_conv_types import MessageNode, Role
+from drop_backend.types.city_event import CityEvent
+from drop_backend.types.mood_submood import MoodSubmood
+from drop_backend.types.schema.city_event_schema import (
+    city_event_arguments_validator,
+    city_event_function_call_param,
+)
+from drop_backend.types.schema.mood_submood_schema import (
+    mood_submood_arguments_validator,
+    mood_submood_function_call_param,
+)
+
+
+def _functions(function_call_param):
+    specs, explicit = function_call_param()
+    return [spec.model_dump(exclude_none=True) for spec in specs], dict(
+        explicit
+    )
+
+
+class TestLlmStandin(unittest.TestCase):
+    def _serve(self, **config):
+        server = StandinServer(config=StandinConfig(**config))
+        server.__enter__()
+        self.addCleanup(server.__exit__, None, None, None)
+        for name, value in (
+            ("api_base", server.base_url),
+            ("api_key", "standin"),
+        ):
+            patcher = patch.object(openai, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        return server
+
+    def _function_call(self, function_call_param, prompt):
+        functions, explicit = _functions(function_call_param)
+        response = openai.ChatCompletion.create(
+            model="gpt-3.5-turbo-1106",
+            messages=[{"role": "user", "content": prompt}],
+            functions=functions,
+            function_call=explicit,
+            stream=True,
+        )
+        _, func_call = _chat_function_call_from_response(response)
+        return func_call
+
+    def test_city_event_function_call(self):
+        self._serve(chunk_chars=7)
+        func_call = self._function_call(
+            city_event_function_call_param, "Jazz at the pier"
+        )
+        self.assertEqual(func_call["name"], CityEvent.default_fn_name())
+        arguments = json.loads(func_call["arguments"])
+        city_event_arguments_validator()(dict(arguments))
+        CityEvent.create(func_call["name"], **arguments)
+        # Same request, same arguments.
+        self.assertEqual(
+            self._function_call(
+                city_event_function_call_param, "Jazz at the pier"
+            ),
+            func_call,
+        )
+
+    def test_mood_submood_covers_the_prompts_events(self):
+        self._serve()
+        func_call = self._function_call(
+            mood_submood_function_call_param,
+            json.dumps({"Event1": "Jazz night", "Event7": "Kids yoga"}),
+        )
+        arguments = json.loads(func_call["arguments"])
+        mood_submood_arguments_validator()(dict(arguments))
+        moods = MoodSubmood.create(func_call["name"], **arguments)
+        for mood in moods.MOODS:
+            for sub_mood in mood.SUB_MOODS:
+                self.assertEqual(sub_mood.EVENTS, ["Event1", "Event7"])
+
+    def test_alt_ai_chat(self):
+        self._serve()
+        message = AltAI().send(
+            [MessageNode(role=Role.user, message_content="Hi")]
+        )
+        self.assertTrue(message.message_content.startswith("Stand-in reply"))
+
+    def test_injected_errors(self):
+        server = self._serve(rate_limit_rate=1.0)
+        with self.assertRaises(openai.error.RateLimitError):
+            openai.ChatCompletion.create(
+                model="m", messages=[{"role": "user", "content": "Hi"}]
+            )
+        server.config.rate_limit_rate = 0.0
+        server.config.invalid_arguments_rate = 1.0
+        func_call = self._function_call(city_event_function_call_param, "x")
+        with self.assertRaises(ValueError):
+            city_event_arguments_validator()(json.loads(func_call["arguments"]))
+        self.assertEqual(
+            server.counts,
+            {"chat_completions": 2, "rate_limited": 1, "invalid_arguments": 1},
+        )
+
+    def test_backoff_retries_rate_limits(self):
+        # Seeded to rate limit the first two requests.
+        server = self._serve(rate_limit_rate=0.5, seed=7)
+        with patch.object(
+            completion_with_backoff.retry, "wait", return_value=0
+        ):
+            completion_with_backoff(
+                model="m", messages=[{"role": "user", "content": "Hi"}]
+            )
+        self.assertEqual(
+            server.counts, {"chat_completions": 3, "rate_limited": 2}
+        )
+
+    def test_embeddings(self):
+        self._serve(embedding_dimensions=8)
+        response = openai.Embedding.create(
+            model="text-embedding-ada-002",
+            input=["a", "b", "a"],
+            encoding_format="float",
+        )
+        vectors = [data["embedding"] for data in response["data"]]
+        self.assertEqual(len(vectors[0]), 8)
+        self.assertEqual(vectors[0], vectors[2])
+        self.assertNotEqual(vectors[0], vectors[1])
+        self.assertAlmostEqual(sum(v * v for v in vectors[0]), 1.0, places=5)
+
+    def test_latency_parse(self):
+        self.assertEqual(
+            Latency.parse("uniform:0.1,0.2"), Latency("uniform", (0.1, 0.2))
+        )
+        with self.assertRaises(ValueError):
+            Latency.parse("lognormal:0.1")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from drop_backend.model import mood_catalog, mood_seed
+from drop_backend.model.mood_model_unsupervised import Mood, MoodFlavors
+
+
+class TestMoodCatalog(unittest.TestCase):
+    def setUp(self):
+        cache = tempfile.TemporaryDirectory()
+        self.addCleanup(cache.cleanup)
+        env_patcher = patch.dict(
+            os.environ, {"DROP_BACKEND_CACHE_DIR": cache.name}
+        )
+        env_patcher.start()
+        self.addCleanup(env_patcher.stop)
+        mood_catalog.clear_catalog_cache()
+        self.addCleanup(mood_catalog.clear_catalog_cache)
+        self.cache_dir = cache.name
+
+    def _artifacts(self):
+        return sorted(
+            os.path.join(os.path.basename(root), name)
+            for root, _, names in os.walk(self.cache_dir)
+            for name in names
+        )
+
+    def test_same_moods_as_the_seeds(self):
+        for flavor in MoodFlavors:
+            self.assertEqual(
+                flavor.get_moods_for_flavor(),
+                [Mood.from_dict(i) for i in getattr(mood_seed, flavor.value)],
+            )
+
+    def test_built_once_and_only_the_flavor_asked_for(self):
+        MoodFlavors.GEN_Z.get_moods_for_flavor()
+        key = mood_catalog.catalog_key()
+        self.assertEqual(self._artifacts(), [f"mood_seed-{key}/GEN_Z.pickle"])
+        # A new process reads the artifact.
+        mood_catalog.clear_catalog_cache()
+        with patch.object(
+            mood_catalog, "_build_flavor", side_effect=AssertionError
+        ):
+            moods = MoodFlavors.GEN_Z.get_moods_for_flavor()
+        self.assertEqual(moods[0].MOOD, mood_seed.GEN_Z[0]["MOOD"])
+
+    def test_new_objects_on_every_call(self):
+        moods = MoodFlavors.GEN_Z_NYC.get_moods_for_flavor()
+        moods[0].SUB_MOODS.clear()
+        self.assertTrue(
+            MoodFlavors.GEN_Z_NYC.get_moods_for_flavor()[0].SUB_MOODS
+        )
+
+    def test_rebuilt_when_the_seeds_change(self):
+        MoodFlavors.GEN_Z.get_moods_for_flavor()
+        mood_catalog.clear_catalog_cache()
+        with patch.object(mood_catalog, "catalog_key", return_value="changed"):
+            MoodFlavors.GEN_Z.get_moods_for_flavor()
+        self.assertIn("mood_seed-changed/GEN_Z.pickle", self._artifacts())
+
+    def test_unwritable_cache_dir(self):
+        with patch.object(
+            mood_catalog, "_write_atomically", side_effect=PermissionError
+        ):
+            moods = MoodFlavors.MILLENIALS.get_moods_for_flavor()
+        self.assertEqual(len(moods), len(mood_seed.MILLENIALS))
+        self.assertEqual(self._artifacts(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
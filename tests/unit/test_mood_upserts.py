@@ -0,0 +1,133 @@
+import unittest
+from types import SimpleNamespace
+
+from sqlalchemy import create_engine, event, select
+
+# Registers parsed_events, that the mood tables refer to.
+from drop_backend.model import (
+    persistence_model,
+)  # pylint: disable=unused-import
+from drop_backend.model.merge_base import Base
+from drop_backend.model.mood_model_supervised import (
+    MoodSubmoodTable,
+    SubMoodEventTable,
+    clear_mood_submood_id_cache,
+    handle_mood_submood,
+    upsert_mood_submood_events,
+    upsert_mood_submoods,
+)
+from drop_backend.model.mood_model_unsupervised import (
+    SubmoodBasedEmbeddingsTable,
+    insert_into_embeddings_table,
+)
+from drop_backend.types.mood_submood import MoodSubmood
+
+
+def _mood_submood(reasoning="r", num_events=3):
+    return MoodSubmood.model_validate(
+        {
+            "MOODS": [
+                {
+                    "MOOD": "Music",
+                    "SUB_MOODS": [
+                        {
+                            "SUB_MOOD": "Concerts",
+                            "DEMOGRAPHICS": ["GenZ"],
+                            "EVENTS": [
+                                f"Event{i}" for i in range(1, num_events + 1)
+                            ],
+                            "REASONING": reasoning,
+                        },
+                        {
+                            "SUB_MOOD": "Karaoke",
+                            "DEMOGRAPHICS": ["GenZ"],
+                            "EVENTS": ["Event1"],
+                            "REASONING": reasoning,
+                        },
+                    ],
+                }
+            ]
+        }
+    )
+
+
+class TestMoodUpserts(unittest.TestCase):
+    def setUp(self):
+        clear_mood_submood_id_cache()
+        self.engine = create_engine("sqlite://")
+        Base.metadata.create_all(self.engine)
+        self.ctx = SimpleNamespace(obj={"engine": self.engine})
+        self.statements = []
+        event.listen(
+            self.engine,
+            "before_cursor_execute",
+            lambda *args: self.statements.append(args[2]),
+        )
+
+    def test_mood_submood_ids_are_stable_and_cached(self):
+        ids = upsert_mood_submoods(self.ctx, [("a", "x"), ("a", "y")])
+        self.assertEqual(
+            handle_mood_submood(self.ctx, "a", "x"), ids[("a", "x")]
+        )
+        more_ids = upsert_mood_submoods(self.ctx, [("a", "y"), ("b", "z")])
+        self.assertEqual(more_ids[("a", "y")], ids[("a", "y")])
+        with self.engine.connect() as conn:
+            self.assertEqual(
+                len(conn.execute(select(MoodSubmoodTable)).all()), 3
+            )
+        # Pairs known to the process are not looked up again.
+        self.statements.clear()
+        upsert_mood_submoods(self.ctx, [("a", "x"), ("b", "z")])
+        self.assertEqual(self.statements, [])
+        # Another process may have inserted the pair already.
+        clear_mood_submood_id_cache()
+        self.assertEqual(
+            upsert_mood_submoods(self.ctx, [("a", "x")]),
+            {("a", "x"): ids[("a", "x")]},
+        )
+        with self.assertRaises(ValueError):
+            upsert_mood_submoods(self.ctx, [("a", "")])
+
+    def test_mood_submood_events_in_a_few_statements(self):
+        self.assertEqual(
+            upsert_mood_submood_events(self.ctx, _mood_submood(num_events=50)),
+            set(range(1, 51)),
+        )
+        writes = [
+            s
+            for s in self.statements
+            if s.lstrip().upper().startswith("INSERT")
+        ]
+        self.assertEqual(len(writes), 2)
+        # Tagging the events again keeps one row per pair, with the latest
+        # reasoning.
+        upsert_mood_submood_events(self.ctx, _mood_submood("new", 50))
+        with self.engine.connect() as conn:
+            rows = conn.execute(select(SubMoodEventTable)).all()
+        self.assertEqual(len(rows), 51)
+        self.assertTrue(all('"new"' in row.complete_json for row in rows))
+
+    def test_embeddings_are_inserted_once(self):
+        entries = [
+            {
+                "mood_id": 1,
+                "version": "v1",
+                "sub_mood": f"s{i}",
+                "embedding_text_composite_type": "SUB_MOOD",
+                "embedding_text": f"text {i}",
+                "embedding_vector": b"\0\0\0\0",
+                "unused": "ignored",
+            }
+            for i in range(5)
+        ]
+        insert_into_embeddings_table(self.engine, entries[:3])
+        insert_into_embeddings_table(self.engine, entries)
+        with self.engine.connect() as conn:
+            self.assertEqual(
+                sorted(
+                    conn.execute(
+                        select(SubmoodBasedEmbeddingsTable.sub_mood)
+                    ).scalars()
+                ),
+                [f"s{i}" for i in range(5)],
+            )
@@ -63,6 +63,7 @@ import unittest
 
 from drop_backend.model.ai_conv_types import (
     AIFunctionCall,
+    ApiMessagesCache,
     EventNode,
     MessageNode,
     OpenAIFunctionCallSpec,
@@ -384,3 +385,25 @@ class TestMessageNode(unittest.TestCase):
     def _run_test(self, input_messages, expected_output):
         result = list(EventNode.context_to_openai_api_messages(input_messages))
         self.assertEqual(result, expected_output)
+        self._check_cache_agrees(input_messages)
+
+    def _check_cache_agrees(self, input_messages):
+        """Growing the context one message at a time through the cache gives
+        the same messages as converting every prefix from scratch."""
+        cache = ApiMessagesCache()
+        for end in range(1, len(input_messages) + 1):
+            context = input_messages[:end]
+            try:
+                expected = list(
+                    EventNode.context_to_openai_api_messages(context)
+                )
+            except ValueError:
+                with self.assertRaises(ValueError):
+                    list(
+                        EventNode.context_to_openai_api_messages(context, cache)
+                    )
+                continue
+            self.assertEqual(
+                list(EventNode.context_to_openai_api_messages(context, cache)),
+                expected,
+            )
@@ -0,0 +1,163 @@
+import unittest
+from unittest.mock import Mock, patch
+
+import requests
+
+from drop_backend.utils.ors import (
+    CircuitBreaker,
+    CircuitState,
+    ORSHealthCheck,
+    Profile,
+    TransitDirectionSummary,
+    TransitDistanceDurationCalculator,
+    ensure_health_check,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _ok_response():
+    response = Mock()
+    response.status_code = 200
+    response.text = (
+        '{"routes": [{"summary": {"distance": 10.0, "duration": 5.0}}]}'
+    )
+    return response
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker(
+            failure_threshold=2, cooldown_seconds=30, clock=self.clock
+        )
+
+    def test_opens_after_threshold_and_is_per_profile(self):
+        self.breaker.record_failure(Profile.foot_walking)
+        self.assertEqual(
+            self.breaker.state(Profile.foot_walking), CircuitState.closed
+        )
+        self.breaker.record_failure(Profile.foot_walking)
+        self.assertEqual(
+            self.breaker.state(Profile.foot_walking), CircuitState.open
+        )
+        self.assertFalse(self.breaker.allow_request(Profile.foot_walking))
+        self.assertTrue(self.breaker.allow_request(Profile.driving_car))
+
+    def test_half_open_allows_a_single_probe(self):
+        self.breaker.record_failure(Profile.foot_walking)
+        self.breaker.record_failure(Profile.foot_walking)
+        self.clock.now = 31
+        self.assertTrue(self.breaker.allow_request(Profile.foot_walking))
+        self.assertEqual(
+            self.breaker.state(Profile.foot_walking), CircuitState.half_open
+        )
+        self.assertFalse(self.breaker.allow_request(Profile.foot_walking))
+
+        # A failed probe opens the circuit for another cooldown.
+        self.breaker.record_failure(Profile.foot_walking)
+        self.assertEqual(
+            self.breaker.state(Profile.foot_walking), CircuitState.open
+        )
+        self.clock.now = 45
+        self.assertFalse(self.breaker.allow_request(Profile.foot_walking))
+
+        self.clock.now = 62
+        self.assertTrue(self.breaker.allow_request(Profile.foot_walking))
+        self.breaker.record_success(Profile.foot_walking)
+        self.assertEqual(
+            self.breaker.state(Profile.foot_walking), CircuitState.closed
+        )
+
+
+class TestCalculatorWithCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker(
+            failure_threshold=1, cooldown_seconds=30, clock=self.clock
+        )
+        self.calculator = TransitDistanceDurationCalculator(
+            "http://ors/{profile}", circuit_breaker=self.breaker
+        )
+
+    @patch("drop_backend.utils.ors.requests.post")
+    def test_open_circuit_skips_ors_and_recovers(self, mocked_post):
+        mocked_post.side_effect = requests.exceptions.ReadTimeout("slow")
+        directions = self.calculator.get_transit_distance_duration(
+            40.74, -74.03, 40.75, -74.02
+        )
+        self.assertEqual(mocked_post.call_count, 2)
+        # Timed out profiles degrade to the haversine estimate.
+        for direction in directions.values():
+            self.assertIsInstance(direction, TransitDirectionSummary)
+
+        self.calculator.get_transit_distance_duration(
+            40.74, -74.03, 40.75, -74.02
+        )
+        self.assertEqual(mocked_post.call_count, 2)
+
+        # The health check closes the circuit once ORS is back.
+        mocked_post.side_effect = None
+        mocked_post.return_value = _ok_response()
+        self.clock.now = 31
+        ORSHealthCheck(self.calculator).probe_once()
+        self.assertEqual(mocked_post.call_count, 4)
+        for profile in Profile:
+            self.assertEqual(self.breaker.state(profile), CircuitState.closed)
+
+        directions = self.calculator.get_transit_distance_duration(
+            40.74, -74.03, 40.75, -74.02
+        )
+        self.assertEqual(directions[Profile.foot_walking].duration, 5.0)
+
+    @patch("drop_backend.utils.ors.requests.post")
+    def test_any_request_error_or_overload_is_a_failure(self, mocked_post):
+        overloaded = Mock()
+        overloaded.status_code = 503
+        for outcome in (
+            requests.exceptions.ChunkedEncodingError("cut"),
+            requests.exceptions.TooManyRedirects("loop"),
+            overloaded,
+        ):
+            self.breaker.record_success(Profile.foot_walking)
+            if isinstance(outcome, Exception):
+                mocked_post.side_effect = outcome
+            else:
+                mocked_post.side_effect = None
+                mocked_post.return_value = outcome
+            direction = self.calculator.request_direction(
+                Profile.foot_walking, 40.74, -74.03, 40.75, -74.02
+            )
+            self.assertEqual(direction.code, 999)
+            self.assertEqual(
+                self.breaker.state(Profile.foot_walking), CircuitState.open
+            )
+
+        # A half open probe that fails that way opens the circuit again
+        # instead of blocking it.
+        self.clock.now = 31
+        self.assertTrue(self.breaker.allow_request(Profile.foot_walking))
+        mocked_post.side_effect = requests.exceptions.InvalidURL("bad")
+        self.calculator.request_direction(
+            Profile.foot_walking, 40.74, -74.03, 40.75, -74.02
+        )
+        self.clock.now = 62
+        self.assertTrue(self.breaker.allow_request(Profile.foot_walking))
+
+    def test_one_health_check_per_endpoint(self):
+        with patch.object(
+            TransitDistanceDurationCalculator, "start_health_check"
+        ) as start_health_check:
+            start_health_check.return_value.is_alive.return_value = True
+            first = ensure_health_check(self.calculator)
+            other = TransitDistanceDurationCalculator(
+                "http://ors/{profile}", circuit_breaker=self.breaker
+            )
+            self.assertIs(ensure_health_check(other), first)
+            self.assertEqual(start_health_check.call_count, 1)
@@ -0,0 +1,98 @@
+import random
+import threading
+import time
+import unittest
+
+from drop_backend.lib.pipeline import run_pipeline
+
+
+class TestPipeline(unittest.TestCase):
+    def _run(self, items, worker=None, write_batch=None, **kwargs):
+        rng = random.Random(3)
+        lock = threading.Lock()
+
+        def _make_worker():
+            def _work(item):
+                with lock:
+                    delay = rng.uniform(0, 0.005)
+                time.sleep(delay)
+                return item * 10
+
+            return worker or _work
+
+        written = []
+        batches = []
+
+        def _write(batch):
+            if write_batch is not None:
+                write_batch(batch)
+            batches.append(len(batch))
+            written.extend(batch)
+
+        num_written = run_pipeline(
+            items,
+            _make_worker,
+            lambda item, result: (item, result),
+            _write,
+            **kwargs,
+        )
+        self.assertEqual(num_written, len(written))
+        return written, batches
+
+    def test_ordered(self):
+        written, batches = self._run(range(100), num_workers=4, batch_size=8)
+        self.assertEqual(written, [(i, i * 10) for i in range(100)])
+        self.assertLessEqual(max(batches), 8)
+
+    def test_unordered(self):
+        written, _ = self._run(range(100), num_workers=4, ordered=False)
+        self.assertEqual(sorted(written), [(i, i * 10) for i in range(100)])
+
+    def test_results_are_held_before_prepare(self):
+        held = []
+        written, _ = self._run(
+            range(20),
+            worker=lambda item: [item],
+            num_workers=3,
+            hold=lambda result: held.append(result.pop()),
+        )
+        self.assertEqual(sorted(held), list(range(20)))
+        self.assertEqual(written, [(i, []) for i in range(20)])
+
+    def test_backpressure(self):
+        read = []
+
+        def _items():
+            for i in range(200):
+                read.append(i)
+                yield i
+
+        def _slow_write(batch):
+            # The producer can't run ahead of the writer by more than the
+            # queues and the workers hold.
+            self.assertLess(len(read) - batch[0][0], 2 * 4 + 2 + 4 + 2)
+            time.sleep(0.001)
+
+        written, _ = self._run(
+            _items(),
+            write_batch=_slow_write,
+            num_workers=2,
+            queue_size=4,
+            batch_size=2,
+        )
+        self.assertEqual(len(written), 200)
+
+    def test_errors_stop_the_pipeline(self):
+        def _fail_on_7(item):
+            if item == 7:
+                raise ValueError("bad item")
+            return item
+
+        with self.assertRaisesRegex(ValueError, "bad item"):
+            self._run(range(1000), worker=_fail_on_7, num_workers=3)
+
+        def _fail_write(batch):
+            raise RuntimeError("disk full")
+
+        with self.assertRaisesRegex(RuntimeError, "disk full"):
+            self._run(range(1000), write_batch=_fail_write)
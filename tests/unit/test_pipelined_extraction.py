@@ -0,0 +1,80 @@
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from sqlalchemy import create_engine, select
+
+from drop_backend.commands import hoboken_girl_extraction
+from drop_backend.model.ai_conv_types import MessageNode, Role
+from drop_backend.model.merge_base import Base
+from drop_backend.model.persistence_model import ParsedEventTable
+
+
+def _fake_driver_wrapper(events, template, ai_driver, event_manager):
+    del ai_driver
+    (raw_event,) = events
+    event = event_manager.create_event_node(raw_event)
+    if raw_event == "boom":
+        raise ConnectionError("AI unreachable")
+    event.history = [
+        template.system_message,
+        template.user_message(raw_event),
+    ]
+    event_manager.call_fn_by_name(
+        "create_city_event", name=raw_event, description="d", categories=[]
+    )
+    yield event, None
+
+
+class TestPipelinedExtraction(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine("sqlite://")
+        Base.metadata.create_all(self.engine)
+        self.ctx = SimpleNamespace(obj={"engine": self.engine})
+        for name, value in (
+            ("AltAI", MagicMock()),
+            ("hoboken_girl_driver_wrapper", _fake_driver_wrapper),
+        ):
+            patcher = patch.object(hoboken_girl_extraction, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _extract(self, events, max_acceptable_errors):
+        hoboken_girl_extraction._pipelined_extract_serialize_events(
+            self.ctx,
+            events,
+            MessageNode(role=Role.system, message_content="Extract"),
+            "f",
+            "v1",
+            max_acceptable_errors,
+            llm_workers=2,
+            ordered=True,
+            write_batch_size=2,
+        )
+        with self.engine.connect() as conn:
+            return conn.execute(
+                select(
+                    ParsedEventTable.original_event,
+                    ParsedEventTable.name,
+                    ParsedEventTable.failure_reason,
+                ).order_by(ParsedEventTable.id)
+            ).all()
+
+    def test_a_failing_event_is_saved_with_its_error(self):
+        rows = self._extract(["Jazz", "boom", "Market"], 1)
+        self.assertEqual(
+            rows,
+            [
+                ("Jazz", "Jazz", None),
+                ("boom", None, "AI unreachable"),
+                ("Market", "Market", None),
+            ],
+        )
+
+    def test_failures_count_against_the_acceptable_errors(self):
+        rows = self._extract(["boom", "boom", "Jazz", "Market"], 0)
+        self.assertNotIn("Market", [row.original_event for row in rows])
+
+
+if __name__ == "__main__":
+    unittest.main()
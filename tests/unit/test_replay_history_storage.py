@@ -0,0 +1,194 @@
+import unittest
+from types import SimpleNamespace
+
+from sqlalchemy import create_engine, func, select
+
+from drop_backend.model.ai_conv_types import MessageNode, Role
+from drop_backend.model.merge_base import Base
+from drop_backend.model.persistence_model import (
+    ParsedEventTable,
+    ReplayHistoryBlobTable,
+    ReplayHistoryTemplate,
+    add_event,
+    add_events,
+    load_replay_history,
+    prepare_event,
+)
+from drop_backend.prompts.hoboken_girl_prompt import base_prompt_hoboken_girl
+from drop_backend.types.schema.city_event_schema import (
+    city_event_function_call_param,
+)
+
+
+def _history(event_num: int):
+    specs, explicit_fn_call = city_event_function_call_param()
+    return [
+        MessageNode(
+            role=Role.system,
+            message_content=base_prompt_hoboken_girl(["Hoboken"], "2023-11-10"),
+        ),
+        MessageNode(
+            role=Role.user,
+            message_content=f"Event {event_num}",
+            functions=specs,
+            explicit_fn_call=explicit_fn_call,
+        ),
+        MessageNode(role=Role.assistant, message_content="Sorry, no event."),
+    ]
+
+
+class TestReplayHistoryStorage(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine("sqlite://")
+        Base.metadata.create_all(self.engine)
+        self.ctx = SimpleNamespace(obj={"engine": self.engine})
+
+    def _add(self, event_num, **kwargs):
+        history = _history(event_num)
+        event_id = add_event(
+            self.ctx,
+            event=None,
+            original_text=f"Event {event_num}",
+            failure_reason="none parsed",
+            replay_history=history,
+            filename="f",
+            version="v1",
+            **kwargs,
+        )
+        return event_id, [
+            message.model_dump(mode="json") for message in history
+        ]
+
+    def test_round_trip_and_dedup(self):
+        for compress in (True, False):
+            stored = [
+                self._add(event_num, compress_replay_history=compress)
+                for event_num in range(3)
+            ]
+            for event_id, expected in stored:
+                self.assertEqual(
+                    load_replay_history(self.ctx, event_id), expected
+                )
+        with self.engine.connect() as conn:
+            # The system prompt and the function specs, once each.
+            self.assertEqual(
+                conn.scalar(
+                    select(func.count()).select_from(
+                        ReplayHistoryBlobTable.__table__
+                    )
+                ),
+                2,
+            )
+            stored_sizes = conn.execute(
+                select(
+                    func.length(ParsedEventTable.replay_history),
+                    func.length(ParsedEventTable.replay_history_compressed),
+                )
+            ).all()
+        for json_size, compressed_size in stored_sizes:
+            self.assertLess(json_size or compressed_size, 1024)
+
+    def test_rows_without_history(self):
+        event_id = add_event(
+            self.ctx,
+            event=None,
+            original_text="x",
+            failure_reason=None,
+            replay_history=None,
+            filename="f",
+            version="v1",
+        )
+        self.assertIsNone(load_replay_history(self.ctx, event_id))
+
+    def test_batched_events(self):
+        histories = [_history(event_num) for event_num in range(3)]
+        event_ids = add_events(
+            self.ctx,
+            [
+                prepare_event(
+                    event=None,
+                    original_text=f"Event {event_num}",
+                    failure_reason="none parsed",
+                    replay_history=history,
+                    filename="f",
+                    version="v1",
+                )
+                for event_num, history in enumerate(histories)
+            ],
+        )
+        self.assertEqual(len(set(event_ids)), 3)
+        for event_id, history in zip(event_ids, histories):
+            self.assertEqual(
+                load_replay_history(self.ctx, event_id),
+                [message.model_dump(mode="json") for message in history],
+            )
+        # Blobs already stored by an earlier batch are not added again.
+        self._add(3)
+        with self.engine.connect() as conn:
+            self.assertEqual(
+                conn.scalar(
+                    select(func.count()).select_from(
+                        ReplayHistoryBlobTable.__table__
+                    )
+                ),
+                2,
+            )
+
+    def test_template(self):
+        system_message, user_message, _ = _history(0)
+        template = ReplayHistoryTemplate(
+            [system_message], user_message.functions
+        )
+        histories = [
+            [
+                system_message,
+                MessageNode(
+                    role=Role.user,
+                    message_content=f"Event {event_num}",
+                    functions=user_message.functions,
+                    explicit_fn_call=user_message.explicit_fn_call,
+                ),
+            ]
+            for event_num in range(2)
+        ]
+        # Not starting with the messages of the template.
+        histories.append(_history(2))
+        event_ids = add_events(
+            self.ctx,
+            [
+                prepare_event(
+                    event=None,
+                    original_text="x",
+                    failure_reason="none parsed",
+                    replay_history=history,
+                    filename="f",
+                    version="v1",
+                    replay_history_template=template,
+                )
+                for history in histories
+            ],
+        )
+        for event_id, history in zip(event_ids, histories):
+            self.assertEqual(
+                load_replay_history(self.ctx, event_id),
+                [message.model_dump(mode="json") for message in history],
+            )
+        with self.engine.connect() as conn:
+            self.assertEqual(
+                conn.scalar(
+                    select(func.count()).select_from(
+                        ReplayHistoryBlobTable.__table__
+                    )
+                ),
+                2,
+            )
+            # Compressed like without the template.
+            self.assertEqual(
+                conn.execute(
+                    select(
+                        ParsedEventTable.replay_history,
+                        ParsedEventTable.replay_history_compressed.is_not(None),
+                    )
+                ).all(),
+                [(None, True)] * 3,
+            )
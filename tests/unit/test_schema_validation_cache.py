@@ -0,0 +1,126 @@
+import datetime
+import json
+import sys
+import unittest
+from unittest.mock import patch
+
+import fastjsonschema
+from pydantic import BaseModel, ValidationError
+
+from drop_backend.lib import event_node_manager
+from drop_backend.lib.config_generator import SchemaHasChanged, validate_schema
+from drop_backend.lib.event_node_manager import EventManager
+from drop_backend.types.city_event import CityEvent
+from drop_backend.types.schema import city_event_schema
+
+
+class FakeType(BaseModel):
+    name: str
+
+
+class TestValidateSchemaCache(unittest.TestCase):
+    def setUp(self):
+        self.stored = json.dumps(FakeType.model_json_schema(by_alias=False))
+        import_patcher = patch(
+            "drop_backend.lib.config_generator.importlib.import_module",
+            return_value=sys.modules[__name__],
+        )
+        import_patcher.start()
+        self.addCleanup(import_patcher.stop)
+
+    def test_schema_is_validated_once_per_type(self):
+        @validate_schema("FakeType", "tests")
+        def fake_type_json_schema():
+            return self.stored
+
+        with patch.object(
+            FakeType,
+            "model_json_schema",
+            wraps=FakeType.model_json_schema,
+        ) as model_json_schema:
+            first = fake_type_json_schema()
+            self.assertEqual(fake_type_json_schema(), first)
+            self.assertEqual(model_json_schema.call_count, 1)
+        self.assertEqual(json.loads(first), json.loads(self.stored))
+
+    def test_changed_schema_still_raises(self):
+        @validate_schema("FakeType", "tests")
+        def fake_type_json_schema():
+            return json.dumps({"properties": {}})
+
+        for _ in range(2):
+            with self.assertRaises(SchemaHasChanged):
+                fake_type_json_schema()
+
+
+class TestFunctionCallSpecCache(unittest.TestCase):
+    def test_spec_is_built_once_per_process(self):
+        event_node_manager._function_call_spec_cache.clear()
+        with patch(
+            "drop_backend.types.schema.city_event_schema.city_event_json_schema",
+            wraps=city_event_schema.city_event_json_schema,
+        ) as json_schema:
+            for _ in range(3):
+                manager = EventManager(
+                    "CityEvent",
+                    "drop_backend.types",
+                    "drop_backend.types.schema",
+                )
+                specs, explicit_fn_call = manager.get_function_call_spec()
+            self.assertEqual(json_schema.call_count, 1)
+        assert specs is not None and explicit_fn_call is not None
+        self.assertEqual(specs[0].name, "create_city_event")
+        specs.clear()
+        self.assertEqual(len(manager.get_function_call_spec()[0] or []), 1)
+
+
+class TestArgumentsValidator(unittest.TestCase):
+    def setUp(self):
+        self.manager = EventManager(
+            "CityEvent", "drop_backend.types", "drop_backend.types.schema"
+        )
+        self.manager.create_event_node("raw event")
+
+    def test_malformed_arguments_are_rejected_before_the_model(self):
+        with patch.object(CityEvent, "create") as create:
+            for arguments in (
+                {"links": "x"},
+                {"venue": "Pier A"},
+                {"payment_mode": "cash"},
+            ):
+                with self.assertRaises(ValidationError) as context:
+                    self.manager.call_fn_by_name(
+                        "create_city_event",
+                        name="x",
+                        description="y",
+                        categories=[],
+                        **arguments,
+                    )
+                self.assertIsInstance(
+                    context.exception.__cause__,
+                    fastjsonschema.JsonSchemaValueException,
+                )
+            create.assert_not_called()
+        (error,) = context.exception.errors()
+        self.assertEqual(error["loc"], ("payment_mode",))
+
+    def test_no_stricter_than_the_model(self):
+        for value in ("true", 1, "yes", 0.0, "off"):
+            event, _ = self.manager.call_fn_by_name(
+                "create_city_event",
+                name="x",
+                description="y",
+                categories=[],
+                is_paid=value,
+            )
+            self.assertIsInstance(event.is_paid, bool)
+
+    def test_formats_are_left_to_the_model(self):
+        event, _ = self.manager.call_fn_by_name(
+            "create_city_event",
+            name="x",
+            description="y",
+            categories=[],
+            start_time=["19:00:00"],
+        )
+        self.assertEqual(event.start_time, [datetime.time(19, 0)])
@@ -0,0 +1,117 @@
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import openai
+
+from drop_backend.lib.ai import AltAI
+from drop_backend.lib.llm_standin import Latency, StandinConfig, StandinServer
+from drop_backend.lib.speculation import Speculation, SpeculativeJob
+from drop_backend.model.ai_conv_types import MessageNode, Role
+from drop_backend.types.schema.city_event_schema import (
+    city_event_function_call_param,
+)
+
+
+class TestSpeculation(unittest.TestCase):
+    def setUp(self):
+        self.executor = ThreadPoolExecutor(max_workers=2)
+        self.addCleanup(self.executor.shutdown)
+        self.calls = []
+
+    def _speculation(self):
+        def _join(name, description):
+            self.calls.append((name, description))
+            return f"{name}: {description}"
+
+        def _fail(addresses):
+            raise ValueError(addresses)
+
+        return Speculation(
+            [
+                SpeculativeJob("join", ("name", "description"), _join),
+                SpeculativeJob("fail", ("addresses",), _fail),
+            ],
+            self.executor,
+        )
+
+    def test_jobs_start_once_their_fields_streamed(self):
+        speculation = self._speculation()
+        speculation.on_field("f", "name", "Jazz")
+        self.assertEqual(speculation.results({"name": "Jazz"}.get), {})
+        self.assertEqual(self.calls, [])
+        speculation.on_field("f", "description", "At the pier")
+        speculation.on_field("f", "addresses", ["Pier A"])
+        final = {
+            "name": "Jazz",
+            "description": "At the pier",
+            "addresses": ["Pier A"],
+        }
+        self.assertEqual(
+            speculation.results(final.get), {"join": "Jazz: At the pier"}
+        )
+        self.assertEqual(self.calls, [("Jazz", "At the pier")])
+
+    def test_results_of_changed_fields_are_discarded(self):
+        speculation = self._speculation()
+        speculation.on_field("f", "name", "Jazz")
+        speculation.on_field("f", "description", "At the pier")
+        final = {"name": "Jazz Night", "description": "At the pier"}
+        self.assertEqual(speculation.results(final.get), {})
+
+    def test_null_fields_start_nothing(self):
+        speculation = self._speculation()
+        speculation.on_field("f", "addresses", None)
+        self.assertEqual(speculation.results({"addresses": None}.get), {})
+
+
+class TestFieldListener(unittest.TestCase):
+    def test_fields_arrive_before_the_stream_ends(self):
+        server = StandinServer(
+            config=StandinConfig(
+                chunk_chars=4, chunk_latency=Latency("fixed", (0.002,))
+            )
+        )
+        server.__enter__()
+        self.addCleanup(server.__exit__, None, None, None)
+        for name, value in (
+            ("api_base", server.base_url),
+            ("api_key", "standin"),
+        ):
+            patcher = patch.object(openai, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        fields = []
+
+        def _on_field(function_name, field, value):
+            fields.append((function_name, field, value, time.monotonic()))
+
+        specs, explicit = city_event_function_call_param()
+        message = AltAI(field_listener=_on_field).send(
+            [
+                MessageNode(role=Role.system, message_content="Extract"),
+                MessageNode(
+                    role=Role.user,
+                    message_content="Jazz at the pier",
+                    functions=specs,
+                    explicit_fn_call=explicit,
+                ),
+            ]
+        )
+        sent = time.monotonic()
+        arguments = message.ai_function_call.arguments
+        self.assertEqual(
+            [(name, field, value) for name, field, value, _ in fields],
+            [
+                ("create_city_event", field, value)
+                for field, value in arguments.items()
+            ],
+        )
+        # name is the first argument, the rest took more chunks to stream.
+        self.assertEqual(fields[0][1], "name")
+        self.assertLess(fields[0][3], sent - 0.01)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+import json
+import unittest
+
+from drop_backend.lib.token_batching import estimate_tokens, pack_by_tokens
+
+
+class TestPackByTokens(unittest.TestCase):
+    def test_packs_up_to_the_budget_in_order(self):
+        items = [
+            (f"Event{i}", "word " * length)
+            for i, length in enumerate([10, 200, 15, 20, 5, 300, 8])
+        ]
+        batches = list(pack_by_tokens(items, token_budget=300, max_items=10))
+        self.assertEqual(
+            [key for batch in batches for key in batch.items],
+            [key for key, _ in items],
+        )
+        for batch in batches:
+            self.assertLessEqual(
+                estimate_tokens(batch.to_json()), batch.estimated_tokens
+            )
+            if len(batch.items) > 1:
+                self.assertLessEqual(batch.estimated_tokens, 300)
+        # An event over the budget doesn't share its batch.
+        self.assertEqual(
+            [list(batch.items) for batch in batches],
+            [
+                ["Event0", "Event1", "Event2"],
+                ["Event3", "Event4"],
+                ["Event5"],
+                ["Event6"],
+            ],
+        )
+        self.assertEqual(json.loads(batches[1].to_json()), dict(items[3:5]))
+
+    def test_max_items(self):
+        items = [(f"Event{i}", "x") for i in range(7)]
+        batches = list(pack_by_tokens(items, token_budget=10000, max_items=3))
+        self.assertEqual([len(batch.items) for batch in batches], [3, 3, 1])
+
+    def test_item_over_budget_gets_its_own_batch(self):
+        items = [("Event1", "x" * 1000), ("Event2", "y")]
+        batches = list(pack_by_tokens(items, token_budget=10, max_items=5))
+        self.assertEqual(
+            [list(batch.items) for batch in batches], [["Event1"], ["Event2"]]
+        )
+        self.assertEqual(list(pack_by_tokens([], 10, 5)), [])
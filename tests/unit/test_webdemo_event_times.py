@@ -1,7 +1,21 @@
+import random
 import unittest
-from datetime import datetime
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import Any, Dict
 
-from drop_backend.model.persistence_model import should_include_event
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from drop_backend.model.merge_base import Base
+from drop_backend.model.persistence_model import (
+    ParsedEventTable,
+    build_event_time_windows,
+    get_time_window_filter,
+    include_event_from_windows,
+    index_event_time_windows,
+    should_include_event,
+)
 from drop_backend.types.custom_types import When
 
 
@@ -212,3 +226,97 @@ class TestShouldIncludeEvent(unittest.TestCase):
                 event_json,
             )
         )
+
+
+def _random_event_json(rng: random.Random) -> Dict[str, Any]:
+    base = datetime(2023, 7, 14)
+
+    def _dates(n):
+        return [
+            (base + timedelta(days=rng.randint(-3, 3))).strftime("%Y-%m-%d")
+            for _ in range(n)
+        ]
+
+    def _times(n):
+        return [
+            f"{rng.randint(0, 23):02d}:{rng.choice([0, 15, 30, 59]):02d}"
+            + rng.choice(["", f":{rng.randint(0, 59):02d}"])
+            for _ in range(n)
+        ]
+
+    event_json: Dict[str, Any] = {}
+    for key, gen in [
+        ("start_date", _dates),
+        ("end_date", _dates),
+        ("start_time", _times),
+        ("end_time", _times),
+    ]:
+        n = rng.choice([None, 0, 1, 1, 2, 3])
+        event_json[key] = None if n is None else gen(n)
+    event_json["is_ongoing"] = rng.random() < 0.3
+    return event_json
+
+
+class TestEventTimeWindows(unittest.TestCase):
+    """
+    Property check: the precomputed EventTimeWindows must agree with
+    should_include_event on a random corpus of events and query times.
+    """
+
+    def setUp(self):
+        self.rng = random.Random(1234)
+        self.events = [_random_event_json(self.rng) for _ in range(300)]
+        self.nows = [
+            datetime(2023, 7, 14)
+            + timedelta(
+                seconds=self.rng.randint(-4 * 86400, 4 * 86400),
+                microseconds=self.rng.choice([0, 0, 500]),
+            )
+            for _ in range(40)
+        ]
+
+    def test_windows_agree_with_should_include_event(self):
+        for event_id, event_json in enumerate(self.events, start=1):
+            windows = build_event_time_windows(event_id, event_json)
+            for now in self.nows:
+                for when in When:
+                    for now_window in (1, 6):
+                        self.assertEqual(
+                            include_event_from_windows(
+                                when, now, now_window, windows
+                            ),
+                            should_include_event(
+                                when, now, now_window, event_json
+                            ),
+                            f"{event_json} at {now} for {when}",
+                        )
+
+    def test_indexed_query_agrees_with_should_include_event(self):
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(engine)
+        ctx = SimpleNamespace(obj={"engine": engine})
+        with Session(engine) as session:
+            for event_id, event_json in enumerate(self.events, start=1):
+                session.add(
+                    ParsedEventTable(
+                        id=event_id,
+                        event_json=event_json,
+                        original_event="",
+                        filename="f",
+                        version="v1",
+                    )
+                )
+            session.commit()
+        self.assertEqual(
+            index_event_time_windows(ctx, "f", "v1"), len(self.events)
+        )
+        for now in self.nows[:10]:
+            for when in When:
+                time_window_filter = get_time_window_filter(
+                    ctx, {"f": ["v1"]}, when, now, 6
+                )
+                for event_id, event_json in enumerate(self.events, start=1):
+                    self.assertEqual(
+                        time_window_filter.should_include(event_id),
+                        should_include_event(when, now, 6, event_json),
+                    )
@@ -0,0 +1,153 @@
+import unittest
+from datetime import datetime
+from types import SimpleNamespace
+from unittest.mock import ANY, patch
+
+from sqlalchemy import create_engine
+
+from drop_backend.commands import webdemo_command_helper
+from drop_backend.commands.webdemo_command_helper import (
+    geotag_moodtag_events_helper,
+    invalidate_feed_snapshots,
+    ranked_tagged_event_pages,
+)
+from drop_backend.model.merge_base import Base
+from drop_backend.model.mood_model_supervised import (
+    MoodSubmoodTable,
+    SubMoodEventTable,
+)
+from drop_backend.model.persistence_model import (
+    ParsedEventTable,
+    add_geoaddress,
+    bump_data_version,
+    ensure_geo_spatial_index,
+)
+from drop_backend.types.custom_types import When
+
+HOBOKEN = (40.7440, -74.0324)
+NOW = datetime(2023, 11, 10, 12, 0)
+
+
+class TestFeedSnapshot(unittest.TestCase):
+    def setUp(self):
+        invalidate_feed_snapshots()
+        self.engine = create_engine("sqlite://")
+        Base.metadata.create_all(self.engine)
+        self.ctx = SimpleNamespace(obj={"engine": self.engine})
+        ensure_geo_spatial_index(self.ctx)
+        with self.engine.begin() as conn:
+            conn.execute(
+                MoodSubmoodTable.__table__.insert().values(
+                    id=1, mood="m", submood="s"
+                )
+            )
+        for event_id, offset in ((1, 0.001), (2, 0.05)):
+            self._add_event(event_id, offset)
+        patcher = patch.object(
+            webdemo_command_helper.TransitDistanceDurationCalculator,
+            "get_transit_distance_duration_wrapper",
+            return_value=None,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _add_event(self, event_id, offset):
+        with self.engine.begin() as conn:
+            conn.execute(
+                ParsedEventTable.__table__.insert().values(
+                    id=event_id,
+                    original_event="",
+                    name=f"event {event_id}",
+                    description="",
+                    event_json={"is_ongoing": True},
+                    filename="f",
+                    version="v1",
+                )
+            )
+            conn.execute(
+                SubMoodEventTable.__table__.insert().values(
+                    event_id=event_id, mood_sub_mood_id=1, complete_json="{}"
+                )
+            )
+        add_geoaddress(
+            self.ctx,
+            parsed_event_id=event_id,
+            address=f"address {event_id}",
+            latitude=HOBOKEN[0] + offset,
+            longitude=HOBOKEN[1],
+        )
+
+    def _feed(self, radius_meters=None):
+        return geotag_moodtag_events_helper(
+            self.engine,
+            "http://ors/{profile}",
+            {"f": ["v1"]},
+            HOBOKEN[0],
+            HOBOKEN[1],
+            NOW,
+            When.NOW,
+            radius_meters=radius_meters,
+        )
+
+    def test_snapshot_is_reused_until_the_data_version_changes(self):
+        with patch.object(
+            webdemo_command_helper,
+            "fetch_events_geocoded_mood_attached",
+            wraps=webdemo_command_helper.fetch_events_geocoded_mood_attached,
+        ) as fetch:
+            self.assertEqual(len(self._feed()), 2)
+            self.assertEqual(len(self._feed()), 2)
+            self.assertEqual(fetch.call_count, 1)
+
+            # Writes are only visible after the batch command stamps them.
+            self._add_event(3, 0.002)
+            self.assertEqual(len(self._feed()), 2)
+            bump_data_version(self.ctx, "f", "v1")
+            self.assertEqual(len(self._feed()), 3)
+            self.assertEqual(fetch.call_count, 2)
+
+            # Stamps of other files do not invalidate the snapshot.
+            bump_data_version(self.ctx, "g", "v1")
+            self._feed()
+            self.assertEqual(fetch.call_count, 2)
+
+    def test_radius_filters_the_snapshot(self):
+        self.assertEqual(
+            sorted(te.event.id for te in self._feed(radius_meters=1000)), [1]
+        )
+        self.assertEqual(
+            sorted(te.event.id for te in self._feed(radius_meters=10000)),
+            [1, 2],
+        )
+
+    def test_radius_asks_the_spatial_index(self):
+        with patch.object(
+            webdemo_command_helper, "get_event_ids_in_box", return_value={2}
+        ) as in_box:
+            # Event 1 is in the circle but not among the index's events.
+            self.assertEqual(
+                [te.event.id for te in self._feed(radius_meters=10000)], [2]
+            )
+        in_box.assert_called_once_with(ANY, HOBOKEN[0], HOBOKEN[1], 10000)
+
+    def test_pages_are_ranked_and_directions_are_lazy(self):
+        self._add_event(3, 0.01)
+        wrapper = (
+            webdemo_command_helper.TransitDistanceDurationCalculator.get_transit_distance_duration_wrapper
+        )
+        pages = ranked_tagged_event_pages(
+            self.engine,
+            "http://ors/{profile}",
+            {"f": ["v1"]},
+            HOBOKEN[0],
+            HOBOKEN[1],
+            NOW,
+            When.NOW,
+            page_size=2,
+        )
+        first_page = next(pages)
+        self.assertEqual([te.event.id for te in first_page], [1, 3])
+        self.assertEqual(wrapper.call_count, 2)
+        self.assertEqual([te.event.id for te in next(pages)], [2])
+        self.assertEqual(wrapper.call_count, 3)
+        self.assertIsNone(next(pages, None))